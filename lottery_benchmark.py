@@ -0,0 +1,269 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import your_lottery_system as lottery
+
+
+# 性能基准：在临时目录里用合成的奖池（10 ~ 100k 个奖品）和抽奖历史（0 ~ 1M 条）测量热点路径
+# 结果写成 JSON，可以和另一次提交的结果比较，超过阈值的变慢视为回归
+# 从不读写当前目录下的 game_state.json
+
+DEFAULT_PRIZES = [10, 1000, 100000]
+DEFAULT_HISTORY = [0, 10000, 1000000]
+QUICK_PRIZES = [10, 1000]
+QUICK_HISTORY = [0, 10000]
+BATCH_SIZE = 1000  # 批量抽奖基准每次抽奖的次数
+PRIZE_VALUES = [5, 20, 60, 150, 400, 1200, 3000, 8000]  # 合成奖品的价值（覆盖 1 / 2 / 4 / 8 个碎片）
+
+
+# 合成一份存档：prizes 个奖品（数量足够多，基准运行期间不会被抽完），history 条抽奖历史
+def synthetic_state(prizes, history, seed=0):
+    rng = random.Random(seed)
+    prize_pool = []
+    for k in range(prizes):
+        value = rng.choice(PRIZE_VALUES)
+        fragments = lottery.decide_fragments(value)
+        prize_pool.append({
+            'id': f"{chr(65 + k // 99 % 26)}{k % 99 + 1}_{k // (99 * 26)}",
+            'name': f"奖品{k}",
+            'total_value': value,
+            'fragment_value': value / fragments,
+            'total_fragments': fragments,
+            'remaining_fragments': rng.randint(1, fragments),
+            'limit_value': 1000,
+            'probability': 0,
+            'cooldown': 0,
+            'cooldown_draw': 0,
+        })
+
+    rewards = ["喝一杯水", "散步十分钟", "冥想五分钟"]
+    start = date.today() - timedelta(days=max(1, history // 8))
+    draw_history = []
+    won_value = 0
+    for k in range(history):
+        draw_date = (start + timedelta(days=k // 8)).strftime("%Y-%m-%d")
+        if prize_pool and rng.random() >= lottery.CONSOLATION_THRESHOLD:
+            prize = prize_pool[rng.randrange(len(prize_pool))]
+            won_value += prize['fragment_value']
+            draw_history.append({
+                "result": "中奖",
+                "prize": prize['name'],
+                "fragment_won": rng.randint(1, prize['total_fragments']),
+                "total_fragments": prize['total_fragments'],
+                "value": prize['fragment_value'],
+                "date": draw_date,
+            })
+        else:
+            draw_history.append({"result": "未中奖", "consolation_reward": rng.choice(rewards), "date": draw_date})
+
+    return {
+        'prize_pool': prize_pool,
+        'total_won_value': won_value,
+        'total_pool_value': 3000,
+        'draws_per_day': 8,
+        'prize_id_counter': 1,
+        'letter_counter': 0,
+        'draw_history': draw_history,
+        'consolation_rewards': rewards,
+        'journal_seq': 0,
+        'draw_counter': history,
+    }
+
+
+# 重复执行 operation，至少 min_runs 次；超过时间预算或达到 max_runs 次后停止，返回每次的耗时（秒）
+def measure(operation, min_runs=3, max_runs=200, budget_seconds=2.0):
+    samples = []
+    start = time.perf_counter()
+    while len(samples) < max_runs and (len(samples) < min_runs or time.perf_counter() - start < budget_seconds):
+        begin = time.perf_counter()
+        operation()
+        samples.append(time.perf_counter() - begin)
+    return samples
+
+
+# 最近秩法百分位数
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0
+    rank = max(1, min(len(sorted_values), int(round(q / 100 * len(sorted_values) + 0.5))))
+    return sorted_values[rank - 1]
+
+
+# 一组耗时的汇总；ops 为每次调用完成的操作数（批量抽奖为抽奖次数）
+def summarize(name, prizes, history, samples, ops=1):
+    samples = sorted(samples)
+    total = sum(samples)
+    return {
+        'bench': name,
+        'prizes': prizes,
+        'history': history,
+        'runs': len(samples),
+        'ops_per_second': len(samples) * ops / total if total else 0,
+        'mean_ms': total / len(samples) * 1000,
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p90_ms': percentile(samples, 90) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+        'max_ms': samples[-1] * 1000,
+    }
+
+
+# 一种奖池规模和历史长度下的全部基准，存档放在 data_dir
+def run_case(data_dir, prizes, history, storage, seed, budget_seconds):
+    random.seed(seed)
+    engine = lottery.LotteryEngine(data_dir, verbose=False)
+    engine.apply_game_state(synthetic_state(prizes, history, seed))
+    engine.update_probabilities()
+    if storage == 'sqlite':
+        engine.switch_storage_backend('sqlite')
+    else:
+        engine.save_game_state()
+
+    results = []
+
+    def load():
+        loaded = lottery.LotteryEngine(data_dir, verbose=False)
+        loaded.load_game_state()
+        loaded.close()
+
+    results.append(summarize('load_game_state', prizes, history, measure(load, budget_seconds=budget_seconds)))
+    results.append(summarize('save_game_state', prizes, history,
+                             measure(engine.save_game_state, budget_seconds=budget_seconds)))
+    results.append(summarize('update_probabilities', prizes, history,
+                             measure(engine.update_probabilities, budget_seconds=budget_seconds)))
+    results.append(summarize('player_draw', prizes, history,
+                             measure(engine.player_draw, min_runs=20, max_runs=2000, budget_seconds=budget_seconds)))
+    results.append(summarize('player_draw_batch', prizes, history,
+                             measure(lambda: engine.player_draw_batch(BATCH_SIZE), budget_seconds=budget_seconds),
+                             ops=BATCH_SIZE))
+    counter = iter(range(10 ** 9))
+    results.append(summarize('add_prize', prizes, history,
+                             measure(lambda: engine.add_prize(f"基准奖品{next(counter)}", 300, 1),
+                                     budget_seconds=budget_seconds)))
+    engine.close()
+    return results
+
+
+def run_benchmarks(prize_sizes, history_sizes, storage='json', seed=0, budget_seconds=2.0, progress=None):
+    results = []
+    for prizes in prize_sizes:
+        for history in history_sizes:
+            data_dir = tempfile.mkdtemp(prefix='lottery_bench_')
+            try:
+                case_start = time.perf_counter()
+                results.extend(run_case(data_dir, prizes, history, storage, seed, budget_seconds))
+                if progress is not None:
+                    progress(f"奖品 {prizes}，历史 {history}：用时 {time.perf_counter() - case_start:.1f} 秒")
+            finally:
+                shutil.rmtree(data_dir, ignore_errors=True)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# 和基准结果比较：metric 变大超过 threshold（比例）的视为回归；吞吐量指标则是变小超过 threshold
+def compare(baseline, results, metric='p50_ms', threshold=0.2):
+    base = {(row['bench'], row['prizes'], row['history']): row for row in baseline['results']}
+    higher_is_better = metric == 'ops_per_second'
+    rows = []
+    for row in results:
+        old = base.get((row['bench'], row['prizes'], row['history']))
+        if old is None or not old[metric]:
+            continue
+        change = row[metric] / old[metric] - 1
+        regression = -change > threshold if higher_is_better else change > threshold
+        rows.append(dict(bench=row['bench'], prizes=row['prizes'], history=row['history'],
+                         old=old[metric], new=row[metric], change=change, regression=regression))
+    return rows
+
+
+def format_results(results):
+    lines = [f"{'基准':<22}{'奖品':>8}{'历史':>9}{'次数':>6}{'次/秒':>12}{'P50 ms':>10}{'P90 ms':>10}{'P99 ms':>10}"]
+    for row in results:
+        lines.append(f"{row['bench']:<22}{row['prizes']:>8}{row['history']:>9}{row['runs']:>6}"
+                     f"{row['ops_per_second']:>12.1f}{row['p50_ms']:>10.3f}{row['p90_ms']:>10.3f}{row['p99_ms']:>10.3f}")
+    return "\n".join(lines)
+
+
+def format_comparison(rows, metric, threshold):
+    lines = [f"与基准比较（{metric}，阈值 {threshold:.0%}）："]
+    for row in rows:
+        mark = "回归" if row['regression'] else ""
+        lines.append(f"{row['bench']:<22}{row['prizes']:>8}{row['history']:>9}"
+                     f"{row['old']:>12.3f}{row['new']:>12.3f}{row['change']:>+9.1%}  {mark}")
+    regressions = sum(1 for row in rows if row['regression'])
+    lines.append(f"共 {len(rows)} 项，回归 {regressions} 项。")
+    return "\n".join(lines)
+
+
+def parse_sizes(text):
+    return [int(size) for size in text.split(',') if size]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="抽奖系统热点路径的性能基准（只使用临时目录）")
+    parser.add_argument('--prizes', type=parse_sizes, help="奖池规模，逗号分隔（默认 10,1000,100000）")
+    parser.add_argument('--history', type=parse_sizes, help="抽奖历史条数，逗号分隔（默认 0,10000,1000000）")
+    parser.add_argument('--quick', action='store_true', help="只跑小规模（奖品 10,1000；历史 0,10000）")
+    parser.add_argument('--storage', choices=['json', 'sqlite'], default='json', help="存储后端")
+    parser.add_argument('--pool-backend', choices=['dict', 'columnar'], default=lottery.POOL_BACKEND)
+    parser.add_argument('--sampler', choices=sorted(lottery.SAMPLER_ENGINES), default=lottery.SAMPLER_ENGINE)
+    parser.add_argument('--budget', type=float, default=2.0, help="每个基准的时间预算（秒）")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="把结果写入该 JSON 文件")
+    parser.add_argument('--compare', help="与之前保存的 JSON 结果比较")
+    parser.add_argument('--metric', default='p50_ms', choices=['mean_ms', 'p50_ms', 'p90_ms', 'p99_ms', 'ops_per_second'])
+    parser.add_argument('--threshold', type=float, default=0.2, help="回归阈值（比例），默认 0.2 即变慢 20%%")
+    args = parser.parse_args(argv)
+
+    lottery.POOL_BACKEND = args.pool_backend
+    lottery.SAMPLER_ENGINE = args.sampler
+    prize_sizes = args.prizes or (QUICK_PRIZES if args.quick else DEFAULT_PRIZES)
+    history_sizes = args.history or (QUICK_HISTORY if args.quick else DEFAULT_HISTORY)
+
+    results = run_benchmarks(prize_sizes, history_sizes, args.storage, args.seed, args.budget,
+                             progress=lambda message: print(message, file=sys.stderr))
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'storage': args.storage,
+            'pool_backend': args.pool_backend,
+            'sampler': args.sampler,
+            'budget_seconds': args.budget,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+    print(format_results(results))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)
+        rows = compare(baseline, results, args.metric, args.threshold)
+        print(format_comparison(rows, args.metric, args.threshold))
+        if any(row['regression'] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
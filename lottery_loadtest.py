@@ -0,0 +1,176 @@
+import argparse
+import asyncio
+import json
+import random
+import shutil
+import tempfile
+import time
+
+import lottery_server
+
+
+# 抽奖服务压力测试：users 个并发用户，每个用户一条 keep-alive 连接，连续发送抽奖请求
+# 报告每秒抽奖次数和延迟百分位数；不指定 --url 时在临时目录里启动一个服务
+
+
+class HttpClient:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, method, path, body=None):
+        payload = b'' if body is None else json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                          f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n"
+                          .encode('latin-1') + payload)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.strip().lower() == 'content-length':
+                length = int(value)
+        return status, json.loads(await self.reader.readexactly(length))
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+
+
+# 最近秩法百分位数
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0
+    rank = max(1, min(len(sorted_values), int(round(q / 100 * len(sorted_values) + 0.5))))
+    return sorted_values[rank - 1]
+
+
+# 给一个用户设置奖池和安慰奖
+async def set_up_user(client, user_id, prizes):
+    for prize_name, prize_value, limit_value in prizes:
+        await client.request('POST', f"/users/{user_id}/prizes",
+                             {'name': prize_name, 'value': prize_value, 'limit': limit_value})
+    await client.request('POST', f"/users/{user_id}/rewards", {'reward': "散步十分钟"})
+
+
+# 一个用户在 deadline 之前不停抽奖，记录每个请求的延迟
+async def run_user(client, user_id, batch, deadline, latencies, counters):
+    path = f"/users/{user_id}/draw" if batch == 1 else f"/users/{user_id}/draw_batch"
+    body = None if batch == 1 else {'n': batch}
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        status, result = await client.request('POST', path, body)
+        latencies.append(time.perf_counter() - start)
+        if status != 200:
+            counters['errors'] += 1
+            continue
+        counters['draws'] += len(result['results'])
+
+
+async def run_load_test(host, port, users=1000, duration=10.0, batch=1, prizes=20, seed=0):
+    rng = random.Random(seed)
+    prize_specs = [(f"奖品{k}", rng.choice([20, 80, 300, 1200, 5000]), rng.randint(5, 50)) for k in range(prizes)]
+    user_ids = [f"load-{k:05d}" for k in range(users)]
+
+    clients = [HttpClient(host, port) for _ in user_ids]
+    for client in clients:
+        await client.connect()
+    setup_start = time.perf_counter()
+    await asyncio.gather(*(set_up_user(client, user_id, prize_specs) for client, user_id in zip(clients, user_ids)))
+    setup_seconds = time.perf_counter() - setup_start
+
+    latencies = []
+    counters = {'draws': 0, 'errors': 0}
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(run_user(client, user_id, batch, deadline, latencies, counters)
+                           for client, user_id in zip(clients, user_ids)))
+    elapsed = time.perf_counter() - start
+    for client in clients:
+        await client.close()
+
+    latencies.sort()
+    return {
+        'users': users,
+        'batch': batch,
+        'setup_seconds': setup_seconds,
+        'elapsed_seconds': elapsed,
+        'requests': len(latencies),
+        'errors': counters['errors'],
+        'draws': counters['draws'],
+        'draws_per_second': counters['draws'] / elapsed if elapsed else 0,
+        'requests_per_second': len(latencies) / elapsed if elapsed else 0,
+        'latency_ms': {
+            'p50': percentile(latencies, 50) * 1000,
+            'p90': percentile(latencies, 90) * 1000,
+            'p99': percentile(latencies, 99) * 1000,
+            'max': latencies[-1] * 1000 if latencies else 0,
+        },
+    }
+
+
+# 在临时目录里启动一个服务，跑完压力测试后关闭并删除数据
+async def run_with_local_server(args):
+    data_dir = tempfile.mkdtemp(prefix='lottery_loadtest_')
+    server = lottery_server.LotteryServer(data_dir, args.capacity, args.idle_seconds)
+    ready = asyncio.get_running_loop().create_future()
+    server_task = asyncio.create_task(server.serve('127.0.0.1', 0, ready))
+    try:
+        port = await ready
+        summary = await run_load_test('127.0.0.1', port, args.users, args.duration, args.batch, args.prizes, args.seed)
+        server_task.cancel()
+        try:
+            await server_task
+        except asyncio.CancelledError:
+            pass
+        summary['server'] = server.users.stats()
+        return summary
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def format_report(summary):
+    latency = summary['latency_ms']
+    return "\n".join([
+        f"{summary['users']} 个并发用户，每个请求抽 {summary['batch']} 次，持续 {summary['elapsed_seconds']:.1f} 秒"
+        f"（准备奖池用时 {summary['setup_seconds']:.1f} 秒）",
+        f"抽奖 {summary['draws']} 次，{summary['draws_per_second']:.0f} 次/秒；"
+        f"请求 {summary['requests']} 个，{summary['requests_per_second']:.0f} 个/秒，失败 {summary['errors']} 个",
+        f"延迟: P50 {latency['p50']:.1f} ms，P90 {latency['p90']:.1f} ms，P99 {latency['p99']:.1f} ms，"
+        f"最大 {latency['max']:.1f} ms",
+    ])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="抽奖服务压力测试")
+    parser.add_argument('--url', help="已运行的服务地址，例如 127.0.0.1:8080；不指定时在临时目录启动一个服务")
+    parser.add_argument('--users', type=int, default=1000, help="并发用户数")
+    parser.add_argument('--duration', type=float, default=10.0, help="压测时长（秒）")
+    parser.add_argument('--batch', type=int, default=1, help="每个请求抽奖的次数（大于 1 时使用批量抽奖接口）")
+    parser.add_argument('--prizes', type=int, default=20, help="每个用户的奖品数")
+    parser.add_argument('--capacity', type=int, default=2000, help="本地服务内存中最多保留的用户数")
+    parser.add_argument('--idle-seconds', type=float, default=300, help="本地服务的空闲淘汰时间")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help="输出 JSON")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        host, _, port = args.url.rpartition(':')
+        summary = asyncio.run(run_load_test(host or '127.0.0.1', int(port), args.users, args.duration,
+                                            args.batch, args.prizes, args.seed))
+    else:
+        summary = asyncio.run(run_with_local_server(args))
+    print(json.dumps(summary, ensure_ascii=False, indent=2) if args.json else format_report(summary))
+
+
+if __name__ == "__main__":
+    main()
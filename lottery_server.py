@@ -0,0 +1,343 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+import traceback
+from collections import OrderedDict
+from datetime import date
+from urllib.parse import parse_qs, urlsplit
+
+import your_lottery_system as lottery
+
+
+# 多用户抽奖服务：HTTP/JSON 接口，每个用户一个 LotteryEngine，存档放在 data_dir/<用户>/ 下
+# 同一用户的请求按顺序执行（每个用户一把锁），不同用户互不阻塞
+# 内存中只保留最近使用的 capacity 个用户，空闲超过 idle_seconds 或超出容量的用户保存后移出内存
+
+USER_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+MAX_BATCH_DRAWS = 1000  # 一次批量抽奖的最大次数
+MAX_BODY_BYTES = 1 << 20  # 请求体大小上限
+
+HTTP_REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# 内存中的一个用户：引擎、锁和最近一次使用的时间
+class UserSession:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.engine = None  # 第一次使用时才从存档加载
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+
+# 用户状态的 LRU 缓存：按最近使用排序，超出容量或空闲过久时保存并移出内存
+class UserCache:
+    def __init__(self, data_dir, capacity=256, idle_seconds=300):
+        self.data_dir = data_dir
+        self.capacity = capacity
+        self.idle_seconds = idle_seconds
+        self.sessions = OrderedDict()  # 用户编号 -> UserSession，最近使用的在末尾
+        self.loads = 0
+        self.evictions = 0
+
+    # 在该用户的锁内执行 operation(engine)（在线程中运行，不阻塞事件循环）
+    async def run(self, user_id, operation):
+        while True:
+            session = self.sessions.get(user_id)
+            if session is None:
+                session = self.sessions[user_id] = UserSession(user_id)
+            self.sessions.move_to_end(user_id)
+            async with session.lock:
+                if self.sessions.get(user_id) is not session:
+                    continue  # 等锁期间该用户被移出了内存，重新取（或重新加载）
+                if session.engine is None:
+                    session.engine = await asyncio.to_thread(self.load_engine, user_id)
+                    self.loads += 1
+                try:
+                    return await asyncio.to_thread(operation, session.engine)
+                finally:
+                    session.last_used = time.monotonic()
+
+    def load_engine(self, user_id):
+        user_dir = os.path.join(self.data_dir, user_id)
+        os.makedirs(user_dir, exist_ok=True)
+        engine = lottery.LotteryEngine(user_dir, verbose=False)
+        engine.load_game_state()
+        return engine
+
+    # 保存并移出一个用户；正在处理请求的用户等请求结束后再移出
+    async def evict(self, user_id):
+        session = self.sessions.get(user_id)
+        if session is None:
+            return
+        async with session.lock:
+            if self.sessions.get(user_id) is not session:
+                return
+            # 先写回存档再移出：保存期间到达的请求会在这把锁上等待，之后重新加载已写完的存档
+            if session.engine is not None:
+                await asyncio.to_thread(close_engine, session.engine)
+                session.engine = None
+            del self.sessions[user_id]
+            self.evictions += 1
+
+    # 超出容量时从最久未使用的用户开始移出
+    async def trim(self):
+        while len(self.sessions) > self.capacity:
+            user_id = next(iter(self.sessions))
+            await self.evict(user_id)
+
+    # 移出空闲超过 idle_seconds 的用户
+    async def evict_idle(self):
+        deadline = time.monotonic() - self.idle_seconds
+        idle = [user_id for user_id, session in self.sessions.items()
+                if session.last_used < deadline and not session.lock.locked()]
+        for user_id in idle:
+            await self.evict(user_id)
+
+    # 定期检查空闲用户
+    async def idle_loop(self):
+        while True:
+            await asyncio.sleep(max(1, self.idle_seconds / 4))
+            await self.evict_idle()
+
+    # 保存并移出全部用户（服务关闭时调用）
+    async def flush_all(self):
+        for user_id in list(self.sessions):
+            await self.evict(user_id)
+
+    def stats(self):
+        return {'users_in_memory': len(self.sessions), 'capacity': self.capacity,
+                'idle_seconds': self.idle_seconds, 'loads': self.loads, 'evictions': self.evictions}
+
+
+# 写完整快照（同时清空日志）并关闭数据库连接
+def close_engine(engine):
+    engine.save_game_state()
+    engine.close()
+
+
+# 抽奖 n 次，返回 JSON 结果
+def draw_results(engine, n):
+    if not engine.prize_pool:
+        return {'results': [], 'message': "奖池中没有奖品了。", 'total_won_value': engine.total_won_value}
+    today = date.today().strftime("%Y-%m-%d")
+    results = engine.run_draws(engine.rng.draw_values(n), today)
+    return {
+        'results': [dict(record, message=message) for record, message in results],
+        'total_won_value': engine.total_won_value,
+    }
+
+
+def prize_list(engine):
+    return {'prizes': [
+        {
+            'id': prize['id'],
+            'name': prize['name'],
+            'total_value': prize['total_value'],
+            'probability': engine.get_prize_probability(prize),
+            'remaining_fragments': prize['remaining_fragments'],
+            'total_fragments': prize['total_fragments'],
+            'limit_value': prize['limit_value'],
+        }
+        for prize in engine.prize_pool
+    ], 'consolation_rewards': engine.consolation_rewards}
+
+
+def history_page(engine, page_number, page_size):
+    return {
+        'page': page_number,
+        'page_count': engine.draw_history.page_count(page_size),
+        'total': engine.draw_history.total_count(),
+        'entries': engine.draw_history.page(page_number, page_size),
+    }
+
+
+def add_prize(engine, body):
+    try:
+        prize_name = str(body['name'])
+        prize_value = int(body['value'])
+        limit_value = int(body['limit'])
+    except (KeyError, TypeError, ValueError):
+        raise HttpError(400, "需要 name、value、limit 三个字段，value 和 limit 为整数")
+    if prize_value <= 0 or limit_value <= 0:
+        raise HttpError(400, "value 和 limit 必须大于 0")
+    if engine.check_prize_name_exists(prize_name):
+        raise HttpError(409, f"奖品名称 '{prize_name}' 已经存在")
+    if not engine.add_prize(prize_name, prize_value, limit_value):
+        raise HttpError(409, "存档已被另一个进程修改，已重新加载，请重试")
+    return prize_list(engine)
+
+
+def add_reward(engine, body):
+    reward = body.get('reward') if isinstance(body, dict) else None
+    if not isinstance(reward, str) or not reward:
+        raise HttpError(400, "需要 reward 字段")
+    if not engine.add_consolation_reward(reward):
+        raise HttpError(409, f"安慰奖 '{reward}' 已经存在")
+    return {'consolation_rewards': engine.consolation_rewards}
+
+
+def int_param(params, name, default, low, high):
+    try:
+        value = int(params.get(name, [default])[0])
+    except ValueError:
+        raise HttpError(400, f"参数 {name} 必须是整数")
+    if not low <= value <= high:
+        raise HttpError(400, f"参数 {name} 必须在 {low} 到 {high} 之间")
+    return value
+
+
+class LotteryServer:
+    def __init__(self, data_dir, capacity=256, idle_seconds=300):
+        self.users = UserCache(data_dir, capacity, idle_seconds)
+        self.requests = 0
+        self.draws = 0
+        self.started = time.monotonic()
+
+    # 按路径分发请求，返回 (状态码, JSON 对象)
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        params = parse_qs(url.query)
+        parts = [part for part in url.path.split('/') if part]
+
+        if parts == ['stats']:
+            if method != 'GET':
+                raise HttpError(405, "只支持 GET")
+            return 200, dict(self.users.stats(), requests=self.requests, draws=self.draws,
+                             uptime_seconds=time.monotonic() - self.started)
+
+        if len(parts) != 3 or parts[0] != 'users':
+            raise HttpError(404, "未知的路径")
+        user_id, action = parts[1], parts[2]
+        if not USER_ID_PATTERN.match(user_id):
+            raise HttpError(400, "用户编号只能包含字母、数字、下划线和连字符（最多 64 个字符）")
+
+        if (method, action) == ('POST', 'draw'):
+            result = await self.users.run(user_id, lambda engine: draw_results(engine, 1))
+            self.draws += len(result['results'])
+        elif (method, action) == ('POST', 'draw_batch'):
+            n = body.get('n', 10) if isinstance(body, dict) else None
+            if not isinstance(n, int) or isinstance(n, bool) or not 1 <= n <= MAX_BATCH_DRAWS:
+                raise HttpError(400, f"n 必须是 1 到 {MAX_BATCH_DRAWS} 之间的整数")
+            result = await self.users.run(user_id, lambda engine: draw_results(engine, n))
+            self.draws += len(result['results'])
+        elif (method, action) == ('GET', 'prizes'):
+            result = await self.users.run(user_id, prize_list)
+        elif (method, action) == ('POST', 'prizes'):
+            result = await self.users.run(user_id, lambda engine: add_prize(engine, body or {}))
+        elif (method, action) == ('POST', 'rewards'):
+            result = await self.users.run(user_id, lambda engine: add_reward(engine, body))
+        elif (method, action) == ('GET', 'history'):
+            page_number = int_param(params, 'page', 0, 0, 10 ** 9)
+            page_size = int_param(params, 'size', lottery.HISTORY_PAGE_SIZE, 1, 1000)
+            result = await self.users.run(user_id, lambda engine: history_page(engine, page_number, page_size))
+        elif action in ('draw', 'draw_batch', 'prizes', 'rewards', 'history'):
+            raise HttpError(405, f"{action} 不支持 {method}")
+        else:
+            raise HttpError(404, "未知的路径")
+
+        await self.users.trim()
+        return 200, result
+
+    # 处理一个连接（HTTP/1.1 keep-alive，可以连续发送多个请求）
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                status, result = await self.respond(method, target, headers, reader)
+                payload = json.dumps(result, ensure_ascii=False).encode('utf-8')
+                writer.write(
+                    f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+                    f"Content-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, method, target, headers, reader):
+        self.requests += 1
+        try:
+            length = int(headers.get('content-length', 0))
+            if length > MAX_BODY_BYTES:
+                raise HttpError(413, "请求体过大")
+            body = {}  # 没有请求体时按空对象处理，各字段取默认值
+            if length:
+                try:
+                    body = json.loads(await reader.readexactly(length))
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    raise HttpError(400, "请求体不是有效的 JSON")
+            return await self.dispatch(method, target, body)
+        except HttpError as error:
+            return error.status, {'error': error.message}
+        except ValueError:
+            return 400, {'error': "无效的请求"}
+        except Exception:
+            # 未预料的错误：记录到标准错误输出，返回 500，连接继续服务后续请求
+            print(f"处理请求 {method} {target} 时出错：", file=sys.stderr)
+            traceback.print_exc()
+            return 500, {'error': "服务器内部错误"}
+
+    async def serve(self, host, port, ready=None):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        idle_task = asyncio.create_task(self.users.idle_loop())
+        if ready is not None:
+            ready.set_result(server.sockets[0].getsockname()[1])
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            idle_task.cancel()
+            await self.users.flush_all()  # 关闭时把内存中的用户全部写回存档
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="多用户抽奖服务（HTTP/JSON）")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--data-dir', default='lottery_users', help="用户存档目录，每个用户一个子目录")
+    parser.add_argument('--capacity', type=int, default=256, help="内存中最多保留的用户数")
+    parser.add_argument('--idle-seconds', type=float, default=300, help="空闲多久后把用户移出内存")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    server = LotteryServer(args.data_dir, args.capacity, args.idle_seconds)
+    print(f"抽奖服务运行在 http://{args.host}:{args.port}/ ，数据目录 {args.data_dir}")
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("抽奖服务已停止，用户状态已保存。")
+
+
+if __name__ == "__main__":
+    main()
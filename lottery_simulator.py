@@ -0,0 +1,211 @@
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import your_lottery_system as lottery
+
+
+# 蒙特卡洛月度模拟：在多个进程里用真实的抽奖逻辑（draw_once）独立模拟很多个月
+# 只读取存档，从不写入 game_state.json
+
+
+# 从存档读取模拟的初始状态（包括日志中尚未写入快照的抽奖），不修改任何文件
+def load_base_state(path):
+    engine = lottery.LotteryEngine(os.path.dirname(path) or '.', verbose=False)
+    with open(path, 'r') as file:
+        engine.apply_game_state(json.load(file))
+    if os.path.abspath(path) == os.path.abspath(engine.save_file):
+        engine.replay_journal(engine.read_journal(engine.journal_seq, repair=False))
+    return engine.get_game_state()
+
+
+# 在初始状态上应用假设的设置和奖品变化
+def apply_overrides(base_state, total_pool_value=None, draws_per_day=None, add=(), remove=()):
+    engine = lottery.LotteryEngine(verbose=False)
+    engine.apply_game_state(json.loads(json.dumps(base_state)))
+    if total_pool_value is not None:
+        engine.total_pool_value = total_pool_value
+    if draws_per_day is not None:
+        engine.draws_per_day = draws_per_day
+    for prize_id in remove:
+        prize = engine.prize_pool.get(prize_id)
+        if prize is not None:
+            engine.prize_pool.remove(prize)
+    engine.update_probabilities()
+    for prize_name, prize_value, limit_value in add:
+        engine.add_prize_probability(engine.prize_pool.add(engine.new_prize(prize_name, prize_value, limit_value)))
+    return engine.get_game_state()
+
+
+_base_state_json = None  # 工作进程中的初始状态（JSON 文本，每个月解析一次得到独立副本）
+
+
+def _init_worker(base_state_json):
+    global _base_state_json
+    _base_state_json = base_state_json
+
+
+# 模拟一个月：从初始状态出发（本月支出从 0 开始），抽 30 * draws_per_day 次
+def simulate_month(seed):
+    engine = lottery.LotteryEngine(verbose=False)
+    engine.apply_game_state(json.loads(_base_state_json))
+    engine.total_won_value = 0
+    engine.draw_history = lottery.DrawHistory()
+    engine.update_probabilities()
+
+    rng = random.Random(seed)
+    draws = 30 * engine.draws_per_day
+    first_penalty_draw = None
+    penalty_draws = 0
+    completions = {}  # 奖品编号 -> 第一次集齐全部碎片时的抽奖序号
+    for k in range(draws):
+        if not engine.prize_pool:
+            break
+        if engine.get_penalty_multiplier() < 1:
+            penalty_draws += 1
+            if first_penalty_draw is None:
+                first_penalty_draw = k + 1
+        draw_date = f"D{k // engine.draws_per_day + 1:02d}"
+        record, _ = engine.draw_once(rng.random(), rng.random(), rng.random(), draw_date)
+        if record['op'] == 'win':
+            entry = engine.draw_history[-1]
+            if entry['fragment_won'] == entry['total_fragments'] and record['id'] not in completions:
+                completions[record['id']] = k + 1
+
+    return {
+        'spend': engine.total_won_value,
+        'draws': draws,
+        'first_penalty_draw': first_penalty_draw,
+        'penalty_draws': penalty_draws,
+        'completions': completions,
+    }
+
+
+def _simulate_chunk(seeds):
+    return [simulate_month(seed) for seed in seeds]
+
+
+# 最近秩法百分位数
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0
+    rank = max(1, min(len(sorted_values), int(round(q / 100 * len(sorted_values) + 0.5))))
+    return sorted_values[rank - 1]
+
+
+# 并行模拟 months 个月，返回汇总结果
+def run_simulation(base_state, months=1000, seed=0, workers=None):
+    workers = workers or os.cpu_count() or 1
+    seeds = [seed * 1000003 + month for month in range(months)]
+    chunk_size = max(1, months // (workers * 4))
+    chunks = [seeds[i:i + chunk_size] for i in range(0, months, chunk_size)]
+    base_state_json = json.dumps(base_state)
+
+    start = time.perf_counter()
+    if workers == 1:
+        _init_worker(base_state_json)
+        results = [month for chunk in chunks for month in _simulate_chunk(chunk)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(base_state_json,)) as executor:
+            results = [month for chunk_result in executor.map(_simulate_chunk, chunks) for month in chunk_result]
+    elapsed = time.perf_counter() - start
+
+    return summarize(base_state, results, elapsed, workers)
+
+
+def summarize(base_state, results, elapsed, workers):
+    spends = sorted(result['spend'] for result in results)
+    months = len(results)
+    penalty_months = [result for result in results if result['first_penalty_draw'] is not None]
+
+    prizes = []
+    for prize in base_state['prize_pool']:
+        times = sorted(result['completions'][prize['id']] for result in results if prize['id'] in result['completions'])
+        prizes.append({
+            'id': prize['id'],
+            'name': prize['name'],
+            'completion_rate': len(times) / months if months else 0,
+            'mean_draws_to_complete': sum(times) / len(times) if times else None,
+            'p50_draws_to_complete': percentile(times, 50) if times else None,
+        })
+
+    return {
+        'months': months,
+        'workers': workers,
+        'elapsed_seconds': elapsed,
+        'months_per_second': months / elapsed if elapsed else 0,
+        'total_pool_value': base_state['total_pool_value'],
+        'draws_per_month': results[0]['draws'] if results else 0,
+        'spend': {
+            'mean': sum(spends) / months if months else 0,
+            'p5': percentile(spends, 5),
+            'p50': percentile(spends, 50),
+            'p95': percentile(spends, 95),
+            'p99': percentile(spends, 99),
+            'max': spends[-1] if spends else 0,
+        },
+        'over_budget_rate': sum(1 for spend in spends if spend > base_state['total_pool_value']) / months if months else 0,
+        'penalty_rate': len(penalty_months) / months if months else 0,
+        'mean_first_penalty_draw': (sum(result['first_penalty_draw'] for result in penalty_months) / len(penalty_months)
+                                    if penalty_months else None),
+        'mean_penalty_draw_share': (sum(result['penalty_draws'] / result['draws'] for result in results) / months
+                                    if months else 0),
+        'prizes': prizes,
+    }
+
+
+# 文本形式的模拟报告
+def format_report(summary):
+    spend = summary['spend']
+    lines = [
+        f"模拟 {summary['months']} 个月，{summary['workers']} 个进程，用时 {summary['elapsed_seconds']:.2f} 秒"
+        f"（{summary['months_per_second']:.0f} 月/秒）",
+        f"每月奖池: {summary['total_pool_value']} RMB，每月抽奖 {summary['draws_per_month']} 次",
+        f"月支出: 平均 {spend['mean']:.1f}，P5 {spend['p5']:.1f}，P50 {spend['p50']:.1f}，"
+        f"P95 {spend['p95']:.1f}，P99 {spend['p99']:.1f}，最高 {spend['max']:.1f} RMB",
+        f"超出奖池的月份: {summary['over_budget_rate']:.1%}",
+        f"触发 80% 超支惩罚的月份: {summary['penalty_rate']:.1%}，惩罚期抽奖占比 {summary['mean_penalty_draw_share']:.1%}",
+    ]
+    if summary['mean_first_penalty_draw'] is not None:
+        lines.append(f"惩罚平均从第 {summary['mean_first_penalty_draw']:.0f} 次抽奖开始")
+    lines.append("奖品集齐情况（编号: 名称 - 当月集齐比例, 平均/中位抽奖次数）：")
+    for prize in summary['prizes']:
+        if prize['mean_draws_to_complete'] is None:
+            lines.append(f"- {prize['id']}: {prize['name']} - 当月集齐 0.0%")
+        else:
+            lines.append(f"- {prize['id']}: {prize['name']} - 当月集齐 {prize['completion_rate']:.1%}, "
+                         f"{prize['mean_draws_to_complete']:.0f} / {prize['p50_draws_to_complete']} 次")
+    return "\n".join(lines)
+
+
+def parse_prize(text):
+    prize_name, prize_value, limit_value = text.split(',')
+    return prize_name, int(prize_value), int(limit_value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="蒙特卡洛模拟奖池配置下的月度支出")
+    parser.add_argument('--state', default=lottery.SAVE_FILE, help="作为初始状态的存档文件（只读）")
+    parser.add_argument('--months', type=int, default=1000, help="模拟的月数")
+    parser.add_argument('--seed', type=int, default=0, help="随机种子")
+    parser.add_argument('--workers', type=int, default=None, help="进程数，默认等于 CPU 核数")
+    parser.add_argument('--total-pool-value', type=int, help="假设的每月奖池总价值")
+    parser.add_argument('--draws-per-day', type=int, help="假设的平均每天抽奖次数")
+    parser.add_argument('--add', action='append', default=[], type=parse_prize, metavar='名称,价值,数量',
+                        help="假设新增的奖品，可重复")
+    parser.add_argument('--remove', action='append', default=[], metavar='编号', help="假设移除的奖品，可重复")
+    parser.add_argument('--json', action='store_true', help="输出 JSON")
+    args = parser.parse_args(argv)
+
+    base_state = apply_overrides(load_base_state(args.state), args.total_pool_value, args.draws_per_day,
+                                 args.add, args.remove)
+    summary = run_simulation(base_state, args.months, args.seed, args.workers)
+    print(json.dumps(summary, ensure_ascii=False, indent=2) if args.json else format_report(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import json
+import sqlite3
+
+
+# SQLite 存储后端（WAL 模式）：奖品、安慰奖、设置和抽奖历史各占一张表
+# 每次抽奖只在一个小事务里写入变化的行，不再重写整个存档
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prizes (
+    id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    total_value REAL NOT NULL,
+    fragment_value REAL NOT NULL,
+    total_fragments INTEGER NOT NULL,
+    remaining_fragments INTEGER NOT NULL,
+    limit_value INTEGER NOT NULL,
+    probability REAL NOT NULL DEFAULT 0,
+    cooldown REAL NOT NULL DEFAULT 0,
+    cooldown_draw INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS consolation_rewards (
+    position INTEGER PRIMARY KEY,
+    reward TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS draw_history (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT NOT NULL,
+    result TEXT NOT NULL,
+    prize TEXT,
+    consolation_reward TEXT,
+    value REAL NOT NULL DEFAULT 0,
+    entry TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS draw_history_date ON draw_history (date);
+CREATE INDEX IF NOT EXISTS draw_history_prize ON draw_history (prize, date);
+"""
+
+PRIZE_COLUMNS = ['id', 'position', 'name', 'total_value', 'fragment_value', 'total_fragments',
+                 'remaining_fragments', 'limit_value', 'probability', 'cooldown', 'cooldown_draw']
+
+
+class SqliteStore:
+    def __init__(self, path):
+        self.path = path
+        # 服务器通过 asyncio.to_thread 在不同线程调用引擎；访问已由引擎的内存状态锁和存档锁串行化
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    # 数据库中是否已有存档
+    def is_empty(self):
+        return self.connection.execute("SELECT COUNT(*) FROM settings").fetchone()[0] == 0
+
+    # 读取奖品、安慰奖和设置，结构与 game_state.json 相同；抽奖历史留在数据库中按需查询
+    def load(self):
+        game_state = {key: json.loads(value) for key, value in
+                      self.connection.execute("SELECT key, value FROM settings")}
+        prize_rows = self.connection.execute(
+            f"SELECT {', '.join(PRIZE_COLUMNS)} FROM prizes ORDER BY position")
+        game_state['prize_pool'] = [
+            {column: value for column, value in zip(PRIZE_COLUMNS, row) if column != 'position'}
+            for row in prize_rows
+        ]
+        for prize in game_state['prize_pool']:
+            if float(prize['total_value']).is_integer():
+                prize['total_value'] = int(prize['total_value'])
+        game_state['consolation_rewards'] = [
+            reward for (reward,) in
+            self.connection.execute("SELECT reward FROM consolation_rewards ORDER BY position")
+        ]
+        return game_state
+
+    # 写入完整状态（奖品、安慰奖、设置）；history=True 时连同抽奖历史一起重写（迁移用）
+    def save_snapshot(self, game_state, history=False):
+        with self.connection:
+            self.connection.execute("DELETE FROM prizes")
+            self.connection.executemany(
+                f"INSERT INTO prizes ({', '.join(PRIZE_COLUMNS)}) VALUES ({', '.join('?' * len(PRIZE_COLUMNS))})",
+                (self._prize_row(prize, position) for position, prize in enumerate(game_state['prize_pool'])))
+            self.connection.execute("DELETE FROM consolation_rewards")
+            self.connection.executemany(
+                "INSERT INTO consolation_rewards (position, reward) VALUES (?, ?)",
+                enumerate(game_state['consolation_rewards']))
+            self._write_settings(game_state)
+            if history:
+                self.connection.execute("DELETE FROM draw_history")
+                self._insert_history(game_state['draw_history'])
+
+    # 一个事务提交若干次抽奖：新增的历史记录、被抽中奖品的最新状态（None 表示已移除）和设置
+    def commit_draws(self, history_entries, prizes, settings):
+        with self.connection:
+            self._insert_history(history_entries)
+            for prize_id, prize in prizes.items():
+                if prize is None:
+                    self.connection.execute("DELETE FROM prizes WHERE id = ?", (prize_id,))
+                else:
+                    self.connection.execute(
+                        "UPDATE prizes SET remaining_fragments = ?, limit_value = ?, probability = ?, "
+                        "cooldown = ?, cooldown_draw = ? WHERE id = ?",
+                        (prize['remaining_fragments'], prize['limit_value'], prize['probability'],
+                         prize['cooldown'], prize['cooldown_draw'], prize_id))
+            self._write_settings(settings)
+
+    # 抽奖历史的条数
+    def history_count(self):
+        return self.connection.execute("SELECT COUNT(*) FROM draw_history").fetchone()[0]
+
+    # 按顺序读取第 [start, end) 条抽奖历史
+    def history_slice(self, start, end):
+        rows = self.connection.execute(
+            "SELECT entry FROM draw_history ORDER BY seq LIMIT ? OFFSET ?", (max(0, end - start), start))
+        return [json.loads(entry) for (entry,) in rows]
+
+    # 按日期范围查询抽奖历史（使用 date 索引）；先取出全部行，之后的写入不影响这次遍历
+    def history_between(self, start=None, end=None):
+        rows = self.connection.execute(
+            "SELECT entry FROM draw_history WHERE date >= ? AND date <= ? ORDER BY seq",
+            (start or '', end or '\uffff')).fetchall()
+        return (json.loads(entry) for (entry,) in rows)
+
+    # 按日期范围汇总中奖次数、中奖价值、安慰奖次数和每个奖品的 [中奖次数, 价值]（使用 date 索引）
+    def summary_between(self, start=None, end=None):
+        bounds = (start or '', end or '\uffff')
+        wins, value, consolations = self.connection.execute(
+            "SELECT COALESCE(SUM(result = '中奖'), 0), COALESCE(SUM(value), 0), COALESCE(SUM(result != '中奖'), 0) "
+            "FROM draw_history WHERE date >= ? AND date <= ?", bounds).fetchone()
+        prizes = {prize: [count, prize_value] for prize, count, prize_value in self.connection.execute(
+            "SELECT prize, COUNT(*), SUM(value) FROM draw_history "
+            "WHERE date >= ? AND date <= ? AND result = '中奖' GROUP BY prize", bounds)}
+        return {'wins': wins, 'value': value, 'consolations': consolations, 'prizes': prizes}
+
+    def _prize_row(self, prize, position):
+        values = dict(prize, position=position)
+        values.setdefault('cooldown_draw', 0)
+        return tuple(values[column] for column in PRIZE_COLUMNS)
+
+    def _write_settings(self, settings):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+            ((key, json.dumps(value)) for key, value in settings.items()
+             if key not in ('prize_pool', 'consolation_rewards', 'draw_history')))
+
+    def _insert_history(self, entries):
+        self.connection.executemany(
+            "INSERT INTO draw_history (date, result, prize, consolation_reward, value, entry) VALUES (?, ?, ?, ?, ?, ?)",
+            ((entry['date'], entry['result'], entry.get('prize'), entry.get('consolation_reward'),
+              entry.get('value', 0), json.dumps(entry, ensure_ascii=False)) for entry in entries))
@@ -0,0 +1,157 @@
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import your_lottery_system as lottery
+from lottery_simulator import load_base_state
+
+
+# 参数扫描：在多个进程里对安慰奖阈值、单个奖品概率上限和碎片分界点的组合计算一个月的期望支出（month_spend，不做模拟），
+# 按期望支出与每月奖池的偏差、每月支出的标准差排序
+# 每种组合都按新的一个月计算：奖品按该组合的分界点重新拆分碎片，碎片未抽，本月支出从 0 开始
+# 只读取存档，从不写入 game_state.json
+
+DEFAULT_THRESHOLDS = [0.5, 0.55, 0.6, 0.618, 0.65, 0.7, 0.75, 0.8, 0.85, 0.9]
+DEFAULT_CAPS = [0.1, 0.2, 0.3, 0.5, 1.0]
+DEFAULT_BREAKPOINTS = [
+    (lottery.FRAGMENT_BREAKPOINTS, lottery.FRAGMENT_MAX),
+    ([(50, 1), (200, 2), (1000, 4)], 8),
+    ([(200, 1), (1000, 2), (5000, 4)], 8),
+    ([(100, 1), (1000, 4)], 10),
+]
+
+
+_base_state = None  # 工作进程中的初始状态
+
+
+def _init_worker(base_state_json):
+    global _base_state
+    _base_state = json.loads(base_state_json)
+
+
+# 按分界点重新拆分碎片后的奖池（新的一个月：碎片未抽）
+def fresh_prizes(prize_pool, breakpoints, max_fragments):
+    prizes = []
+    for prize in prize_pool:
+        fragments = lottery.decide_fragments(prize['total_value'], breakpoints, max_fragments)
+        prizes.append({
+            'name': prize['name'],
+            'total_value': prize['total_value'],
+            'total_fragments': fragments,
+            'remaining_fragments': fragments,
+            'limit_value': prize['limit_value'],
+        })
+    return prizes
+
+
+# 评估一组 (概率上限, 碎片分界点) 下的所有阈值，并求出该组合下恰好花完预算的阈值
+def evaluate(task):
+    cap, (breakpoints, max_fragments), thresholds = task
+    total_pool_value = _base_state['total_pool_value']
+    draws_per_day = _base_state['draws_per_day']
+    prizes = fresh_prizes(_base_state['prize_pool'], breakpoints, max_fragments)
+    share, calibrated_spend, _ = lottery.solve_prize_share(prizes, total_pool_value, draws_per_day, cap)
+    calibrated_threshold = 1 - share if calibrated_spend >= total_pool_value * (1 - 1e-6) else None
+
+    rows = []
+    for threshold in thresholds:
+        spend, spend_std = lottery.month_spend(prizes, total_pool_value, draws_per_day, 1 - threshold, cap)
+        rows.append({
+            'threshold': threshold,
+            'cap': cap,
+            'breakpoints': format_breakpoints(breakpoints, max_fragments),
+            'spend': spend,
+            'budget_error': spend / total_pool_value - 1,
+            'spend_std': spend_std,
+            'calibrated_threshold': calibrated_threshold,  # None 表示该组合的奖品不足以花完预算
+        })
+    return rows
+
+
+# 并行评估所有组合，按预算偏差的绝对值、再按每月支出的标准差排序
+def run_sweep(base_state, thresholds, caps, breakpoint_sets, workers=None):
+    workers = workers or os.cpu_count() or 1
+    tasks = [(cap, breakpoints, thresholds) for cap, breakpoints in itertools.product(caps, breakpoint_sets)]
+    base_state_json = json.dumps({key: base_state[key] for key in ('prize_pool', 'total_pool_value', 'draws_per_day')})
+
+    start = time.perf_counter()
+    if workers == 1:
+        _init_worker(base_state_json)
+        results = [row for task in tasks for row in evaluate(task)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(base_state_json,)) as executor:
+            results = [row for rows in executor.map(evaluate, tasks) for row in rows]
+    elapsed = time.perf_counter() - start
+
+    results.sort(key=lambda row: (abs(row['budget_error']), row['spend_std']))
+    return {
+        'configurations': len(results),
+        'workers': workers,
+        'elapsed_seconds': elapsed,
+        'prizes': len(base_state['prize_pool']),
+        'total_pool_value': base_state['total_pool_value'],
+        'draws_per_month': 30 * base_state['draws_per_day'],
+        'results': results,
+    }
+
+
+def format_breakpoints(breakpoints, max_fragments):
+    return ",".join(f"{limit_value}:{fragments}" for limit_value, fragments in breakpoints) + f",{max_fragments}"
+
+
+# 解析碎片分界点，例如 "100:1,500:2,2000:4,8"：价值不超过 100 不拆分……超过所有分界点拆分为 8
+def parse_breakpoints(text):
+    *parts, max_fragments = text.split(',')
+    breakpoints = []
+    for part in parts:
+        limit_value, fragments = part.split(':')
+        limit_value = float(limit_value)
+        breakpoints.append((int(limit_value) if limit_value.is_integer() else limit_value, int(fragments)))
+    return breakpoints, int(max_fragments)
+
+
+def parse_values(text):
+    return [float(value) for value in text.split(',') if value]
+
+
+# 文本形式的扫描报告，列出排名最前的 top 个组合
+def format_report(summary, top=20):
+    lines = [
+        f"评估 {summary['configurations']} 种组合，{summary['workers']} 个进程，用时 {summary['elapsed_seconds']:.2f} 秒",
+        f"奖品 {summary['prizes']} 个，每月奖池 {summary['total_pool_value']} RMB，每月抽奖 {summary['draws_per_month']} 次",
+        "阈值 / 上限 / 碎片分界点 - 期望月支出（预算偏差）± 标准差，该上限和分界点下的校准阈值",
+    ]
+    for row in summary['results'][:top]:
+        calibrated = f"{row['calibrated_threshold']:.4f}" if row['calibrated_threshold'] is not None else "无法达到"
+        lines.append(f"{row['threshold']:.3f} / {row['cap']:.2f} / {row['breakpoints']} - {row['spend']:.1f} RMB"
+                     f"（{row['budget_error']:+.1%}）± {row['spend_std']:.1f}，校准阈值 {calibrated}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="扫描安慰奖阈值、概率上限和碎片分界点，按预算偏差和方差排序")
+    parser.add_argument('--state', default=lottery.SAVE_FILE, help="作为初始状态的存档文件（只读）")
+    parser.add_argument('--thresholds', type=parse_values, default=DEFAULT_THRESHOLDS, help="安慰奖阈值，逗号分隔")
+    parser.add_argument('--caps', type=parse_values, default=DEFAULT_CAPS, help="单个奖品的概率上限，逗号分隔")
+    parser.add_argument('--breakpoints', action='append', type=parse_breakpoints, metavar='价值:碎片,...,最大碎片数',
+                        help="碎片分界点，例如 100:1,500:2,2000:4,8；可重复，默认扫描几组预设")
+    parser.add_argument('--workers', type=int, default=None, help="进程数，默认等于 CPU 核数")
+    parser.add_argument('--top', type=int, default=20, help="文本报告中列出的组合数")
+    parser.add_argument('--json', action='store_true', help="输出 JSON")
+    args = parser.parse_args(argv)
+
+    base_state = load_base_state(args.state)
+    if not base_state['prize_pool']:
+        parser.error("存档的奖池中没有奖品")
+    if lottery.get_numpy() is None:
+        parser.error("参数扫描需要 numpy")
+    summary = run_sweep(base_state, args.thresholds, args.caps, args.breakpoints or DEFAULT_BREAKPOINTS, args.workers)
+    print(json.dumps(summary, ensure_ascii=False, indent=2) if args.json else format_report(summary, args.top))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import json
+
+import your_lottery_system as lottery
+
+
+def new_engine(data_dir):
+    engine = lottery.LotteryEngine(str(data_dir), verbose=False)
+    engine.load_game_state()
+    return engine
+
+
+def audited_engine(data_dir):
+    engine = new_engine(data_dir)
+    engine.set_audit_log(True)
+    engine.save_settings()
+    for name, value, count in [("咖啡", 30, 20), ("耳机", 600, 2)]:
+        engine.add_prize(name, value, count)
+    engine.add_consolation_reward("糖")
+    return engine
+
+
+# 审计重放：检查点之间的抽奖、中途的修改和重新加载之后的抽奖都与记录一致，最后的状态与当前状态一致
+def test_audit_replay_reproduces_recorded_draws(tmp_path):
+    engine = audited_engine(tmp_path)
+    engine.player_draw_batch(30)
+    engine.add_prize("书", 120, 3)
+    engine.update_settings(draws_per_day=4)
+    for _ in range(5):
+        engine.player_draw()
+    engine.close()
+
+    reloaded = new_engine(tmp_path)  # 另一个进程继续抽奖
+    reloaded.player_draw_batch(20)
+    report, consistent = reloaded.audit_draws()
+    assert consistent, report
+    assert "重放 55 次抽奖" in report
+    reloaded.close()
+
+
+# 审计日志里被改动过的抽奖结果会被发现
+def test_audit_replay_flags_a_tampered_result(tmp_path):
+    engine = audited_engine(tmp_path)
+    engine.player_draw_batch(30)
+    with open(engine.audit_file, encoding='utf-8') as file:
+        items = [json.loads(line) for line in file]
+    batch = next(item for item in items if item['type'] == 'draws')
+    record = batch['records'][0]
+    if record['op'] == 'win':
+        batch['records'][0] = {'op': 'consolation', 'reward': "糖", 'date': record['date']}
+    else:
+        batch['records'][0] = {'op': 'win', 'id': 'A1', 'date': record['date']}
+    with open(engine.audit_file, 'w', encoding='utf-8') as file:
+        file.writelines(json.dumps(item, ensure_ascii=False) + "\n" for item in items)
+
+    report, consistent = engine.audit_draws()
+    assert not consistent
+    assert "第 1 次抽奖" in report
+    engine.close()
+
+
+# 没有种子的旧存档：加载时生成的种子立即写入存档，之后的抽奖可以重放
+def test_generated_seed_is_persisted_before_draws(tmp_path):
+    engine = audited_engine(tmp_path)
+    engine.close()
+    with open(engine.save_file) as file:
+        state = json.load(file)
+    del state['rng_seed']
+    with open(engine.save_file, 'w') as file:
+        json.dump(state, file)
+
+    first = new_engine(tmp_path)
+    second = new_engine(tmp_path)
+    assert first.rng.seed == second.rng.seed
+    second.player_draw_batch(10)
+    report, consistent = second.audit_draws()
+    assert consistent, report
+    first.close()
+    second.close()
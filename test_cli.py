@@ -0,0 +1,107 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import your_lottery_system as lottery
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# 在新进程中运行一个子命令，返回 (退出码, 输出的 JSON)；每个命令只输出一行 JSON
+def run(data_dir, *args):
+    completed = subprocess.run([sys.executable, 'your_lottery_system.py', '--data-dir', str(data_dir), *args],
+                               cwd=MODULE_DIR, capture_output=True, text=True)
+    lines = completed.stdout.splitlines()
+    assert len(lines) == 1, completed.stdout + completed.stderr
+    return completed.returncode, json.loads(lines[0])
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    return tmp_path / 'data'  # 不存在的目录，由命令行创建
+
+
+# 命令行没有添加安慰奖的子命令；有安慰奖时每次抽奖都会留下历史记录
+def add_reward(data_dir):
+    engine = lottery.LotteryEngine(str(data_dir), verbose=False)
+    engine.load_game_state()
+    engine.add_consolation_reward("糖")
+    engine.close()
+
+
+def test_add_and_draw(data_dir):
+    assert run(data_dir, 'add', '咖啡', '30', '5') == (0, {'added': 1})
+    code, result = run(data_dir, 'add', '咖啡', '30')
+    assert code == 1 and result['added'] == 0 and '已经存在' in result['error']
+    code, result = run(data_dir, 'add', '茶', '-5')
+    assert code == 1 and result['added'] == 0 and result['error']
+
+    code, result = run(data_dir, 'draw', '-n', '3')
+    assert code == 0
+    assert result['draws'] == len(result['results']) == 3
+    assert all('message' in record for record in result['results'])
+
+
+def test_import(data_dir, tmp_path):
+    path = tmp_path / 'prizes.csv'
+    path.write_text("name,value,count\n咖啡,30,2\n耳机,abc,1\n咖啡,40,1\n书,120,1\n", encoding='utf-8')
+    code, result = run(data_dir, 'import', str(path))
+    assert code == 0
+    assert result['added'] == 2
+    assert [item['line'] for item in result['errors']] == [3]
+    assert result['duplicates'] == [{'line': 4, 'name': '咖啡'}]
+
+    code, result = run(data_dir, 'import', str(tmp_path / 'prizes.txt'))
+    assert code == 1 and 'error' in result
+    code, result = run(data_dir, 'import', str(tmp_path / 'missing.csv'))
+    assert code == 1 and 'error' in result
+
+
+def test_history_and_stats(data_dir):
+    run(data_dir, 'add', '咖啡', '30', '50')
+    add_reward(data_dir)
+    run(data_dir, 'draw', '-n', '6')
+    code, result = run(data_dir, 'history', '--limit', '4')
+    assert code == 0 and result['count'] == len(result['entries']) == 4
+    code, result = run(data_dir, 'history', '--since', '2000-01-01', '--until', '2000-12-31')
+    assert (code, result) == (0, {'count': 0, 'entries': []})
+
+    code, result = run(data_dir, '--timing', 'stats', '--expected')
+    assert code == 0
+    assert result['prizes'] == 1 and result['history_entries'] == 6
+    assert set(result['timing']) == {'ms', 'budget_ms', 'within_budget'}
+
+
+def test_export(data_dir, tmp_path):
+    run(data_dir, 'add', '咖啡', '30', '5')
+    add_reward(data_dir)
+    run(data_dir, 'draw', '-n', '5')
+    for what, name in (('prizes', 'prizes.csv'), ('history', 'history.jsonl')):
+        path = tmp_path / name
+        code, result = run(data_dir, 'export', what, str(path))
+        assert code == 0 and result['path'] == str(path)
+        assert path.exists()
+    with open(tmp_path / 'history.jsonl', encoding='utf-8') as file:
+        assert len(file.readlines()) == 5
+
+    # 只读加载后导出的概率与完整加载计算的相同
+    run(data_dir, 'export', 'prizes', str(tmp_path / 'prizes.jsonl'))
+    engine = lottery.LotteryEngine(str(data_dir), verbose=False)
+    engine.load_game_state()
+    with open(tmp_path / 'prizes.jsonl', encoding='utf-8') as file:
+        exported = {row['id']: row['probability'] for row in map(json.loads, file)}
+    assert exported == {prize['id']: prize['probability'] for prize in engine.prize_pool}
+    engine.close()
+
+    code, result = run(data_dir, 'export', 'prizes', str(tmp_path / 'prizes.txt'))
+    assert code == 1 and 'error' in result
+
+
+def test_unusable_data_dir(tmp_path):
+    blocker = tmp_path / 'file'
+    blocker.write_text("")
+    code, result = run(blocker / 'data', 'stats')
+    assert code == 1 and 'error' in result
@@ -0,0 +1,196 @@
+import json
+import os
+import threading
+
+import your_lottery_system as lottery
+
+
+def new_engine(data_dir):
+    engine = lottery.LotteryEngine(str(data_dir), verbose=False)
+    engine.load_game_state()
+    return engine
+
+
+# 同时开启后台保存和审计日志：添加奖品、抽奖与后台线程的写入交替进行，不能死锁，审计重放仍然一致
+def test_background_writer_with_audit_log(tmp_path, monkeypatch):
+    monkeypatch.setattr(lottery, 'WRITER_MAX_DELAY', 0)  # 请求后立即写入，尽量与前台操作争用锁
+    engine = new_engine(tmp_path)
+    engine.set_background_writer(True)
+    engine.set_audit_log(True)
+    engine.add_consolation_reward("糖")
+
+    def work():
+        for index in range(40):
+            engine.add_prize(f"奖品{index}", 50 + index, 2)
+            engine.player_draw()
+            engine.player_draw_batch(5)
+
+    worker = threading.Thread(target=work, daemon=True)
+    worker.start()
+    worker.join(timeout=30)
+    assert not worker.is_alive(), "添加奖品和抽奖时死锁"
+    assert engine.flush() is None
+    report, consistent = engine.audit_draws()
+    assert consistent, report
+    engine.close()
+
+
+# 开启后台保存时另一个进程写了存档：已经显示给用户的抽奖不能被丢掉
+def test_background_writer_keeps_draws_after_other_process_writes(tmp_path):
+    first = new_engine(tmp_path)
+    first.add_prize("咖啡", 30, 50)
+    first.add_consolation_reward("糖")
+    first.set_background_writer(True)
+    first.player_draw_batch(10)
+
+    second = new_engine(tmp_path)  # 另一个进程：加载时回放了日志中的抽奖
+    assert len(second.draw_history) == 10
+    second.player_draw_batch(5)
+    second.add_prize("茶", 50, 100)
+
+    first.player_draw_batch(10)  # 开始前发现版本变化，重新加载后再抽
+    assert first.flush() is None
+    assert len(first.draw_history) == 25
+
+    reloaded = new_engine(tmp_path)
+    assert len(reloaded.draw_history) == 25
+    assert reloaded.prize_pool.has_name("茶")
+    assert reloaded.rng.counter == first.rng.counter
+    first.close()
+    second.close()
+
+
+def draw_on(engine, day, n):
+    engine.run_draws(engine.rng.draw_values(n), day)
+
+
+# 导出历史时取的快照：之后的抽奖和归档不影响已经取到的记录
+def test_iter_all_is_a_snapshot(tmp_path):
+    engine = new_engine(tmp_path)
+    engine.add_prize("咖啡", 30, 100)
+    engine.add_consolation_reward("糖")
+    draw_on(engine, "2020-01-15", 20)
+    draw_on(engine, "2020-02-15", 20)
+    engine.compact_history()
+    assert engine.draw_history.archived['entries'] == 40
+    expected = engine.draw_history.all_entries()
+    entries = engine.draw_history.iter_all()
+
+    draw_on(engine, "2020-03-15", 20)
+    engine.compact_history()
+    draw_on(engine, "2020-04-15", 5)
+    assert list(entries) == expected
+    engine.close()
+
+
+# 日志末尾写了一半的记录：加载时截断，之前完整的抽奖全部回放
+def test_torn_journal_line_is_truncated_and_draws_replayed(tmp_path):
+    engine = new_engine(tmp_path)
+    engine.add_prize("咖啡", 30, 100)
+    engine.add_consolation_reward("糖")
+    engine.player_draw_batch(15)
+    journal_size = os.path.getsize(engine.journal_file)
+    assert journal_size > 0
+    with open(engine.journal_file, 'ab') as file:
+        file.write(b'{"op":"win","id":"A1","da')
+
+    reloaded = new_engine(tmp_path)
+    assert os.path.getsize(engine.journal_file) == journal_size
+    assert reloaded.get_game_state() == engine.get_game_state()
+
+    reloaded.player_draw_batch(5)  # 截断后继续追加的记录也能正常回放
+    again = new_engine(tmp_path)
+    assert len(again.draw_history) == 20
+    assert again.get_game_state() == reloaded.get_game_state()
+    engine.close()
+    reloaded.close()
+    again.close()
+
+
+def seeded_engine(data_dir, backend):
+    data_dir.mkdir()
+    engine = new_engine(data_dir)
+    if backend != engine.storage_backend:
+        engine.switch_storage_backend(backend)
+    for name, value, count in [("咖啡", 30, 20), ("耳机", 600, 2), ("书", 120, 5)]:
+        engine.add_prize(name, value, count)
+    engine.add_consolation_reward("糖")
+    engine.add_consolation_reward("散步")
+    engine.rng.reset(42)
+    engine.save_game_state()
+    return engine
+
+
+# 除日志序号和归档方式（只有 JSON 存储使用）以外的完整状态，抽奖历史包含归档部分
+def comparable_state(engine):
+    state = engine.get_game_state()
+    for key in ('journal_seq', 'draw_history', 'history_archive'):
+        del state[key]
+    state['history'] = engine.draw_history.all_entries()
+    return state
+
+
+# 同样的初始状态和随机数流，JSON 和 SQLite 存储抽奖后（包括重新加载后）的状态完全相同
+def test_json_and_sqlite_give_identical_state(tmp_path):
+    engines = [seeded_engine(tmp_path / backend, backend) for backend in ('json', 'sqlite')]
+    for engine in engines:
+        for day in ("2024-06-01", "2024-06-02", "2024-06-03"):
+            draw_on(engine, day, 12)
+            engine.player_draw()
+    json_engine, sqlite_engine = engines
+    assert comparable_state(sqlite_engine) == comparable_state(json_engine)
+
+    reloaded = [new_engine(tmp_path / backend) for backend in ('json', 'sqlite')]
+    assert reloaded[1].storage_backend == 'sqlite'
+    assert comparable_state(reloaded[1]) == comparable_state(reloaded[0]) == comparable_state(json_engine)
+    assert reloaded[1].draw_history.summary() == reloaded[0].draw_history.summary()
+    for engine in engines + reloaded:
+        engine.close()
+
+
+# 存档已被另一个进程修改时，过时的快照不会覆盖它；修改在事务中先同步再保存，两边的修改都保留
+def test_stale_snapshot_is_rejected_and_reloaded(tmp_path):
+    first = new_engine(tmp_path)
+    second = new_engine(tmp_path)
+    assert second.add_prize("耳机", 600, 1)
+
+    first.total_pool_value = 1  # 过时状态上的修改
+    assert first.write_game_state() is False
+    assert first.prize_pool.has_name("耳机")  # 已重新加载
+    assert first.total_pool_value == 3000
+    with open(first.save_file) as file:
+        assert json.load(file)['total_pool_value'] == 3000
+
+    assert first.add_prize("咖啡", 30, 1)
+    assert second.update_settings(draws_per_day=5)
+    reloaded = new_engine(tmp_path)
+    assert reloaded.prize_pool.has_name("耳机") and reloaded.prize_pool.has_name("咖啡")
+    assert reloaded.draws_per_day == 5
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]  # 原子写入没有留下临时文件
+    for engine in (first, second, reloaded):
+        engine.close()
+
+
+# 归档后（以及重新加载后）按顺序遍历得到与归档前相同的记录，汇总和分页也不变
+def test_compaction_round_trips_through_iter_all(tmp_path):
+    engine = new_engine(tmp_path)
+    engine.add_prize("咖啡", 30, 200)
+    engine.add_consolation_reward("糖")
+    for day in ("2020-01-10", "2020-01-20", "2020-02-05", "2020-03-31"):
+        draw_on(engine, day, 15)
+    engine.player_draw_batch(10)  # 今天的记录留在存档里
+    expected = engine.draw_history.all_entries()
+    summary = engine.draw_history.summary()
+    pages = [engine.draw_history.page(number, 7) for number in range(engine.draw_history.page_count(7))]
+
+    assert "已归档 60 条" in engine.compact_history()
+    assert len(engine.draw_history) == 10
+    reloaded = new_engine(tmp_path)
+    for history in (engine.draw_history, reloaded.draw_history):
+        assert list(history.iter_all()) == expected
+        assert history.total_count() == len(expected)
+        assert history.summary() == summary
+        assert [history.page(number, 7) for number in range(history.page_count(7))] == pages
+        assert list(history.iter_between("2020-01-15", "2020-02-28")) == expected[15:45]
+    engine.close()
+    reloaded.close()
@@ -0,0 +1,37 @@
+import random
+
+import pytest
+
+import your_lottery_system as lottery
+
+
+# 每个采样引擎的抽样分布都要通过卡方检验（check_sampler_distribution 同时检查树状数组与线性扫描逐次一致）
+@pytest.mark.parametrize('weights', [
+    None,  # 默认的 50 个随机权重
+    [0.5, 0.0, 0.25, 0.0, 0.25],  # 权重为 0 的奖品不能被抽中
+    [1e-3] * 30 + [10.0],  # 一个权重远大于其他
+])
+def test_check_sampler_distribution_passes(weights):
+    results = lottery.check_sampler_distribution(weights, draws=50000, seed=1)
+    assert set(results) == set(lottery.SAMPLER_ENGINES)
+    for engine, result in results.items():
+        assert result['passed'], (engine, result)
+
+
+def test_fenwick_matches_linear_for_same_random_value():
+    rng = random.Random(7)
+    weights = [rng.uniform(0, 1) if rng.random() > 0.2 else 0.0 for _ in range(200)]
+    fenwick = lottery.FenwickSampler(weights)
+    linear = lottery.LinearSampler(weights)
+    values = [0.0, 0.5, 1 - 2 ** -53] + [rng.random() for _ in range(5000)]
+    for rand_value in values:
+        assert fenwick.sample(rand_value) == linear.sample(rand_value), rand_value
+
+    # 修改权重（包括清零）之后仍然一致
+    for _ in range(500):
+        index = rng.randrange(len(weights))
+        weight = rng.choice([0.0, rng.uniform(0, 2)])
+        fenwick.update(index, weight)
+        linear.update(index, weight)
+    for rand_value in values:
+        assert fenwick.sample(rand_value) == linear.sample(rand_value), rand_value
@@ -0,0 +1,26 @@
+import json
+import os
+import subprocess
+import sys
+
+import your_lottery_system as lottery
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_startup_within_budget():
+    result = lottery.measure_startup_time(runs=5)
+    assert not result['matplotlib_loaded'], result
+    assert result['within_budget'], result
+
+
+# 在新进程中加载存档、添加奖品并抽奖：只有画图时才加载 matplotlib
+def test_draw_does_not_load_matplotlib(tmp_path):
+    code = ("import json, sys; import your_lottery_system as lottery; "
+            f"engine = lottery.LotteryEngine({str(tmp_path)!r}, verbose=False); engine.load_game_state(); "
+            "engine.add_prize('咖啡', 30, 5); engine.add_consolation_reward('糖'); "
+            "engine.player_draw(); engine.player_draw_batch(20); engine.flush(); "
+            "print(json.dumps({'matplotlib': 'matplotlib' in sys.modules}))")
+    output = subprocess.run([sys.executable, '-c', code], cwd=MODULE_DIR, capture_output=True,
+                            text=True, check=True).stdout
+    assert json.loads(output.splitlines()[-1]) == {'matplotlib': False}
@@ -1,387 +1,2934 @@
+import time
+
+STARTED_AT = time.perf_counter()  # 开始导入本模块的时刻，命令行子命令的耗时从这里算起（不含解释器本身的启动）
+
+import argparse
 import random
 import json
 import os
 import math
-import matplotlib.pyplot as plt
-from matplotlib import font_manager as fm
-from datetime import date  # 用于获取当前日期
+import sys
+import functools
+import hashlib
+import heapq
+import gzip
+import itertools
+import array
+import bisect
+import collections
+import csv
+import contextlib
+import copy
+import signal
+import threading
+from datetime import date, datetime, timedelta  # 用于获取当前日期
+
+try:
+    import fcntl  # 跨进程的存档锁（Windows 上没有 fcntl，此时不加锁）
+except ImportError:
+    fcntl = None
 
 
 SAVE_FILE = 'game_state.json'
-
-# 初始化变量
-prize_pool = []  # 奖池中的奖品列表
-total_won_value = 0  # 已抽取奖品的总价值
-total_pool_value = 3000  # 总奖池价值
-draws_per_day = 8  # 平均每天抽奖次数
-prize_id_counter = 1  # 奖品编号计数器
-letter_counter = 0  # 字母计数器
-draw_history = []  # 抽奖历史记录
-consolation_rewards = []  # 安慰奖列表
+JOURNAL_FILE = 'game_state.journal'  # 抽奖日志文件，每次抽奖追加一行
+USE_JOURNAL = True  # 日志模式：抽奖只追加日志，定期或退出时才写完整快照
+SNAPSHOT_INTERVAL = 200  # 每追加多少条日志写一次完整快照
+DB_FILE = 'game_state.db'  # SQLite 存储后端的数据库文件
+SETTINGS_FILE = 'lottery_settings.json'  # 本机设置（存储后端等），与游戏状态分开保存
+LOCK_FILE = 'game_state.lock'  # 存档锁文件，同时记录存档的版本号
+LOCK_WAIT_WARNING_MS = 100  # 等待存档锁超过该时间时提示（说明另一个进程正在写入）
+BACKGROUND_WRITER = False  # 后台保存（可在系统设置中开启）：抽奖仍立即追加日志，完整快照由后台线程合并后写入 JSON 存档
+WRITER_MAX_DELAY = 0.5  # 后台保存时，快照请求最多延迟多少秒写入磁盘
+AUDIT_FILE = 'game_state.audit.jsonl'  # 抽奖审计日志：检查点和每批抽奖的记录，用于重放核对
+AUDIT_LOG = False  # 是否写审计日志（可在系统设置中开启）
+METRICS_FILE = 'lottery_metrics.prom'  # 运行指标导出文件（Prometheus 文本格式）
+LATENCY_BUCKETS = [0.00001, 0.00003, 0.0001, 0.0003, 0.001, 0.003, 0.01, 0.03, 0.1, 0.3, 1, 3, 10]  # 耗时直方图的分桶（秒）
+BYTES_BUCKETS = [1 << 10, 1 << 12, 1 << 14, 1 << 16, 1 << 18, 1 << 20, 1 << 22, 1 << 24, 1 << 26, 1 << 28]  # 写入字节数的分桶
+STORAGE_BACKEND = 'json'  # 存储后端：'json'（快照 + 抽奖日志）或 'sqlite'（每次抽奖一个小事务）
+CONSOLATION_THRESHOLD = 0.618  # 随机值低于该阈值时直接发放安慰奖（新存档的默认值，可在系统设置中按预算校准）
+POOL_BACKEND = 'dict'  # 奖池存储：'dict'（每个奖品一个字典）或 'columnar'（numpy 列式数组，需要 numpy）
+SAMPLER_ENGINE = 'fenwick'  # 抽奖采样引擎：'linear'（逐个累加扫描）、'alias'（别名表）、'fenwick'（树状数组）
+MAX_PRIZE_PROBABILITY = 0.3  # 每个奖品的最大抽中概率上限
+FRAGMENT_BREAKPOINTS = [(100, 1), (500, 2), (2000, 4)]  # 奖品价值不超过分界点时拆分的碎片数（依次判断）
+FRAGMENT_MAX = 8  # 价值超过所有分界点时拆分的碎片数
+PROBABILITY_CACHE_SIZE = 4096  # 概率公式缓存的最大条目数（最久未用的先淘汰）
+MONTH_MODEL_CELLS = 1 << 18  # 预算校准计算一个月的期望支出时，奖品状态分布最多使用的格子数（奖品数 × 状态数）
+COOLDOWN_START = 0.2  # 抽中后的冷却值（概率乘以 1 - 冷却值）
+COOLDOWN_DECAY_PER_DRAW = 0.01  # 每抽一次奖冷却值的衰减量
+HIGH_SPEND_RATIO = 0.8  # 支出超过总奖池的该比例后，对高价值奖品降低概率
+HIGH_VALUE_FACTOR = 5  # 价值超过单次期望价值的该倍数即为高价值奖品
+HIGH_VALUE_PENALTY = 0.5  # 高价值奖品超支时的概率倍率
+HISTORY_PAGE_SIZE = 20  # 查看抽奖历史时每页显示的条数
+ARCHIVE_DIR = 'history_archive'  # 抽奖历史归档目录，每月一个 gzip 压缩的 JSONL 文件
+HISTORY_HOT_DAYS = 90  # 存档中保留最近多少天的抽奖历史，更早的整月历史归档（可在系统设置中修改）
+ARCHIVE_CACHE_SEGMENTS = 4  # 查看旧历史时内存中最多缓存几个月的归档
+STARTUP_BUDGET_MS = 150  # 启动（导入本模块）的时间预算，不抽图时不应加载 matplotlib
+CLI_BUDGET_MS = {'draw': 250, 'add': 250, 'import': 1000, 'history': 250, 'stats': 250, 'export': 500}  # 命令行子命令（导入 + 加载存档 + 执行）的耗时目标
+CHART_DIR = 'charts'  # 概率分布图的缓存目录
+CHART_TOP_K = 30  # 概率分布图中单独显示的奖品数（概率最高的），其余合并为"其他"
+CHART_CACHE_FILES = 20  # 缓存目录中最多保留的图片数（最久未用的先删除）
+
+# 支持中文的字体：先按路径查找，再按字体名称查找
+CJK_FONT_PATHS = [
+    '/System/Library/Fonts/PingFang.ttc',  # macOS
+    '/System/Library/Fonts/STHeiti Medium.ttc',
+    '/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc',  # Debian / Ubuntu
+    '/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc',  # Fedora / Arch
+    '/usr/share/fonts/truetype/wqy/wqy-microhei.ttc',
+    'C:/Windows/Fonts/msyh.ttc',  # Windows
+    'C:/Windows/Fonts/simhei.ttf',
+]
+CJK_FONT_FAMILIES = ['PingFang SC', 'Noto Sans CJK SC', 'Source Han Sans SC', 'WenQuanYi Micro Hei',
+                     'Microsoft YaHei', 'SimHei']
+
+# 存档的跨进程写锁（fcntl 建议锁），锁文件里保存存档的版本号，每次写入存档前加一
+# 同一线程内可重入（fcntl 锁不区分同一进程的线程，另用一把线程锁）；记录每次的等待时间和持有时间
+class StateLock:
+    def __init__(self, path):
+        self.path = path
+        self.file = None  # 第一次加锁时打开，close 时关闭
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.acquired_at = 0
+        self.stats = {'count': 0, 'wait_total': 0.0, 'wait_max': 0.0, 'hold_total': 0.0, 'hold_max': 0.0}
+
+    def __enter__(self):
+        start = time.perf_counter()
+        self.thread_lock.acquire()
+        if self.depth == 0:
+            if self.file is None:
+                self.file = os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT), 'r+')
+            if fcntl is not None:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+            self.acquired_at = time.perf_counter()
+            wait = self.acquired_at - start
+            self.stats['count'] += 1
+            self.stats['wait_total'] += wait
+            self.stats['wait_max'] = max(self.stats['wait_max'], wait)
+            if wait * 1000 > LOCK_WAIT_WARNING_MS:
+                print(f"等待存档锁 {wait * 1000:.0f} ms（另一个进程正在写入存档）。")
+        self.depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.depth -= 1
+        if self.depth == 0:
+            hold = time.perf_counter() - self.acquired_at
+            self.stats['hold_total'] += hold
+            self.stats['hold_max'] = max(self.stats['hold_max'], hold)
+            if fcntl is not None:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        self.thread_lock.release()
+
+    # 读取锁文件中的存档版本号（需持有锁）
+    def read_version(self):
+        self.file.seek(0)
+        text = self.file.read().strip()
+        return int(text) if text else 0
+
+    # 写入新的存档版本号（需持有锁）
+    def write_version(self, version):
+        self.file.seek(0)
+        self.file.truncate()
+        self.file.write(str(version))
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+# 运行指标的说明和类型，导出 Prometheus 文本时使用
+METRICS_HELP = {
+    'lottery_draws_total': ('counter', "抽奖次数；outcome: consolation 直接发放安慰奖，win 抽中奖品碎片，"
+                                       "fallback 进入奖品抽奖但没有抽中任何奖品而转为安慰奖"),
+    'lottery_draw_seconds': ('histogram', "单次抽奖（内存中的状态变化，不含落盘）的耗时"),
+    'lottery_fallback_total': ('counter', "进入奖品抽奖却没有抽中奖品的次数；reason: no_prize 没有可抽的奖品概率，"
+                                          "no_fragments 抽中的奖品没有剩余碎片"),
+    'lottery_probability_update_seconds': ('histogram', "全量重新计算概率（update_probabilities）的耗时"),
+    'lottery_probability_refreshes_total': ('counter', "只重新计算单个奖品概率的次数"),
+    'lottery_probability_cache_hits_total': ('counter', "概率公式缓存命中次数（本进程，所有引擎共用）"),
+    'lottery_probability_cache_misses_total': ('counter', "概率公式缓存未命中次数（本进程，所有引擎共用）"),
+    'lottery_probability_cache_entries': ('gauge', "概率公式缓存当前的条目数"),
+    'lottery_save_seconds': ('histogram', "写入完整存档的耗时"),
+    'lottery_save_bytes': ('histogram', "每次写入完整 JSON 存档的字节数"),
+    'lottery_journal_appends_total': ('counter', "追加抽奖日志的次数（批量抽奖只算一次）"),
+    'lottery_bytes_written_total': ('counter', "写入存档的总字节数；kind: snapshot 完整快照，journal 抽奖日志"),
+    'lottery_load_seconds': ('histogram', "加载存档（含日志回放和概率计算）的耗时"),
+    'lottery_charts_total': ('counter', "生成概率分布图的次数；cached: true 使用缓存的图片，false 重新绘制"),
+    'lottery_prizes': ('gauge', "奖池中的奖品数"),
+    'lottery_history_entries': ('gauge', "抽奖历史条数（包含归档）"),
+    'lottery_history_archived_entries': ('gauge', "已移入归档的抽奖历史条数"),
+    'lottery_won_value': ('gauge', "已抽取奖品的总价值（RMB）"),
+    'lottery_pool_value': ('gauge', "每月奖池总价值（RMB）"),
+}
+
+
+# 直方图：按固定分桶计数，同时记录总和与次数
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个桶是 +Inf
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    # 估计分位数：返回包含该分位数的桶的上界（落在 +Inf 桶时返回最后一个有限上界）
+    def quantile(self, q):
+        target = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target and count:
+                return self.buckets[min(index, len(self.buckets) - 1)]
+        return 0
+
+
+# 运行指标：计数器和耗时直方图，按名称和标签区分，只保存在内存中
+class Metrics:
+    def __init__(self):
+        self.counters = {}  # (名称, 标签) -> 数值
+        self.histograms = {}  # (名称, 标签) -> Histogram
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    # 记录 with 块的耗时
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def counter_value(self, name, **labels):
+        return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    # 导出为 Prometheus 文本格式；gauges 为导出时刻的瞬时值 {名称: 数值}
+    def to_prometheus(self, gauges=None):
+        series = {}
+        for (name, labels), value in sorted(self.counters.items()):
+            series.setdefault(name, []).append(f"{name}{format_labels(labels)} {value}")
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            lines = series.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ['+Inf'], histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+        for name, value in (gauges or {}).items():
+            series.setdefault(name, []).append(f"{name} {value}")
+
+        output = []
+        for name in sorted(series):
+            metric_type, help_text = METRICS_HELP.get(name, ('untyped', name))
+            output.append(f"# HELP {name} {help_text}")
+            output.append(f"# TYPE {name} {metric_type}")
+            output.extend(series[name])
+        return "\n".join(output) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+# 原子写入 JSON 文件
+def write_json_atomic(path, data):
+    write_file_atomic(path, json.dumps(data))
+
+
+# 原子写入文件
+def write_file_atomic(path, text):
+    with open_atomic(path) as file:
+        file.write(text)
+
+
+# 原子写入文件：with 块内写同目录下的临时文件，结束时 fsync 并用 rename 替换原文件（可以逐行流式写入）
+# 写到一半崩溃时原文件保持完整，只会留下一个临时文件；with 块内出错时删除临时文件
+@contextlib.contextmanager
+def open_atomic(path):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'w', encoding='utf-8', newline='') as file:
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    fsync_directory(os.path.dirname(os.path.abspath(path)))
+
+
+# 把目录项（rename 的结果）刷到磁盘；不支持打开目录的系统上跳过
+def fsync_directory(directory):
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# 奖池容器：按编号和名称建立索引，删除时留下占位（墓碑）以保持其余奖品的槽位不变
+# 槽位即采样器下标；占位过多时压缩，序列化结果与原来的奖品列表相同
+class PrizePool:
+    def __init__(self, prizes=()):
+        self._slots = []  # 奖品字典，已删除的位置为 None
+        self._by_id = {}
+        self._by_name = {}
+        self._slot_of = {}  # 编号 -> 槽位
+        for prize in prizes:
+            self.add(prize)
+
+    # 添加奖品，返回它的槽位
+    def add(self, prize):
+        slot = len(self._slots)
+        self._slots.append(prize)
+        self._by_id[prize['id']] = prize
+        self._by_name[prize['name']] = prize
+        self._slot_of[prize['id']] = slot
+        return slot
+
+    # 删除奖品，O(1)：原槽位留下占位
+    def remove(self, prize):
+        slot = self._slot_of.pop(prize['id'])
+        self._slots[slot] = None
+        del self._by_id[prize['id']]
+        if self._by_name.get(prize['name']) is prize:
+            del self._by_name[prize['name']]
+        return slot
+
+    def get(self, prize_id):
+        return self._by_id.get(prize_id)
+
+    def get_by_name(self, prize_name):
+        return self._by_name.get(prize_name)
+
+    def has_name(self, prize_name):
+        return prize_name in self._by_name
+
+    # 修改奖品名称并同步名称索引
+    def rename(self, prize, new_name):
+        if self._by_name.get(prize['name']) is prize:
+            del self._by_name[prize['name']]
+        prize['name'] = new_name
+        self._by_name[new_name] = prize
+
+    def slot_of(self, prize):
+        return self._slot_of[prize['id']]
+
+    # 按槽位取奖品，已删除的位置返回 None
+    def at(self, slot):
+        return self._slots[slot]
+
+    def slot_count(self):
+        return len(self._slots)
+
+    # 占位超过一半时值得压缩
+    def needs_compaction(self):
+        tombstones = len(self._slots) - len(self._by_id)
+        return tombstones > 16 and tombstones * 2 > len(self._slots)
+
+    # 去掉占位，重新分配槽位（之后需要全量重建采样器）
+    def compact(self):
+        self._slots = [prize for prize in self._slots if prize is not None]
+        self._slot_of = {prize['id']: slot for slot, prize in enumerate(self._slots)}
+
+    def to_list(self):
+        return [prize for prize in self._slots if prize is not None]
+
+    def __iter__(self):
+        return (prize for prize in self._slots if prize is not None)
+
+    def __len__(self):
+        return len(self._by_id)
+
+
+# 列式奖池中各字段对应的 numpy 类型（id 和 name 另外存放在列表中）
+PRIZE_COLUMNS = {
+    'total_value': 'float64',
+    'fragment_value': 'float64',
+    'total_fragments': 'int64',
+    'remaining_fragments': 'int64',
+    'limit_value': 'int64',
+    'probability': 'float64',
+    'cooldown': 'float64',
+    'cooldown_draw': 'int64',
+}
+PRIZE_FIELDS = ['id', 'name'] + list(PRIZE_COLUMNS)
+
+
+# 列式奖池中单个奖品的视图，用法与奖品字典相同，读写直接落到对应的列上
+class PrizeView:
+    __slots__ = ('pool', 'slot')
+
+    def __init__(self, pool, slot):
+        self.pool = pool
+        self.slot = slot
+
+    def __getitem__(self, key):
+        return self.pool.get_field(self.slot, key)
+
+    def __setitem__(self, key, value):
+        self.pool.set_field(self.slot, key, value)
+
+    def __contains__(self, key):
+        return key in PRIZE_FIELDS
+
+    def get(self, key, default=None):
+        return self[key] if key in PRIZE_FIELDS else default
+
+    def keys(self):
+        return list(PRIZE_FIELDS)
+
+    def update(self, values):
+        for key, value in values.items():
+            self[key] = value
+
+    def to_dict(self):
+        return {key: self[key] for key in PRIZE_FIELDS}
+
+    def __eq__(self, other):
+        return isinstance(other, PrizeView) and other.pool is self.pool and other.slot == self.slot
+
+    def __hash__(self):
+        return hash((id(self.pool), self.slot))
+
+
+# 列式奖池（structure of arrays）：数值字段各占一个 numpy 数组，名称和编号单独成表
+# 与 PrizePool 接口相同；全量概率计算、上限和超支分组都是整列运算
+class ColumnarPrizePool:
+    def __init__(self, prizes=()):
+        self.np = get_numpy()
+        prizes = list(prizes)
+        self._size = len(prizes)  # 已使用的槽位数（含占位）
+        self._columns = {
+            field: self.np.array([prize.get(field, 0) for prize in prizes], dtype=dtype)
+            for field, dtype in PRIZE_COLUMNS.items()
+        }
+        self._alive = self.np.ones(self._size, dtype=bool)
+        self._ids = [prize['id'] for prize in prizes]
+        self._names = [prize['name'] for prize in prizes]
+        self._slot_of = {prize_id: slot for slot, prize_id in enumerate(self._ids)}
+        self._slot_of_name = {name: slot for slot, name in enumerate(self._names)}
+
+    def get_field(self, slot, key):
+        if key == 'id':
+            return self._ids[slot]
+        if key == 'name':
+            return self._names[slot]
+        value = self._columns[key][slot].item()
+        if key == 'total_value' and value.is_integer():
+            return int(value)
+        return value
+
+    def set_field(self, slot, key, value):
+        if key == 'name':
+            self.rename(PrizeView(self, slot), value)
+        elif key == 'id':
+            raise KeyError("奖品编号不能修改")
+        else:
+            self._columns[key][slot] = value
+
+    # 容量不足时按倍数扩容
+    def _reserve(self, size):
+        capacity = len(self._alive)
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2, 16)
+        for field, column in self._columns.items():
+            grown = self.np.zeros(capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._columns[field] = grown
+        alive = self.np.zeros(capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        self._alive = alive
+
+    def add(self, prize):
+        slot = self._size
+        self._reserve(slot + 1)
+        for field in PRIZE_COLUMNS:
+            self._columns[field][slot] = prize.get(field, 0)
+        self._alive[slot] = True
+        self._ids.append(prize['id'])
+        self._names.append(prize['name'])
+        self._slot_of[prize['id']] = slot
+        self._slot_of_name[prize['name']] = slot
+        self._size += 1
+        return slot
+
+    def remove(self, prize):
+        slot = self._slot_of.pop(prize['id'])
+        self._alive[slot] = False
+        if self._slot_of_name.get(self._names[slot]) == slot:
+            del self._slot_of_name[self._names[slot]]
+        return slot
+
+    def get(self, prize_id):
+        slot = self._slot_of.get(prize_id)
+        return None if slot is None else PrizeView(self, slot)
+
+    def get_by_name(self, prize_name):
+        slot = self._slot_of_name.get(prize_name)
+        return None if slot is None else PrizeView(self, slot)
+
+    def has_name(self, prize_name):
+        return prize_name in self._slot_of_name
+
+    def rename(self, prize, new_name):
+        slot = prize.slot
+        if self._slot_of_name.get(self._names[slot]) == slot:
+            del self._slot_of_name[self._names[slot]]
+        self._names[slot] = new_name
+        self._slot_of_name[new_name] = slot
+
+    def slot_of(self, prize):
+        return prize.slot
+
+    def at(self, slot):
+        return PrizeView(self, slot) if self._alive[slot] else None
+
+    def slot_count(self):
+        return self._size
+
+    def needs_compaction(self):
+        tombstones = self._size - len(self._slot_of)
+        return tombstones > 16 and tombstones * 2 > self._size
+
+    def compact(self):
+        if len(self._slot_of) == self._size:
+            return
+        keep = self.np.flatnonzero(self._alive[:self._size])
+        for field, column in self._columns.items():
+            self._columns[field] = column[keep]
+        self._size = len(keep)
+        self._alive = self.np.ones(self._size, dtype=bool)
+        self._ids = [self._ids[slot] for slot in keep.tolist()]
+        self._names = [self._names[slot] for slot in keep.tolist()]
+        self._slot_of = {prize_id: slot for slot, prize_id in enumerate(self._ids)}
+        self._slot_of_name = {name: slot for slot, name in enumerate(self._names)}
+
+    def to_list(self):
+        return [prize.to_dict() for prize in self]
+
+    def __iter__(self):
+        return (PrizeView(self, slot) for slot in self.np.flatnonzero(self._alive[:self._size]).tolist())
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def column(self, field):
+        return self._columns[field][:self._size]
+
+    # 整列计算概率（与 compute_prize_probability 相同的公式），返回 (概率, 当前冷却值)
+    def compute_probabilities(self, expected_value, current_draw):
+        np = self.np
+        total_value = self.column('total_value')
+        remaining_value = total_value * (self.column('remaining_fragments') / self.column('total_fragments'))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            base_probability = np.log(expected_value / remaining_value + 1)
+        cooldown = self.column('cooldown')
+        elapsed = current_draw - self.column('cooldown_draw')
+        current_cooldown = np.where(cooldown > 0, np.maximum(0, cooldown - COOLDOWN_DECAY_PER_DRAW * elapsed), 0)
+        probabilities = np.minimum(base_probability * (1 - current_cooldown), MAX_PRIZE_PROBABILITY)
+        probabilities[~self._alive[:self._size]] = 0
+        return probabilities, current_cooldown
+
+    def high_value_mask(self, threshold):
+        return self.column('total_value') > threshold
+
+    # 写回全量计算的结果：概率列，以及冷却结束的奖品清零
+    def store_probabilities(self, probabilities, current_cooldown):
+        self._columns['probability'][:self._size] = probabilities
+        self.column('cooldown')[current_cooldown <= 0] = 0
+
+    # 数值列占用的内存（字节）
+    def nbytes(self):
+        return sum(column.nbytes for column in self._columns.values()) + self._alive.nbytes
+
+
+# 按设置创建奖池；选择列式存储但没有安装 numpy 时退回字典存储
+def create_prize_pool(prizes=()):
+    if POOL_BACKEND == 'columnar' and get_numpy() is not None:
+        return ColumnarPrizePool(prizes)
+    return PrizePool(prizes)
+
+
+# 抽奖历史归档：每月一个 gzip 压缩的 JSONL 文件，只追加（每次归档追加一个 gzip 成员）
+# 文件中有效的长度以存档里记录的 bytes 为准：归档写入后、快照保存前崩溃留下的多余内容在下次归档时截掉，读取时忽略
+class HistoryArchive:
+    def __init__(self, directory):
+        self.directory = directory
+        self.cache = {}  # (月份, 有效长度) -> 记录列表
+
+    def segment_path(self, month):
+        return os.path.join(self.directory, f"{month}.jsonl.gz")
+
+    # 把一个月的记录追加到归档文件，返回新的有效长度
+    def append(self, month, entries, committed_bytes):
+        created = not os.path.isdir(self.directory)
+        os.makedirs(self.directory, exist_ok=True)
+        lines = "".join(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + "\n" for entry in entries)
+        data = gzip.compress(lines.encode('utf-8'))
+        with open(self.segment_path(month), 'ab') as file:
+            file.truncate(committed_bytes)
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        if created or not committed_bytes:
+            fsync_directory(self.directory)
+        return committed_bytes + len(data)
+
+    # 读取一个月的归档（只读有效长度内的部分），最近读过的几个月留在缓存里
+    def load(self, month, committed_bytes):
+        key = (month, committed_bytes)
+        if key not in self.cache:
+            with open(self.segment_path(month), 'rb') as file:
+                data = file.read(committed_bytes)
+            if len(self.cache) >= ARCHIVE_CACHE_SEGMENTS:
+                self.cache.pop(next(iter(self.cache)))
+            self.cache[key] = [json.loads(line) for line in gzip.decompress(data).decode('utf-8').splitlines()]
+        return self.cache[key]
+
+
+# 没有归档时的归档汇总：条数、各月文件（条数和有效长度）、每日汇总和奖品累计汇总
+def empty_archive_summary():
+    return {'entries': 0, 'segments': {}, 'daily': {}, 'prizes': {}}
+
+
+# 抽奖历史：按追加顺序保存记录，同时维护按日期的索引和按天、按奖品的汇总
+# 按日期范围查询和汇总只访问范围内的天数，不需要扫描全部历史
+# 较早的记录可以移入归档（archive），内存中只保留最近的记录和归档部分的汇总，翻到旧的页时才读取归档
+# 下标、len() 和 to_list() 只针对内存中的记录；total_count() 和 page() 包含归档
+class DrawHistory:
+    def __init__(self, entries=(), archive=None, archived=None):
+        self._entries = []
+        self._days = []  # 出现过的日期（有序）
+        self._day_runs = {}  # 日期 -> 该日期记录所在的连续下标区间 [[开始, 结束), ...]
+        self._daily = {}  # 日期 -> 当天汇总
+        self._prizes = {}  # 奖品名称 -> 累计汇总
+        self.archive = archive  # HistoryArchive，没有归档目录时为 None
+        self.archived = archived or empty_archive_summary()  # 已归档部分的汇总，随快照保存
+        for day, daily in self.archived['daily'].items():
+            self._day_runs[day] = []
+            self._daily[day] = dict(daily, prizes={name: list(stats) for name, stats in daily['prizes'].items()})
+        self._days = sorted(self._daily)
+        self._prizes = {name: dict(totals) for name, totals in self.archived['prizes'].items()}
+        for entry in entries:
+            self.append(entry)
+
+    def append(self, entry):
+        index = len(self._entries)
+        self._entries.append(entry)
+        day = entry['date']
+
+        runs = self._day_runs.get(day)
+        if runs is None:
+            runs = self._day_runs[day] = []
+            self._daily[day] = {'wins': 0, 'value': 0, 'consolations': 0, 'prizes': {}}
+            if self._days and day < self._days[-1]:
+                bisect.insort(self._days, day)
+            else:
+                self._days.append(day)
+        if runs and runs[-1][1] == index:
+            runs[-1][1] = index + 1
+        else:
+            runs.append([index, index + 1])
+
+        daily = self._daily[day]
+        if entry['result'] == "中奖":
+            daily['wins'] += 1
+            daily['value'] += entry['value']
+            prize_stats = daily['prizes'].setdefault(entry['prize'], [0, 0])
+            prize_stats[0] += 1
+            prize_stats[1] += entry['value']
+            totals = self._prizes.setdefault(entry['prize'], {'wins': 0, 'value': 0})
+            totals['wins'] += 1
+            totals['value'] += entry['value']
+        else:
+            daily['consolations'] += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __getitem__(self, index):
+        return self._entries[index]
+
+    # 序列化为原来的列表形式
+    def to_list(self):
+        return self._entries
+
+    # [start, end] 范围内的日期（字符串 YYYY-MM-DD，None 表示不限）
+    def _days_between(self, start=None, end=None):
+        low = 0 if start is None else bisect.bisect_left(self._days, start)
+        high = len(self._days) if end is None else bisect.bisect_right(self._days, end)
+        return self._days[low:high]
+
+    # 按日期范围逐条遍历记录
+    def iter_range(self, start=None, end=None):
+        for day in self._days_between(start, end):
+            for first, last in self._day_runs[day]:
+                for index in range(first, last):
+                    yield self._entries[index]
+
+    # 按日期范围逐条遍历记录（包含归档），只读取范围内的月份的归档
+    def iter_between(self, start=None, end=None):
+        for month, segment in sorted(self.archived['segments'].items()):
+            if (start is not None and month < start[:7]) or (end is not None and month > end[:7]):
+                continue
+            for entry in self.archive.load(month, segment['bytes']):
+                if (start is None or entry['date'] >= start) and (end is None or entry['date'] <= end):
+                    yield entry
+        yield from self.iter_range(start, end)
+
+    # 包含归档在内的总条数
+    def total_count(self):
+        return self.archived['entries'] + len(self._entries)
+
+    # 分页读取，第 0 页是最新的记录；页的范围进入归档时只读取涉及的月份
+    def page(self, page_number, page_size=HISTORY_PAGE_SIZE):
+        end = self.total_count() - page_number * page_size
+        start = max(0, end - page_size)
+        return self.slice(start, max(0, end))[::-1]
+
+    def page_count(self, page_size=HISTORY_PAGE_SIZE):
+        return max(1, -(-self.total_count() // page_size))
+
+    # 按全局序号（归档在前）读取 [start, end) 范围内的记录
+    def slice(self, start, end):
+        archived_count = self.archived['entries']
+        entries = []
+        offset = 0
+        for month, segment in sorted(self.archived['segments'].items()):
+            if offset >= end:
+                break
+            if offset + segment['entries'] > start:
+                month_entries = self.archive.load(month, segment['bytes'])
+                entries.extend(month_entries[max(0, start - offset):end - offset])
+            offset += segment['entries']
+        entries.extend(self._entries[max(0, start - archived_count):max(0, end - archived_count)])
+        return entries
+
+    # 全部记录（包含归档，会读取所有归档文件）
+    def all_entries(self):
+        return self.slice(0, self.total_count())
+
+    # 按顺序逐条遍历全部记录（包含归档），一次只读取一个月的归档
+    # 调用时记下当前各月归档的有效长度并复制内存中的记录，之后的追加和归档不影响这次遍历
+    # （归档只在有效长度之后追加，已记下的部分不会改变）
+    def iter_all(self):
+        segments = [(month, segment['bytes']) for month, segment in sorted(self.archived['segments'].items())]
+        archived = (entry for month, committed_bytes in segments for entry in self.archive.load(month, committed_bytes))
+        return itertools.chain(archived, list(self._entries))
+
+    # 最早一条内存中记录的月份已早于 before_month（YYYY-MM）时需要归档
+    def needs_compaction(self, before_month):
+        return self.archive is not None and bool(self._entries) and self._entries[0]['date'][:7] < before_month
+
+    # 把开头早于 before_month 的记录按月追加到归档，更新归档汇总并重建内存索引，返回归档的条数
+    # 只移走开头连续的一段，保证归档在前、内存在后的顺序与原来的追加顺序一致
+    def compact(self, before_month):
+        if not self.needs_compaction(before_month):
+            return 0
+        count = 0
+        while count < len(self._entries) and self._entries[count]['date'][:7] < before_month:
+            count += 1
+        moved = DrawHistory(self._entries[:count])
+        archived = copy.deepcopy(self.archived)
+        months = {}
+        for entry in moved:
+            months.setdefault(entry['date'][:7], []).append(entry)
+        for month, month_entries in months.items():
+            segment = archived['segments'].setdefault(month, {'entries': 0, 'bytes': 0})
+            segment['bytes'] = self.archive.append(month, month_entries, segment['bytes'])
+            segment['entries'] += len(month_entries)
+        for day, daily in moved._daily.items():
+            total = archived['daily'].setdefault(day, {'wins': 0, 'value': 0, 'consolations': 0, 'prizes': {}})
+            total['wins'] += daily['wins']
+            total['value'] += daily['value']
+            total['consolations'] += daily['consolations']
+            for name, (wins, value) in daily['prizes'].items():
+                prize_stats = total['prizes'].setdefault(name, [0, 0])
+                prize_stats[0] += wins
+                prize_stats[1] += value
+        for name, totals in moved._prizes.items():
+            archived_totals = archived['prizes'].setdefault(name, {'wins': 0, 'value': 0})
+            archived_totals['wins'] += totals['wins']
+            archived_totals['value'] += totals['value']
+        archived['entries'] += count
+        self.__init__(self._entries[count:], self.archive, archived)
+        return count
+
+    # 日期范围内的汇总（中奖次数、中奖价值、安慰奖次数、各奖品明细），只访问范围内的天数
+    def summary(self, start=None, end=None):
+        result = {'wins': 0, 'value': 0, 'consolations': 0, 'prizes': {}}
+        for day in self._days_between(start, end):
+            daily = self._daily[day]
+            result['wins'] += daily['wins']
+            result['value'] += daily['value']
+            result['consolations'] += daily['consolations']
+            for name, (wins, value) in daily['prizes'].items():
+                prize_stats = result['prizes'].setdefault(name, [0, 0])
+                prize_stats[0] += wins
+                prize_stats[1] += value
+        return result
+
+    def daily_summary(self, day):
+        return self._daily.get(day)
+
+    def prize_summary(self, prize_name):
+        return self._prizes.get(prize_name)
+
+
+# SQLite 后端的抽奖历史：记录保存在数据库里，分页、按日期查询和汇总都走 draw_history 表的索引，不整表读入内存
+# 内存中只保留本批抽奖追加、尚未提交的记录，提交后调用 mark_committed 清空
+class SqliteDrawHistory:
+    def __init__(self, store):
+        self.store = store
+        self.archive = None
+        self.archived = empty_archive_summary()  # SQLite 不归档，保留同样的字段供快照和运行指标使用
+        self._committed = store.history_count()
+        self._pending = []
+
+    def append(self, entry):
+        self._pending.append(entry)
+
+    # 一批抽奖的记录已写入数据库
+    def mark_committed(self):
+        self._committed += len(self._pending)
+        self._pending = []
+
+    def __len__(self):
+        return self._committed + len(self._pending)
+
+    # 只支持 [start:] 形式的切片：取出一批抽奖新增的记录
+    def __getitem__(self, index):
+        return self.slice(index.start or 0, len(self))
+
+    def to_list(self):
+        return self.all_entries()
+
+    def total_count(self):
+        return len(self)
+
+    def page(self, page_number, page_size=HISTORY_PAGE_SIZE):
+        end = self.total_count() - page_number * page_size
+        start = max(0, end - page_size)
+        return self.slice(start, max(0, end))[::-1]
+
+    def page_count(self, page_size=HISTORY_PAGE_SIZE):
+        return max(1, -(-self.total_count() // page_size))
+
+    # 按序号读取 [start, end) 范围内的记录，已提交的部分从数据库读取
+    def slice(self, start, end):
+        entries = self.store.history_slice(start, min(end, self._committed)) if start < self._committed else []
+        entries.extend(self._pending[max(0, start - self._committed):max(0, end - self._committed)])
+        return entries
+
+    def all_entries(self):
+        return self.slice(0, self.total_count())
+
+    def iter_all(self):
+        return self.iter_between()
+
+    def iter_between(self, start=None, end=None):
+        pending = DrawHistory(self._pending).iter_range(start, end)
+        return itertools.chain(self.store.history_between(start, end), list(pending))
+
+    def summary(self, start=None, end=None):
+        result = self.store.summary_between(start, end)
+        if self._pending:
+            pending = DrawHistory(self._pending).summary(start, end)
+            for key in ('wins', 'value', 'consolations'):
+                result[key] += pending[key]
+            for name, (wins, value) in pending['prizes'].items():
+                prize_stats = result['prizes'].setdefault(name, [0, 0])
+                prize_stats[0] += wins
+                prize_stats[1] += value
+        return result
+
+    def needs_compaction(self, before_month):
+        return False
 
 
 # 使用对数缩放公式计算概率，考虑碎片数量
-def calculate_probability(prize_value, limit_value, remaining_fragments, total_fragments):
+# expected_value 为单次抽奖的期望价值（limit_value 不影响结果）
+def calculate_probability(prize_value, limit_value, remaining_fragments, total_fragments, expected_value):
+    return probability_kernel(prize_value, remaining_fragments, total_fragments, expected_value)
+
+
+# 概率公式本身：结果只取决于这四个输入，按输入缓存
+# 期望价值是缓存键的一部分，修改设置后不会取到旧设置下的结果；修改设置时仍会清空缓存，腾出旧设置占用的条目
+@functools.lru_cache(maxsize=PROBABILITY_CACHE_SIZE)
+def probability_kernel(prize_value, remaining_fragments, total_fragments, expected_value):
     # 计算奖品的剩余总价值
     remaining_value = prize_value * (remaining_fragments / total_fragments)
 
-    # 期望值
-    expected_value = get_expected_draw_value()
-
     # 对数缩放公式，考虑剩余碎片
     return math.log(expected_value / remaining_value + 1)
 
-# 生成编号，使用字母加数字的组合，例如 A1, B2, C3 等
-def generate_prize_id():
-    global prize_id_counter, letter_counter
-    letter = chr(65 + letter_counter)  # 从 'A' 开始，递增字母
-    prize_id = f"{letter}{prize_id_counter}"
-    prize_id_counter += 1
-    if prize_id_counter > 99:  # 达到一定数量后，字母变动
-        prize_id_counter = 1
-        letter_counter += 1
-    return prize_id
 
+probability_cache_totals = {'hits': 0, 'misses': 0, 'clears': 0}  # 清空缓存之前累计的命中和未命中次数
 
-# 计算单次抽奖的期望价值
-def get_expected_draw_value():
-    return total_pool_value / (30 * draws_per_day)
 
+# 清空概率缓存（每月奖池总价值或每天抽奖次数变化时调用），命中统计继续累计
+def clear_probability_cache():
+    info = probability_kernel.cache_info()
+    probability_cache_totals['hits'] += info.hits
+    probability_cache_totals['misses'] += info.misses
+    probability_cache_totals['clears'] += 1
+    probability_kernel.cache_clear()
 
-# 批量交互输入奖品
-def add_prizes_interactive():
-    print("请输入奖品信息，每个奖品格式为 '名称,价值,数量'，用空格分隔不同奖品，输入 'done' 完成:")
-    while True:
-        prizes_input = input("批量输入奖品: ")
-        if prizes_input.lower() == 'done':
-            break
-        prizes_list = prizes_input.split()
-        for prize in prizes_list:
-            try:
-                prize_name, prize_value, limit_value = prize.split(',')
-                prize_value = int(prize_value)
-                limit_value = int(limit_value)  # 这是奖品的数量
 
-                if check_prize_name_exists(prize_name):
-                    print(f"输入错误：奖品名称 '{prize_name}' 已经存在，请重新输入。")
-                else:
-                    add_prize(prize_name, prize_value, limit_value)
-            except ValueError:
-                print(f"输入格式有误: {prize}")
+# 概率缓存的统计：本进程累计的命中、未命中和清空次数，当前条目数和上限
+def probability_cache_stats():
+    info = probability_kernel.cache_info()
+    return {
+        'hits': probability_cache_totals['hits'] + info.hits,
+        'misses': probability_cache_totals['misses'] + info.misses,
+        'clears': probability_cache_totals['clears'],
+        'entries': info.currsize,
+        'max_entries': info.maxsize,
+    }
 
 
-# 检查奖品名称是否已存在
-def check_prize_name_exists(prize_name):
-    for prize in prize_pool:
-        if prize_name == prize['name']:
-            return True
-    return False
-
-
-# 添加奖品的核心逻辑
-def add_prize(prize_name, prize_value, limit_value):
-    fragments = decide_fragments(prize_value)  # 根据价值决定碎片数量
-    fragment_value = prize_value / fragments  # 将奖品价值均分为多个碎片
-    prize_pool.append({
-        'id': generate_prize_id(),  # 生成唯一编号
-        'name': prize_name,
-        'total_value': prize_value,  # 奖品总价值
-        'fragment_value': fragment_value,  # 每个碎片价值
-        'total_fragments': fragments,  # 总碎片数
-        'remaining_fragments': fragments,  # 剩余碎片数
-        'limit_value': limit_value,  # 奖品的数量
-        'probability': 0,  # 初始化概率
-        'cooldown': 0  # 冷却机制，初始为0
-    })
-    update_probabilities()
-    save_game_state()
-
-
-# 动态决定碎片数
-def decide_fragments(total_value):
-    if total_value <= 100:
-        return 1  # 不拆分
-    elif total_value <= 500:
-        return 2  # 拆分为 2
-    elif total_value <= 2000:
-        return 4  # 拆分为 4
+PRIZE_FILE_COLUMNS = {'name': 'name', '名称': 'name', 'value': 'value', '价值': 'value',
+                      'count': 'count', 'limit': 'count', '数量': 'count'}  # 导入文件的列名 -> 字段
+PRIZE_EXPORT_COLUMNS = ['id', 'name', 'value', 'count', 'total_fragments', 'remaining_fragments', 'probability']
+HISTORY_EXPORT_COLUMNS = ['date', 'result', 'prize', 'fragment_won', 'total_fragments', 'value', 'consolation_reward']
+
+
+# 文件格式（按扩展名）：'csv' 或 'jsonl'，其他扩展名返回 None
+def file_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    return {'.csv': 'csv', '.jsonl': 'jsonl'}.get(extension)
+
+
+# 流式读取奖品文件，逐行产出 (行号, 记录)，不会一次读入整个文件
+# CSV 第一行含 name / 名称 列时按列名读取（value / 价值，count / limit / 数量），否则按 名称,价值,数量 的顺序
+# JSONL 每行一个对象；无法解析的行产出的记录为 None，由 parse_prize_record 报告
+def read_prize_file(path):
+    with open(path, 'r', encoding='utf-8-sig', newline='') as file:
+        if file_format(path) == 'jsonl':
+            for line_number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except json.JSONDecodeError:
+                    yield line_number, None
+            return
+
+        reader = csv.reader(file)
+        columns = ['name', 'value', 'count']
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            if reader.line_num == 1 and any(cell.strip().lower() in ('name', '名称') for cell in row):
+                columns = [PRIZE_FILE_COLUMNS.get(cell.strip().lower()) for cell in row]
+                continue
+            yield reader.line_num, {column: cell for column, cell in zip(columns, row) if column}
+
+
+# 校验一条奖品记录，返回 (名称, 价值, 数量)；不合法时抛出 ValueError，说明原因
+def parse_prize_record(record):
+    if not isinstance(record, dict):
+        raise ValueError("无法解析这一行")
+    missing = [field for field in ('name', 'value', 'count') if field not in record]
+    if missing:
+        raise ValueError(f"缺少字段 {', '.join(missing)}")
+    prize_name = str(record['name']).strip()
+    if not prize_name:
+        raise ValueError("奖品名称为空")
+    try:
+        prize_value = float(record['value'])
+    except (TypeError, ValueError):
+        raise ValueError(f"价值不是数字: {record['value']}")
+    if not math.isfinite(prize_value) or prize_value <= 0:
+        raise ValueError(f"价值必须大于 0: {record['value']}")
+    if prize_value.is_integer():
+        prize_value = int(prize_value)
+    try:
+        limit_value = int(str(record['count']).strip())
+    except ValueError:
+        raise ValueError(f"数量不是整数: {record['count']}")
+    if limit_value <= 0:
+        raise ValueError(f"数量必须大于 0: {record['count']}")
+    return prize_name, prize_value, limit_value
+
+
+# 导入报告：添加的奖品数，重名和格式有误的行（各最多列出 limit 行）
+def format_import_report(report, limit=10):
+    if not report['saved']:
+        return "存档已被另一个进程修改，已重新加载，没有导入任何奖品。"
+    duplicates, errors = report['duplicates'], report['errors']
+    lines = [f"已导入 {report['added']} 个奖品，重名跳过 {len(duplicates)} 行，格式有误 {len(errors)} 行。"]
+    for line_number, prize_name in duplicates[:limit]:
+        lines.append(f"- 第 {line_number} 行：奖品名称 '{prize_name}' 已经存在")
+    for line_number, reason in errors[:limit]:
+        lines.append(f"- 第 {line_number} 行：{reason}")
+    hidden = max(0, len(duplicates) - limit) + max(0, len(errors) - limit)
+    if hidden:
+        lines.append(f"……另有 {hidden} 行未列出")
+    return "\n".join(lines)
+
+
+# 逐条写入导出文件，返回写入的条数；CSV 先写表头，缺少的字段留空，JSONL 每行一个对象（只含有值的字段）
+def write_export_rows(file, file_type, columns, rows):
+    count = 0
+    if file_type == 'csv':
+        writer = csv.writer(file)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow([row.get(column, '') for column in columns])
+            count += 1
     else:
-        return 8  # 拆分为 8
-
-
-# 更新所有奖品的概率
-def update_probabilities():
-    global total_pool_value, draws_per_day, total_won_value
-
-    # 计算单次抽奖的期望值
-    expected_value = get_expected_draw_value()
-
-    total_probability = 0  # 用于累计所有奖品的总概率
-    max_probability = 0.3  # 设置每个奖品的最大抽中概率上限
+        for row in rows:
+            file.write(json.dumps({column: row[column] for column in columns if column in row}, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+# 期望值计算器：与抽奖使用相同的规则（对数概率、单个奖品的概率上限、冷却、高价值惩罚、安慰奖分流），
+# 全部解析计算（numpy 整列运算），不做模拟；prizes 为奖池中的奖品（需要 numpy）
+# 进入奖品抽奖后按权重归一化抽取，因此奖品每次抽奖的实际中奖概率 = (1 - 安慰奖阈值) × 权重 / 总权重
+# 集齐碎片的期望抽奖次数：每个奖品按自己的马尔可夫链（剩余碎片 × 剩余数量）计算，链上每一步的等待时间
+# 按冷却的衰减逐次计算生存概率；其他奖品的权重按当前值固定。completion=False 时不计算集齐次数
+def analyze_pool(prizes, total_pool_value, draws_per_day, total_won_value, draw_counter,
+                 consolation_threshold=CONSOLATION_THRESHOLD, max_probability=MAX_PRIZE_PROBABILITY, completion=True):
+    np = get_numpy()
+    prizes = list(prizes)
+    expected_value = total_pool_value / (30 * draws_per_day)
+    value = np.array([prize['total_value'] for prize in prizes], dtype=float)
+    total = np.array([prize['total_fragments'] for prize in prizes], dtype=int)
+    remaining = np.array([prize['remaining_fragments'] for prize in prizes], dtype=int)
+    limit = np.array([prize['limit_value'] for prize in prizes], dtype=int)
+    cooldown = np.array([prize['cooldown'] for prize in prizes], dtype=float)
+    elapsed = np.array([draw_counter - prize.get('cooldown_draw', draw_counter) for prize in prizes], dtype=float)
+    penalty = HIGH_VALUE_PENALTY if total_won_value > total_pool_value * HIGH_SPEND_RATIO else 1
+    scale = np.where(value > expected_value * HIGH_VALUE_FACTOR, penalty, 1.0)  # 高价值奖品的超支惩罚
+    split = 1 - consolation_threshold  # 进入奖品抽奖的概率
+
+    # 剩余碎片为 r 时的基础概率，以及冷却为 current_cooldown 时的抽奖权重（与 compute_prize_probability、get_prize_probability 相同）
+    def base_probability(r):
+        return np.log(expected_value / (value[:, None] * r / total[:, None]) + 1)
+
+    def weight(base, current_cooldown):
+        return np.minimum(base * (1 - current_cooldown), max_probability) * scale[:, None]
+
+    current_cooldown = np.where(cooldown > 0, np.maximum(0, cooldown - COOLDOWN_DECAY_PER_DRAW * elapsed), 0)
+    current_weight = weight(base_probability(remaining[:, None]), current_cooldown[:, None])[:, 0]
+    total_weight = float(current_weight.sum())
+    others = total_weight - current_weight  # 其他奖品的总权重（固定）
+    draw_probability = split * current_weight / total_weight if total_weight > 0 else np.zeros(len(prizes))
+    fragment_value = value / total
+    draw_value = float((draw_probability * fragment_value).sum())
+    draw_variance = float((draw_probability * fragment_value ** 2).sum()) - draw_value ** 2
+    monthly_draws = 30 * draws_per_day
+    analysis = {
+        'expected_value': expected_value,  # 设计的单次抽奖期望价值
+        'draw_value': draw_value,  # 按当前概率计算的单次抽奖期望价值
+        'draw_variance': draw_variance,
+        'monthly_draws': monthly_draws,
+        'monthly_spend': draw_value * monthly_draws,
+        'monthly_spend_std': math.sqrt(max(0, draw_variance) * monthly_draws),
+        'names': [prize['name'] for prize in prizes],
+        'draw_probability': draw_probability,
+    }
+    if not completion:
+        return analysis
+
+    # 在剩余碎片为 r 的状态下等到下一次抽中的期望抽奖次数；等待开始时冷却为 start_cooldown，之后每抽一次衰减
+    # E[T] = Σ P(T ≥ k)：冷却期内逐次累乘未抽中的概率，冷却结束后中奖概率不再变化，剩余部分是几何分布
+    def expected_wait(r, start_cooldown):
+        base = base_probability(r)
+        survival = np.ones(base.shape)
+        expected = np.zeros(base.shape)
+        steps = int(math.ceil(COOLDOWN_START / COOLDOWN_DECAY_PER_DRAW))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for k in range(1, steps + 1):
+                step_cooldown = np.maximum(0, start_cooldown - COOLDOWN_DECAY_PER_DRAW * k)
+                step_weight = weight(base, step_cooldown)
+                hazard = split * step_weight / (others[:, None] + step_weight)
+                expected += survival
+                survival *= 1 - hazard
+            final_weight = weight(base, 0)
+            final_hazard = split * final_weight / (others[:, None] + final_weight)
+            return expected + survival / final_hazard
+
+    # 刚抽中一个碎片之后（冷却从头开始）、剩余碎片为 1..最大碎片数 时的等待次数；超出该奖品碎片数的格子不用
+    max_fragments = int(total.max()) if len(prizes) else 1
+    grid = np.arange(1, max_fragments + 1)[None, :].repeat(len(prizes), axis=0)
+    valid = grid <= total[:, None]
+    after_win = np.where(valid, expected_wait(np.minimum(grid, total[:, None]), np.full((len(prizes), 1), COOLDOWN_START)), 0)
+    cumulative = np.concatenate([np.zeros((len(prizes), 1)), np.cumsum(after_win, axis=1)], axis=1)
+
+    # 当前这一份：先从当前状态（当前冷却）等到下一个碎片，之后剩余碎片 remaining - 1 .. 1 各等待一次
+    # 每集齐一份，剩余数量减一、碎片重置（此时刚抽中，冷却从头开始），再集齐一份需要 Σ_{r=1}^{total} 的等待
+    initial_cooldown = np.where(cooldown > 0, cooldown - COOLDOWN_DECAY_PER_DRAW * elapsed, 0)
+    first_wait = expected_wait(remaining[:, None], initial_cooldown[:, None])[:, 0]
+    rows = np.arange(len(prizes))
+    draws_to_complete = first_wait + cumulative[rows, remaining - 1]
+    draws_per_unit = cumulative[rows, total]
+    draws_to_exhaust = draws_to_complete + (limit - 1) * draws_per_unit
+    analysis['draws_to_complete'] = draws_to_complete  # 集齐当前这一份的期望抽奖次数
+    analysis['draws_to_exhaust'] = draws_to_exhaust  # 抽完全部数量的期望抽奖次数
+    return analysis
+
+
+# 一个月的期望支出及其标准差：本月支出从 0 开始，从奖品当前的碎片状态出发，进入奖品抽奖的概率为 share
+# 每个奖品的"本月已抽中碎片数"按马尔可夫链逐次推进概率分布（碎片抽完一份后重置、数量用完后移除），
+# 所有奖品的总权重取期望值；期望支出超过每月奖池的 80% 之后对高价值奖品应用惩罚。不考虑冷却
+# 状态数按奖池大小限制在约 MONTH_MODEL_CELLS 个格子以内，超出的部分并入最后一个状态（按该状态的权重继续抽中）；
+# 奖品很多时每个奖品一个月里很少被抽中，少量状态就足够
+def month_spend(prizes, total_pool_value, draws_per_day, share, max_probability=MAX_PRIZE_PROBABILITY):
+    np = get_numpy()
+    prizes = list(prizes)
+    expected_value = total_pool_value / (30 * draws_per_day)
+    monthly_draws = 30 * draws_per_day
+    value = np.array([prize['total_value'] for prize in prizes], dtype=float)
+    total = np.array([prize['total_fragments'] for prize in prizes], dtype=int)
+    won = total - np.array([prize['remaining_fragments'] for prize in prizes], dtype=int)  # 当前这一份已抽中的碎片
+    capacity = np.array([prize['limit_value'] for prize in prizes], dtype=int) * total - won  # 本月最多还能抽中的碎片
+    states = int(min(monthly_draws, capacity.max(), max(1, MONTH_MODEL_CELLS // max(1, len(prizes))))) + 1
+
+    # 状态 j 表示本月已抽中 j 个碎片；抽完全部数量后权重为 0
+    fragments_won = np.arange(states)[None, :]
+    alive = fragments_won < capacity[:, None]
+    remaining = total[:, None] - (won[:, None] + fragments_won) % total[:, None]
+    base = np.log(expected_value / (value[:, None] * remaining / total[:, None]) + 1)
+    weight = np.where(alive, np.minimum(base, max_probability), 0)
+    penalized_weight = np.where((value > expected_value * HIGH_VALUE_FACTOR)[:, None], weight * HIGH_VALUE_PENALTY, weight)
+    fragment_value = (value / total)[:, None]
+    weight_values = [(current_weight, current_weight * fragment_value, current_weight * fragment_value ** 2)
+                     for current_weight in (weight, penalized_weight)]
+
+    distribution = np.zeros((len(prizes), states))
+    distribution[:, 0] = 1
+    spend = 0.0
+    variance = 0.0
+    for _ in range(monthly_draws):
+        current_weight, current_value, current_square = weight_values[spend > total_pool_value * HIGH_SPEND_RATIO]
+        expected_weight = distribution * current_weight
+        total_weight = float(expected_weight.sum())
+        if total_weight <= 0:
+            break
+        scale = share / total_weight
+        moved = np.multiply(expected_weight, scale, out=expected_weight)  # 这次抽奖从每个状态转移到下一个状态的概率
+        draw_value = float(np.vdot(distribution, current_value)) * scale
+        spend += draw_value
+        variance += float(np.vdot(distribution, current_square)) * scale - draw_value ** 2
+        distribution -= moved
+        distribution[:, 1:] += moved[:, :-1]
+        distribution[:, -1] += moved[:, -1]  # 最后一个状态之后的抽中不再细分
+    return spend, math.sqrt(max(0, variance))
+
+
+# 求进入奖品抽奖的概率 share（0 ~ 1），使 month_spend 的期望支出等于每月奖池（Illinois 试位法，支出随 share 单调增加）
+# 返回 (share, 期望支出, 标准差)；奖池中的奖品每次都抽中也花不完预算时 share 取 1
+def solve_prize_share(prizes, total_pool_value, draws_per_day, max_probability=MAX_PRIZE_PROBABILITY, tolerance=1e-6):
+    prizes = list(prizes)
+    low, high = 0.0, 1.0
+    low_error = -total_pool_value
+    spend, spend_std = month_spend(prizes, total_pool_value, draws_per_day, high, max_probability)
+    high_error = spend - total_pool_value
+    if high_error <= 0:
+        return high, spend, spend_std
+    result = (high, spend, spend_std)
+    side = 0
+    for _ in range(60):
+        share = (low * high_error - high * low_error) / (high_error - low_error)
+        spend, spend_std = month_spend(prizes, total_pool_value, draws_per_day, share, max_probability)
+        error = spend - total_pool_value
+        result = (share, spend, spend_std)
+        if abs(error) <= tolerance * total_pool_value:
+            break
+        if error > 0:
+            high, high_error = share, error
+            if side > 0:
+                low_error /= 2
+            side = 1
+        else:
+            low, low_error = share, error
+            if side < 0:
+                high_error /= 2
+            side = -1
+    return result
+
+
+# 动态决定碎片数：默认不超过 100 不拆分，不超过 500 拆分为 2，不超过 2000 拆分为 4，否则拆分为 8
+def decide_fragments(total_value, breakpoints=FRAGMENT_BREAKPOINTS, max_fragments=FRAGMENT_MAX):
+    for limit_value, fragments in breakpoints:
+        if total_value <= limit_value:
+            return fragments
+    return max_fragments
+
+
+# 线性累积概率扫描：与最初的 cumulative_probabilities 实现完全一致，O(n) 抽样
+class LinearSampler:
+    def __init__(self, weights=()):
+        self.build(weights)
+
+    def build(self, weights):
+        self.weights = weights.tolist() if hasattr(weights, 'tolist') else list(weights)
+
+    def append(self, weight):
+        self.weights.append(weight)
+
+    def update(self, index, weight):
+        self.weights[index] = weight
+
+    def total(self):
+        return sum(self.weights)
+
+    # rand_value 为 [0, 1) 的随机数，返回命中的下标；没有可抽的奖品时返回 None
+    def sample(self, rand_value):
+        target = rand_value * self.total()
+        cumulative = 0
+        for index, weight in enumerate(self.weights):
+            cumulative += weight
+            if target < cumulative:
+                return index
+        return None
+
+
+# 别名表（Vose 算法）：适合权重不变的场景，O(1) 抽样；权重变化后在下一次抽样前重建
+class AliasSampler:
+    def __init__(self, weights=()):
+        self.build(weights)
+
+    def build(self, weights):
+        self.weights = weights.tolist() if hasattr(weights, 'tolist') else list(weights)
+        self._dirty = True
+
+    def append(self, weight):
+        self.weights.append(weight)
+        self._dirty = True
+
+    def update(self, index, weight):
+        if self.weights[index] != weight:
+            self.weights[index] = weight
+            self._dirty = True
+
+    def total(self):
+        if self._dirty:
+            self._rebuild()
+        return self._total
+
+    def _rebuild(self):
+        n = len(self.weights)
+        self._total = sum(self.weights)
+        self._prob = [1.0] * n
+        self._alias = list(range(n))
+        self._dirty = False
+        if n == 0 or self._total <= 0:
+            return
+        scaled = [weight * n / self._total for weight in self.weights]
+        small = [i for i, value in enumerate(scaled) if value < 1]
+        large = [i for i, value in enumerate(scaled) if value >= 1]
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            self._prob[less] = scaled[less]
+            self._alias[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1
+            if scaled[more] < 1:
+                small.append(more)
+            else:
+                large.append(more)
+        # 剩下的列由于浮点误差只会略小于 1，按 1 处理
+        for index in small + large:
+            self._prob[index] = 1.0
+
+    def sample(self, rand_value):
+        if self.total() <= 0:
+            return None
+        # 一个随机数同时决定列号和列内的硬币
+        position = rand_value * len(self.weights)
+        column = min(int(position), len(self.weights) - 1)
+        if position - column < self._prob[column]:
+            return column
+        return self._alias[column]
+
+
+# 树状数组（Fenwick tree）：单个权重修改 O(log n)，抽样 O(log n)
+class FenwickSampler:
+    def __init__(self, weights=()):
+        self.build(weights)
+
+    def build(self, weights):
+        if hasattr(weights, 'cumsum'):
+            self._build_numpy(weights)
+            return
+        self.weights = list(weights)
+        n = len(self.weights)
+        self._tree = [0.0] + self.weights
+        for i in range(1, n + 1):
+            parent = i + (i & -i)
+            if parent <= n:
+                self._tree[parent] += self._tree[i]
+        self._total = sum(self.weights)
+        self._updates = 0
+
+    # numpy 数组直接由前缀和整体建树：节点 i 覆盖区间 (i - lowbit(i), i]
+    def _build_numpy(self, weights):
+        np = get_numpy()
+        cumulative = np.concatenate(([0.0], np.cumsum(weights, dtype='float64')))
+        index = np.arange(1, len(weights) + 1)
+        self._tree = [0.0] + (cumulative[index] - cumulative[index - (index & -index)]).tolist()
+        self.weights = weights.tolist()
+        self._total = float(cumulative[-1])
+        self._updates = 0
+
+    def append(self, weight):
+        self.weights.append(weight)
+        i = len(self.weights)
+        # 新节点覆盖区间 (i - lowbit(i), i]
+        self._tree.append(weight + self._prefix(i - 1) - self._prefix(i - (i & -i)))
+        self._total += weight
+
+    def update(self, index, weight):
+        delta = weight - self.weights[index]
+        if delta == 0:
+            return
+        self.weights[index] = weight
+        self._total += delta
+        i = index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+        # 累加修改会积累浮点误差，修改次数足够多后整体重建一次
+        self._updates += 1
+        if self._updates > 4 * len(self.weights) + 64:
+            self.build(self.weights)
+
+    def _prefix(self, i):
+        result = 0.0
+        while i > 0:
+            result += self._tree[i]
+            i -= i & -i
+        return result
+
+    def total(self):
+        return self._total
+
+    def sample(self, rand_value):
+        n = len(self.weights)
+        if n == 0 or self._total <= 0:
+            return None
+        target = rand_value * self._total
+        # 二进制倍增，找到第一个前缀和大于 target 的位置
+        position = 0
+        step = 1 << n.bit_length()
+        while step:
+            following = position + step
+            if following <= n and self._tree[following] <= target:
+                position = following
+                target -= self._tree[following]
+            step >>= 1
+        if position < n:
+            return position
+        # 浮点误差导致越界时，退回到最后一个权重为正的奖品
+        return max(i for i in range(n) if self.weights[i] > 0)
+
+
+SAMPLER_ENGINES = {
+    'linear': LinearSampler,
+    'alias': AliasSampler,
+    'fenwick': FenwickSampler,
+}
+
+
+# 按设置创建采样器
+def create_sampler(weights=(), engine=None):
+    engine = engine or SAMPLER_ENGINE
+    if engine not in SAMPLER_ENGINES:
+        raise ValueError(f"未知的采样引擎: {engine}")
+    return SAMPLER_ENGINES[engine](weights)
+
+
+# 卡方检验：各采样引擎的抽样分布是否与累积概率扫描一致
+# 树状数组与线性扫描对同一个随机数必须选中同一个奖品；别名表只要求分布一致
+def check_sampler_distribution(weights=None, draws=200000, seed=0):
+    rng = random.Random(seed)
+    if weights is None:
+        weights = [rng.uniform(0.001, 0.3) for _ in range(50)]
+    total = sum(weights)
+    expected = [draws * weight / total for weight in weights]
+    df = max(1, sum(1 for weight in weights if weight > 0) - 1)
+    # Wilson-Hilferty 近似，显著性水平 0.001 (z = 3.09)
+    critical = df * (1 - 2 / (9 * df) + 3.09 * math.sqrt(2 / (9 * df))) ** 3
+
+    linear = LinearSampler(weights)
+    results = {}
+    for engine, sampler_class in SAMPLER_ENGINES.items():
+        sampler = sampler_class(weights)
+        counts = [0] * len(weights)
+        mismatches = 0
+        for _ in range(draws):
+            rand_value = rng.random()
+            index = sampler.sample(rand_value)
+            counts[index] += 1
+            if engine == 'fenwick' and index != linear.sample(rand_value):
+                mismatches += 1
+        # 权重为 0 的奖品一旦被抽中也算作不一致
+        mismatches += sum(c for c, e in zip(counts, expected) if e == 0)
+        chi_square = sum((c - e) ** 2 / e for c, e in zip(counts, expected) if e > 0)
+        results[engine] = {
+            'chi_square': chi_square,
+            'critical': critical,
+            'mismatches': mismatches,
+            'passed': chi_square < critical and mismatches == 0,
+        }
+    return results
+
+
+# SplitMix64 的常数：每个随机数的位置步长（黄金分割比例的 64 位整数）和 64 位掩码
+SPLITMIX_GAMMA = 0x9E3779B97F4A7C15
+SPLITMIX_MASK = (1 << 64) - 1
+
+
+# 可复现的随机数流（SplitMix64）：第 k 个随机数只由 (种子, k) 决定，不依赖生成器的内部状态
+# 种子和计数器随存档保存，从同一个存档出发、抽同样的次数，得到的结果完全相同
+# 每次抽奖使用紧接着的三个随机数（安慰奖分流、奖品抽取、安慰奖选择）
+class RandomStream:
+    def __init__(self, seed=None, counter=0):
+        self.reset(seed, counter)
+
+    # 设置种子和计数器（加载存档时原地更新，已经交给 run_draws 的 draw_values 随之使用新的位置）；没有种子时随机生成
+    def reset(self, seed=None, counter=0):
+        self.seed = random.getrandbits(64) if seed is None else seed
+        self.counter = counter  # 已使用的随机数个数
+
+    # 第 index 个随机数（从 1 开始），[0, 1) 之间
+    def value_at(self, index):
+        z = (self.seed + index * SPLITMIX_GAMMA) & SPLITMIX_MASK
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & SPLITMIX_MASK
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & SPLITMIX_MASK
+        return ((z ^ (z >> 31)) >> 11) * (1.0 / (1 << 53))
+
+    # 第 start + 1 到 start + count 个随机数；数量多时用 numpy 整列计算，结果与逐个计算完全相同
+    def values(self, start, count):
+        np = get_numpy() if count >= 64 else None
+        if np is None:
+            return [self.value_at(index) for index in range(start + 1, start + count + 1)]
+        z = np.arange(start + 1, start + count + 1, dtype=np.uint64) * np.uint64(SPLITMIX_GAMMA) + np.uint64(self.seed)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return (((z ^ (z >> np.uint64(31))) >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))).tolist()
+
+    def random(self):
+        self.counter += 1
+        return self.value_at(self.counter)
+
+    # 最多 n 次抽奖的随机数，逐次产出 (安慰奖分流, 奖品抽取, 安慰奖选择)
+    # 计数器在每次产出时才前进：奖池提前抽空时，没用到的随机数留给下一次抽奖
+    # 随机数在第一次取值时才生成，调用方可以先同步存档（随机数流随存档重新加载）再开始取值
+    def draw_values(self, n):
+        values = self.values(self.counter, 3 * n)
+        for k in range(0, 3 * n, 3):
+            self.counter += 3
+            yield values[k], values[k + 1], values[k + 2]
+
+
+# 按需加载 numpy，未安装时返回 None
+def get_numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+# 后台存档线程：把一段时间内的多次快照请求合并成一次写入（抽奖已先追加到日志，快照只用来缩短日志，重新加载时回放）
+# 第一次请求后最多 max_delay 秒写入（落后时间有界）；flush 立即写入并等待完成
+class BackgroundWriter:
+    def __init__(self, engine, max_delay=None):
+        self.engine = engine
+        self.max_delay = WRITER_MAX_DELAY if max_delay is None else max_delay
+        self.condition = threading.Condition()
+        self.dirty_since = None  # 最早一次尚未写入的保存请求的时间
+        self.requested = 0  # 保存请求的总数
+        self.written = 0  # 已写入磁盘的保存请求数
+        self.writes = 0  # 实际写入次数
+        self.failures = 0  # 写入失败的次数
+        self.error = None  # 最近一次写入失败的原因，写入成功后清空
+        self.flush_requested = False
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, name='lottery-writer', daemon=True)
+        self.thread.start()
+
+    def request(self):
+        with self.condition:
+            self.requested += 1
+            if self.dirty_since is None:
+                self.dirty_since = time.monotonic()
+                self.condition.notify_all()
+
+    # 立即写入所有已请求的保存，并等待写完；写入失败时返回失败原因（未写入的请求留到下次重试），成功时返回 None
+    def flush(self):
+        with self.condition:
+            target = self.requested
+            if self.written >= target:
+                return None
+            failures = self.failures
+            self.flush_requested = True
+            self.condition.notify_all()
+            while self.written < target and self.failures == failures and self.thread.is_alive():
+                self.condition.wait()
+            return self.error if self.written < target else None
+
+    # 写完尚未保存的修改后停止线程，返回 flush 的结果
+    def stop(self):
+        error = self.flush()
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        self.thread.join()
+        return error
+
+    def run(self):
+        with self.condition:
+            while True:
+                while self.dirty_since is None and not self.stopped:
+                    self.condition.wait()
+                if self.dirty_since is None:
+                    return
+                # 等到落后时间用完（或被要求立即写入），期间的请求都合并到这一次写入
+                deadline = self.dirty_since + self.max_delay
+                while not self.flush_requested and not self.stopped and time.monotonic() < deadline:
+                    self.condition.wait(deadline - time.monotonic())
+                target = self.requested
+                self.dirty_since = None
+                self.flush_requested = False
+                self.condition.release()
+                try:
+                    error = None if self.engine.write_game_state() else "存档已被另一个进程修改，已重新加载最新存档"
+                except Exception as exception:  # 写入失败时保留线程
+                    error = str(exception) or type(exception).__name__
+                finally:
+                    self.condition.acquire()
+                self.writes += 1
+                if error is None:
+                    self.written = target
+                    self.error = None
+                else:
+                    # 只有写入成功才算写完；保留未写入的请求，等一个落后时间后重试（停止时不再重试）
+                    print(f"后台保存失败: {error}")
+                    self.failures += 1
+                    self.error = error
+                    if self.dirty_since is None and not self.stopped:
+                        self.dirty_since = time.monotonic()
+                self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {'requested': self.requested, 'writes': self.writes, 'failures': self.failures,
+                    'pending': self.requested - self.written, 'max_delay': self.max_delay}
+
+
+# 一个用户的抽奖引擎：奖池、抽奖历史、概率采样器和存档都是它的属性
+# 交互菜单使用模块级的 engine；抽奖服务为每个用户创建一个引擎，存档放在各自的目录里
+class LotteryEngine:
+    def __init__(self, data_dir='.', verbose=True):
+        self.data_dir = data_dir
+        self.verbose = verbose  # 是否打印加载存档时的提示
+        self.save_file = os.path.join(data_dir, SAVE_FILE)
+        self.journal_file = os.path.join(data_dir, JOURNAL_FILE)
+        self.db_file = os.path.join(data_dir, DB_FILE)
+        self.settings_file = os.path.join(data_dir, SETTINGS_FILE)
+        self.audit_file = os.path.join(data_dir, AUDIT_FILE)
+        self.archive_dir = os.path.join(data_dir, ARCHIVE_DIR)
+        self.chart_dir = os.path.join(data_dir, CHART_DIR)
+        self.storage_backend = STORAGE_BACKEND
+        self.history_hot_days = HISTORY_HOT_DAYS  # 存档中保留最近多少天的抽奖历史
+        self.state_lock = StateLock(os.path.join(data_dir, LOCK_FILE))
+        self.state_version = 0  # 本进程最后一次读到或写入的存档版本号
+        self.mutex = threading.RLock()  # 内存状态的锁：后台保存线程生成快照时不能有抽奖在进行
+        self.writer = None  # 后台保存线程（开启后台保存时才有）
+        self.metrics = Metrics()  # 本进程的运行指标
+        self.audit_log = AUDIT_LOG  # 是否写审计日志
+        self.rng = RandomStream()  # 抽奖使用的随机数流，种子和计数器随存档保存
+        self.rng_seed_generated = False  # 加载的存档没有种子、新生成的种子还没有写入存档
+
+        self.prize_pool = create_prize_pool()  # 奖池中的奖品
+        self.total_won_value = 0  # 已抽取奖品的总价值
+        self.total_pool_value = 3000  # 总奖池价值
+        self.draws_per_day = 8  # 平均每天抽奖次数
+        self.consolation_threshold = CONSOLATION_THRESHOLD  # 随机值低于该阈值时直接发放安慰奖
+        self.prize_id_counter = 1  # 奖品编号计数器
+        self.letter_counter = 0  # 字母计数器
+        self.draw_history = self.create_draw_history()  # 抽奖历史记录（较早的部分在归档里）
+        self.consolation_rewards = []  # 安慰奖列表
+        self.journal_seq = 0  # 最近一条日志的序号
+        self.pending_journal_records = 0  # 上次快照后追加的日志条数
+        self.sqlite_store = None  # SQLite 存储后端的连接（按需打开）
+        self.draw_counter = 0  # 累计抽奖次数，冷却值按它惰性衰减
+        self.prize_sampler = None  # 普通奖品的加权采样器，下标即 prize_pool 中的槽位
+        self.high_value_sampler = None  # 高价值奖品的加权采样器，超支惩罚作为整体倍率作用在它上面
+        self.cooling_prizes = set()  # 仍在冷却中的奖品槽位
+
+    # 输出提示信息（verbose 为 False 时不输出）
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
+    # 关闭按需打开的数据库连接和锁文件（先写完后台线程中未保存的修改）
+    def close(self):
+        self.set_background_writer(False)
+        if self.sqlite_store is not None:
+            self.sqlite_store.close()
+            self.sqlite_store = None
+        self.state_lock.close()
+
+    # 在存档锁内执行一组读-改-写操作：开始前如果其他进程修改过存档，先重新加载（只读一次锁文件中的版本号）
+    # 开启后台保存时也一样：所有修改在返回前都已写入日志或存档，重新加载不会丢掉已经显示给用户的结果
+    # 加锁顺序总是“存档锁 → 内存状态锁”，与后台线程写快照的顺序相同
+    @contextlib.contextmanager
+    def state_transaction(self):
+        with self.state_lock, self.mutex:
+            self.sync_with_disk()
+            yield
+
+    # 是否由后台线程保存（只用于 JSON 存储；SQLite 每次抽奖本来就只写一个小事务）
+    def writes_in_background(self):
+        return self.writer is not None and self.storage_backend == 'json'
+
+    # 开启或关闭后台保存；关闭时先写完尚未保存的修改，写入失败时返回失败原因
+    def set_background_writer(self, enabled):
+        if enabled and self.writer is None:
+            self.writer = BackgroundWriter(self)
+        elif not enabled and self.writer is not None:
+            error = self.writer.stop()
+            self.writer = None
+            return error
+        return None
+
+    # 等待后台线程把已请求的保存写入磁盘（未开启后台保存时什么也不做），写入失败时返回失败原因
+    def flush(self):
+        if self.writer is not None:
+            return self.writer.flush()
+        return None
+
+    # 其他进程修改过存档时重新加载，返回是否重新加载了
+    def sync_with_disk(self):
+        with self.state_lock, self.mutex:
+            if self.state_lock.read_version() == self.state_version:
+                return False
+            self.log("存档已被另一个进程修改，正在重新加载...")
+            self.load_game_state()
+            return True
 
-    for prize in prize_pool:
+    # 写存档前调用（需持有存档锁）：存档已被其他进程修改时不覆盖，重新加载并返回 False；否则递增版本号
+    # 版本号先于数据写入，写到一半崩溃时其他进程最多多重新加载一次
+    def begin_write(self):
+        if self.state_lock.read_version() != self.state_version:
+            self.log("存档已被另一个进程修改，本次修改未保存，已重新加载最新存档。")
+            self.load_game_state()
+            return False
+        self.bump_state_version()
+        return True
+
+    # 递增存档版本号并写入锁文件（需持有存档锁）
+    def bump_state_version(self):
+        self.state_version += 1
+        self.state_lock.write_version(self.state_version)
+
+    # 存档锁的等待和持有时间统计
+    def view_lock_stats(self):
+        stats = self.state_lock.stats
+        if not stats['count']:
+            return "存档锁尚未使用。"
+        return (f"存档锁: 加锁 {stats['count']} 次，当前版本 {self.state_version}\n"
+                f"等待: 平均 {stats['wait_total'] / stats['count'] * 1000:.2f} ms，最长 {stats['wait_max'] * 1000:.2f} ms\n"
+                f"持有: 平均 {stats['hold_total'] / stats['count'] * 1000:.2f} ms，最长 {stats['hold_max'] * 1000:.2f} ms"
+                + self.view_writer_stats())
+
+    def view_writer_stats(self):
+        if self.writer is None:
+            return ""
+        stats = self.writer.stats()
+        return (f"\n后台保存: 请求 {stats['requested']} 次，合并为 {stats['writes']} 次写入，"
+                f"失败 {stats['failures']} 次，待写入 {stats['pending']} 次，最长延迟 {stats['max_delay']} 秒")
+
+    # 生成编号，使用字母加数字的组合，例如 A1, B2, C3 等
+    def generate_prize_id(self):
+        letter = chr(65 + self.letter_counter)  # 从 'A' 开始，递增字母
+        prize_id = f"{letter}{self.prize_id_counter}"
+        self.prize_id_counter += 1
+        if self.prize_id_counter > 99:  # 达到一定数量后，字母变动
+            self.prize_id_counter = 1
+            self.letter_counter += 1
+        return prize_id
+
+    # 计算单次抽奖的期望价值
+    def get_expected_draw_value(self):
+        return self.total_pool_value / (30 * self.draws_per_day)
+
+    # 修改每月奖池总价值和/或每天抽奖次数：期望价值随之变化，清空概率缓存、全量重新计算概率后保存
+    # 修改和保存在同一个事务里；存档已被其他进程修改（修改作废、已重新加载）时返回 False
+    def update_settings(self, total_pool_value=None, draws_per_day=None):
+        with self.state_transaction():
+            if total_pool_value is not None:
+                self.total_pool_value = total_pool_value
+            if draws_per_day is not None:
+                self.draws_per_day = draws_per_day
+            clear_probability_cache()
+            self.update_probabilities()
+            return self.save_game_state()
+
+    # 按每月奖池校准安慰奖阈值：使一个月的期望支出（见 month_spend）恰好等于每月奖池
+    # 奖品之间的相对概率不变：抽奖时按权重归一化，整体缩放奖品概率不会改变结果，能调整的只有进入奖品抽奖的概率
+    def calibrate_budget(self):
+        if not self.prize_pool:
+            return "奖池中没有奖品，无法校准。"
+        if get_numpy() is None:
+            return "预算校准需要 numpy。"
+        with self.state_transaction():
+            share, spend, spend_std = solve_prize_share(self.prize_pool, self.total_pool_value, self.draws_per_day)
+            previous = self.consolation_threshold
+            self.consolation_threshold = 1 - share
+            if not self.save_game_state():
+                return "存档已被另一个进程修改，已重新加载，请重新校准。"
+        message = (f"安慰奖阈值 {previous:.4f} -> {self.consolation_threshold:.4f}（进入奖品抽奖的概率 {share:.2%}），"
+                   f"每月期望支出 {spend:.2f} ± {spend_std:.2f} RMB，每月奖池 {self.total_pool_value} RMB")
+        if share >= 1 and spend < self.total_pool_value:
+            message += "\n奖池中的奖品每次都抽中也花不完预算，请添加奖品或提高奖品价值。"
+        return message
+
+    # 检查奖品名称是否已存在
+    def check_prize_name_exists(self, prize_name):
+        return self.prize_pool.has_name(prize_name)
+
+    # 添加奖品的核心逻辑；存档已被其他进程修改（奖品未添加、已重新加载）时返回 False
+    def add_prize(self, prize_name, prize_value, limit_value):
+        with self.state_transaction():
+            slot = self.prize_pool.add(self.new_prize(prize_name, prize_value, limit_value))
+            self.add_prize_probability(slot)  # 只计算新奖品的概率
+            return self.save_game_state()
+
+    # 批量添加奖品：records 可以是流式读取的生成器，产出 (行号, 记录)，记录格式见 parse_prize_record
+    # 先逐条校验（不合法的行和重名的奖品只记录下来，不中断导入），再一次性插入，最后只计算一次概率、保存一次
+    # 返回 {'added': 添加数, 'duplicates': [(行号, 名称)], 'errors': [(行号, 原因)], 'saved': 是否已保存}
+    # 存档已被其他进程修改时本批奖品作废（已重新加载），saved 为 False
+    def add_prizes(self, records):
+        report = {'added': 0, 'duplicates': [], 'errors': [], 'saved': True}
+        pending = []
+        names = set()  # 本批中已出现的名称
+        for line_number, record in records:
+            try:
+                prize_name, prize_value, limit_value = parse_prize_record(record)
+            except ValueError as error:
+                report['errors'].append((line_number, str(error)))
+                continue
+            if prize_name in names or self.check_prize_name_exists(prize_name):
+                report['duplicates'].append((line_number, prize_name))
+                continue
+            names.add(prize_name)
+            pending.append((line_number, prize_name, prize_value, limit_value))
+
+        if not pending:
+            return report
+        with self.state_transaction():
+            for line_number, prize_name, prize_value, limit_value in pending:
+                if self.check_prize_name_exists(prize_name):  # 读取文件期间其他进程添加了同名奖品
+                    report['duplicates'].append((line_number, prize_name))
+                    continue
+                self.prize_pool.add(self.new_prize(prize_name, prize_value, limit_value))
+                report['added'] += 1
+            self.update_probabilities()
+            if not self.save_game_state():
+                report['added'] = 0
+                report['saved'] = False
+        return report
+
+    # 生成一个新奖品（概率由调用方计算）
+    def new_prize(self, prize_name, prize_value, limit_value):
+        fragments = decide_fragments(prize_value)  # 根据价值决定碎片数量
+        fragment_value = prize_value / fragments  # 将奖品价值均分为多个碎片
+        return {
+            'id': self.generate_prize_id(),  # 生成唯一编号
+            'name': prize_name,
+            'total_value': prize_value,  # 奖品总价值
+            'fragment_value': fragment_value,  # 每个碎片价值
+            'total_fragments': fragments,  # 总碎片数
+            'remaining_fragments': fragments,  # 剩余碎片数
+            'limit_value': limit_value,  # 奖品的数量
+            'probability': 0,  # 初始化概率
+            'cooldown': 0,  # 冷却机制，初始为0
+            'cooldown_draw': self.draw_counter  # 冷却开始时的抽奖计数
+        }
+
+    # 奖品当前的冷却值：按抽奖次数惰性衰减，与概率更新的调用次数无关
+    def get_cooldown(self, prize):
+        if prize['cooldown'] <= 0:
+            return 0
+        elapsed = self.draw_counter - prize.get('cooldown_draw', self.draw_counter)
+        return max(0, prize['cooldown'] - COOLDOWN_DECAY_PER_DRAW * elapsed)
+
+    # 是否为高价值奖品（超支惩罚只作用于这些奖品）；expected_value 可由调用方预先算好传入
+    def is_high_value(self, prize, expected_value=None):
+        if expected_value is None:
+            expected_value = self.get_expected_draw_value()
+        return prize['total_value'] > expected_value * HIGH_VALUE_FACTOR
+
+    # 超支惩罚倍率：支出接近总池金额的80%时，高价值奖品的概率整体乘以该倍率
+    def get_penalty_multiplier(self):
+        if self.total_won_value > self.total_pool_value * HIGH_SPEND_RATIO:
+            return HIGH_VALUE_PENALTY
+        return 1
+
+    # 奖品的实际中奖概率（含超支惩罚）
+    def get_prize_probability(self, prize):
+        if self.is_high_value(prize):
+            return prize['probability'] * self.get_penalty_multiplier()
+        return prize['probability']
+
+    # 计算单个奖品应用冷却和上限之后的概率（不含超支惩罚）；expected_value 可由调用方预先算好传入
+    def compute_prize_probability(self, prize, expected_value=None):
+        if expected_value is None:
+            expected_value = self.get_expected_draw_value()
         # 计算基础概率，包含剩余碎片和总碎片的影响
         base_probability = calculate_probability(
             prize['total_value'],
             prize['limit_value'],
             prize['remaining_fragments'],
-            prize['total_fragments']
+            prize['total_fragments'],
+            expected_value
         )
 
-        # 应用冷却机制
-        if prize['cooldown'] > 0:
-            prize['cooldown'] = max(0, prize['cooldown'] - 0.01)
-            adjusted_probability = base_probability * (1 - prize['cooldown'])
+        # 应用冷却机制，并确保每个奖品的概率不会超过最大值
+        return min(base_probability * (1 - self.get_cooldown(prize)), MAX_PRIZE_PROBABILITY)
+
+    # 只重新计算一个奖品的概率，并同步到采样器
+    def refresh_prize_probability(self, index):
+        self.metrics.inc('lottery_probability_refreshes_total')
+        prize = self.prize_pool.at(index)
+        expected_value = self.get_expected_draw_value()
+        probability = self.compute_prize_probability(prize, expected_value)
+        prize['probability'] = probability
+        if self.is_high_value(prize, expected_value):
+            self.prize_sampler.update(index, 0)
+            self.high_value_sampler.update(index, probability)
         else:
-            adjusted_probability = base_probability
-
-        # 确保每个奖品的概率不会超过最大值
-        prize['probability'] = min(adjusted_probability, max_probability)
-
-        total_probability += prize['probability']
-
-    # 如果支出接近总池金额的80%，减少高价值奖品的概率
-    if total_won_value > total_pool_value * 0.8:
-        for prize in prize_pool:
-            if prize['total_value'] > expected_value * 5:
-                prize['probability'] *= 0.5  # 减少高价值奖品概率
+            self.prize_sampler.update(index, probability)
+            self.high_value_sampler.update(index, 0)
 
-    # 未中奖的概率 = 1 - 所有奖品概率之和
-    no_win_probability = 1 - total_probability
-    return max(0, no_win_probability)  # 保证未中奖概率不小于0
-
-# 抽奖逻辑
-def player_draw():
-    global total_won_value, prize_pool
-    if not prize_pool:
-        return "奖池中没有奖品了。"
-
-    # 生成 0 到 1 之间的随机数
-    rand_value = random.uniform(0, 1)
-
-
-    # 如果随机值小于 0.5，直接发放安慰奖
-    if rand_value < 0.618:
-        return give_consolation_reward()
+        if self.get_cooldown(prize) > 0:
+            self.cooling_prizes.add(index)
+        else:
+            prize['cooldown'] = 0
+            self.cooling_prizes.discard(index)
+
+    # 新奖品加入奖池末尾后，只计算它自己的概率
+    def add_prize_probability(self, slot):
+        if self.prize_sampler is None or len(self.prize_sampler.weights) != slot:
+            self.update_probabilities()
+            return
+        self.prize_sampler.append(0)
+        self.high_value_sampler.append(0)
+        self.refresh_prize_probability(slot)
+
+    # 奖品被移除后把它的权重清零；占位过多时压缩奖池并全量重建
+    def remove_prize_probability(self, slot):
+        self.prize_sampler.update(slot, 0)
+        self.high_value_sampler.update(slot, 0)
+        self.cooling_prizes.discard(slot)
+        if self.prize_pool.needs_compaction():
+            self.update_probabilities()
+
+    # 推进抽奖计数，并刷新仍在冷却中的奖品
+    def advance_draw_counter(self):
+        self.draw_counter += 1
+        for index in list(self.cooling_prizes):
+            self.refresh_prize_probability(index)
+
+    # 所有奖品的概率之和（含超支惩罚），由采样器维护，O(1)
+    def get_total_probability(self):
+        return self.prize_sampler.total() + self.get_penalty_multiplier() * self.high_value_sampler.total()
+
+    # 按概率抽取一个奖品下标；rand_value 为 [0, 1) 的随机数
+    def sample_prize(self, rand_value):
+        normal_total = self.prize_sampler.total()
+        high_total = self.get_penalty_multiplier() * self.high_value_sampler.total()
+        target = rand_value * (normal_total + high_total)
+        if target < normal_total:
+            return self.prize_sampler.sample(target / normal_total)
+        if high_total > 0:
+            return self.high_value_sampler.sample((target - normal_total) / high_total)
+        return None
+
+    # 全量重新计算所有奖品的概率（加载、修改设置或奖品被移除时使用）
+    def update_probabilities(self):
+        with self.metrics.timer('lottery_probability_update_seconds'):
+            normal_weights = []
+            high_weights = []
+            self.cooling_prizes.clear()
+
+            # 全量重建本来就是 O(n)，顺便去掉已删除奖品留下的占位
+            self.prize_pool.compact()
+            if isinstance(self.prize_pool, ColumnarPrizePool):
+                return self.update_probabilities_columnar()
+
+            expected_value = self.get_expected_draw_value()  # 整个过程中不变，只算一次
+            for index, prize in enumerate(self.prize_pool):
+                probability = self.compute_prize_probability(prize, expected_value)
+                prize['probability'] = probability
+                if self.is_high_value(prize, expected_value):
+                    normal_weights.append(0)
+                    high_weights.append(probability)
+                else:
+                    normal_weights.append(probability)
+                    high_weights.append(0)
 
-    # 否则进入奖品随机抽奖逻辑
-    cumulative_probabilities = []
-    current_sum = 0
+                if self.get_cooldown(prize) > 0:
+                    self.cooling_prizes.add(index)
+                else:
+                    prize['cooldown'] = 0
+
+            self.prize_sampler = create_sampler(normal_weights)
+            self.high_value_sampler = create_sampler(high_weights)
+
+            # 未中奖的概率 = 1 - 所有奖品概率之和
+            no_win_probability = 1 - (self.prize_sampler.total() + self.high_value_sampler.total())
+            return max(0, no_win_probability)  # 保证未中奖概率不小于0
+
+    # 列式奖池的全量更新：对数公式、冷却、上限和高价值分组都是整列运算
+    def update_probabilities_columnar(self):
+        np = self.prize_pool.np
+        expected_value = self.get_expected_draw_value()
+        probabilities, current_cooldown = self.prize_pool.compute_probabilities(expected_value, self.draw_counter)
+        self.prize_pool.store_probabilities(probabilities, current_cooldown)
+        high = self.prize_pool.high_value_mask(expected_value * HIGH_VALUE_FACTOR)
+
+        self.cooling_prizes.clear()
+        self.cooling_prizes.update(np.flatnonzero(current_cooldown > 0).tolist())
+        self.prize_sampler = create_sampler(np.where(high, 0.0, probabilities))
+        self.high_value_sampler = create_sampler(np.where(high, probabilities, 0.0))
+
+        no_win_probability = 1 - float(probabilities.sum())
+        return max(0, no_win_probability)
+
+    # 抽奖逻辑
+    def player_draw(self):
+        if not self.prize_pool:
+            return "奖池中没有奖品了。"
+
+        # 从随机数流取 0 到 1 之间的三个随机数：分别用于安慰奖分流、奖品抽取和安慰奖选择
+        today = date.today().strftime("%Y-%m-%d")
+        [(record, message)] = self.run_draws(self.rng.draw_values(1), today)
+        return message
+
+    # 按给定的随机数依次抽奖，最后只持久化一次，返回 [(日志记录, 提示信息), ...]
+    # random_values 的每一项是 (安慰奖分流, 奖品抽取, 安慰奖选择) 三个随机数，通常是 self.rng.draw_values(n)
+    # 按需取值，奖池抽空时提前停止，不多取
+    # 整个过程持有存档锁，抽奖前先同步其他进程的修改；开启审计日志时把保存成功的这批抽奖写入审计日志
+    def run_draws(self, random_values, draw_date):
+        with self.state_transaction():
+            history_start = len(self.draw_history)
+            rng_start, draw_counter_start = self.rng.counter, self.draw_counter
+            results = []
+            random_values = iter(random_values)
+            while self.prize_pool:
+                values = next(random_values, None)
+                if values is None:
+                    break
+                results.append(self.draw_once(*values, draw_date))
+            records = [record for record, _ in results]
+            if self.record_draws(records, history_start) and self.audit_log and records:  # 保存状态
+                self.append_audit_draws(rng_start, draw_counter_start, records)
+            return results
+
+    # 执行一次抽奖的状态变化（不落盘），返回 (日志记录, 提示信息)
+    def draw_once(self, split_value, pick_value, reward_value, draw_date):
+        start = time.perf_counter()
+        record, message, outcome = self.draw_outcome(split_value, pick_value, reward_value, draw_date)
+        self.metrics.inc('lottery_draws_total', outcome=outcome)
+        self.metrics.observe('lottery_draw_seconds', time.perf_counter() - start, outcome=outcome)
+        return record, message
+
+    # draw_once 的抽奖逻辑，额外返回结果类别（consolation / win / fallback）供运行指标使用
+    def draw_outcome(self, split_value, pick_value, reward_value, draw_date):
+        # 推进抽奖计数，冷却中的奖品随之衰减
+        self.advance_draw_counter()
+
+        # 如果随机值小于安慰奖阈值（默认 0.618），直接发放安慰奖
+        if split_value < self.consolation_threshold:
+            return self.give_consolation_reward(reward_value, draw_date) + ('consolation',)
+
+        # 否则进入奖品随机抽奖逻辑：在 [0, 总的累积概率] 范围内按权重抽取奖品
+        index = self.sample_prize(pick_value)
+
+        # 检查是否中奖
+        if index is not None and self.prize_pool.at(index)['remaining_fragments'] > 0:
+            prize = self.prize_pool.at(index)
+            removed = self.apply_prize_win(prize, draw_date)
+            message = f"您抽中了 {prize['name']} 的一个碎片！已抽中 {prize['total_fragments'] - prize['remaining_fragments']} / {prize['total_fragments']} 碎片。"
+            record = {"op": "win", "id": prize['id'], "date": draw_date}
+            if removed:
+                self.remove_prize_probability(index)  # 奖品被移除，权重清零
+            else:
+                self.refresh_prize_probability(index)  # 只更新这个奖品的概率
+            return record, message, 'win'
+
+        # 如果到达这里，表示没有命中任何奖品，返回安慰奖；这部分概率被浪费了，单独计数
+        self.metrics.inc('lottery_fallback_total', reason='no_prize' if index is None else 'no_fragments')
+        return self.give_consolation_reward(reward_value, draw_date) + ('fallback',)
+
+    # 批量抽奖：随机数一次性生成，冷却和碎片按顺序结算，最后只持久化一次
+    def player_draw_batch(self, n):
+        if not self.prize_pool:
+            return "奖池中没有奖品了。"
+
+        today = date.today().strftime("%Y-%m-%d")
+        history_start = len(self.draw_history)
+        value_before = self.total_won_value
+        results = self.run_draws(self.rng.draw_values(n), today)
+
+        draws_done = len(results)
+        consolation_count = sum(1 for record, _ in results if record['op'] == 'consolation')
+        won = {}  # 奖品名称 -> 抽中碎片数
+        for entry in self.draw_history[history_start:]:
+            if entry['result'] == '中奖':
+                won[entry['prize']] = won.get(entry['prize'], 0) + 1
+
+        lines = [f"共抽奖 {draws_done} 次：中奖 {draws_done - consolation_count} 次，安慰奖 {consolation_count} 次，"
+                 f"本次抽中价值 {self.total_won_value - value_before:.2f} RMB"]
+        for name, count in sorted(won.items(), key=lambda item: -item[1]):
+            lines.append(f"- {name}: {count} 个碎片")
+        if draws_done < n:
+            lines.append("奖池中的奖品已经抽完。")
+        return "\n".join(lines)
+
+    # 记录抽中奖品碎片后的状态变化（抽奖与日志回放共用），奖品被移除时返回 True
+    def apply_prize_win(self, prize, draw_date):
+        prize['remaining_fragments'] -= 1  # 减少碎片数
+        self.total_won_value += prize['fragment_value']  # 增加抽中奖品的价值
+
+        # 冷却机制：抽中后奖品概率降低
+        prize['cooldown'] = COOLDOWN_START  # 冷却减少该奖品的中奖概率
+        prize['cooldown_draw'] = self.draw_counter  # 从本次抽奖开始衰减
+
+        self.draw_history.append({
+            "result": "中奖",
+            "prize": prize['name'],
+            "fragment_won": prize['total_fragments'] - prize['remaining_fragments'],
+            "total_fragments": prize['total_fragments'],
+            "value": prize['fragment_value'],
+            "date": draw_date
+        })
 
-    # 更新概率并返回未中奖的概率
-    update_probabilities()
+        # 如果奖品的所有碎片都抽完了，减少该奖品的 limit_value
+        if prize['remaining_fragments'] == 0:
+            prize['limit_value'] -= 1
+            if prize['limit_value'] > 0:
+                prize['remaining_fragments'] = prize['total_fragments']  # 重置为完整碎片数
+            else:
+                self.prize_pool.remove(prize)  # 如果所有数量都用完，移除该奖品
+                return True
+        return False
+
+    # 从安慰奖列表中随机选择一个，返回 (日志记录, 提示信息)
+    def give_consolation_reward(self, reward_value, draw_date):
+        reward = None
+        if self.consolation_rewards:
+            reward = self.consolation_rewards[min(int(reward_value * len(self.consolation_rewards)), len(self.consolation_rewards) - 1)]
+        self.apply_consolation(reward, draw_date)
+        record = {"op": "consolation", "reward": reward, "date": draw_date}
+        if reward is None:
+            return record, "未中奖，当前没有设定安慰奖。"
+        return record, f"未中奖，安慰奖：{reward}"
+
+    # 记录安慰奖（抽奖与日志回放共用）
+    def apply_consolation(self, reward, draw_date):
+        if reward is None:
+            return
+        self.draw_history.append({
+            "result": "未中奖",
+            "consolation_reward": reward,
+            "date": draw_date
+        })
 
-    # 计算累积概率
-    for prize in prize_pool:
-        current_sum += prize['probability']
-        cumulative_probabilities.append((prize, current_sum))
+    # 持久化若干次抽奖：SQLite 后端写一个小事务，日志模式下追加日志，否则写完整快照
+    # history_start 为这些抽奖之前的历史记录条数；存档已被其他进程修改（抽奖作废、已重新加载）时返回 False
+    def record_draws(self, records, history_start):
+        with self.state_lock:
+            if not self.begin_write():
+                return False
+            self.write_draws(records, history_start)
+            return True
 
-    # 调整 rand_value 到 [0, 总的累积概率] 范围内
-    rand_value = random.uniform(0, current_sum)
+    def write_draws(self, records, history_start):
+        if self.storage_backend == 'sqlite':
+            touched = {record['id'] for record in records if record['op'] == 'win'}
+            self.get_sqlite_store().commit_draws(self.draw_history[history_start:],
+                                            {prize_id: self.prize_pool.get(prize_id) for prize_id in touched},
+                                            self.get_state_values())
+            self.draw_history.mark_committed()
+        elif USE_JOURNAL or self.writes_in_background():
+            self.append_journal_batch(records)  # 开启后台保存时抽奖也先写日志，达到间隔后的快照交给后台线程
+        else:
+            self.save_game_state(after_draws=True)
+
+    # 一次性向日志文件追加多条记录（批量抽奖只写一次文件），达到间隔后写完整快照
+    # 每次追加后 fsync，返回时这批抽奖已经落盘；新建日志文件时同时 fsync 目录
+    def append_journal_batch(self, records):
+        if not records:
+            return
+        lines = []
+        for record in records:
+            self.journal_seq += 1
+            lines.append(json.dumps(dict(record, seq=self.journal_seq), ensure_ascii=False, separators=(',', ':')) + "\n")
+        data = "".join(lines).encode('utf-8')
+        created = not os.path.exists(self.journal_file)
+        with open(self.journal_file, 'ab') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        if created:
+            fsync_directory(os.path.dirname(os.path.abspath(self.journal_file)))
+        self.metrics.inc('lottery_journal_appends_total')
+        self.metrics.inc('lottery_bytes_written_total', len(data), kind='journal')
+        self.pending_journal_records += len(records)
+        if self.pending_journal_records >= SNAPSHOT_INTERVAL:
+            self.save_game_state(after_draws=True)
+
+    # 读取日志中快照之后的记录；遇到写了一半的行时停止，repair 为 True 时顺便截断
+    def read_journal(self, after_seq, repair=True):
+        records = []
+        if not os.path.exists(self.journal_file):
+            return records
+        with open(self.journal_file, 'rb+' if repair else 'rb') as file:
+            offset = 0
+            for line in file:
+                try:
+                    record = json.loads(line.decode('utf-8'))
+                except (UnicodeDecodeError, json.JSONDecodeError):
+                    self.log(f"日志文件 {self.journal_file} 末尾存在不完整的记录，已忽略。")
+                    if repair:
+                        file.truncate(offset)
+                    break
+                offset += len(line)
+                if record.get('seq', 0) > after_seq:
+                    records.append(record)
+        return records
+
+    # 按日志记录回放抽奖，重建快照之后的状态（概率在回放结束后统一计算）
+    def replay_journal(self, records):
+        for record in records:
+            self.draw_counter += 1
+            if record['op'] == 'win':
+                prize = self.prize_pool.get(record['id'])
+                if prize is not None:
+                    self.apply_prize_win(prize, record['date'])
+            elif record['op'] == 'consolation':
+                self.apply_consolation(record.get('reward'), record['date'])
+            self.rng.counter += 3  # 每次抽奖使用三个随机数
+            self.journal_seq = record['seq']
+            self.pending_journal_records += 1
+
+    # 向审计日志写检查点：重放所需的完整状态（不含抽奖历史）
+    # 状态有抽奖以外的变化并保存时写入，之后的抽奖从这里开始重放
+    def append_audit_checkpoint(self):
+        with self.state_lock, self.mutex:
+            state = dict(self.get_state_values(), prize_pool=self.prize_pool.to_list(),
+                         consolation_rewards=self.consolation_rewards)
+            self.append_audit_line({'type': 'checkpoint', 'state': state})
+
+    # 向审计日志追加一批抽奖：起始的随机数流位置、抽奖计数和每次抽奖的记录（调用方持有内存状态锁）
+    def append_audit_draws(self, rng_start, draw_counter_start, records):
+        self.append_audit_line({'type': 'draws', 'rng': rng_start, 'draw_counter': draw_counter_start,
+                                'records': records})
+
+    def append_audit_line(self, item):
+        with open(self.audit_file, 'ab') as file:
+            file.write((json.dumps(item, ensure_ascii=False, separators=(',', ':')) + "\n").encode('utf-8'))
+
+    # 审计：从审计日志的每个检查点出发，在内存中用记录的随机数流重新抽奖（不读写存档），逐次与记录的结果比较
+    # 最后一个检查点之后的重放结果还要与当前状态（奖池、已抽取总价值、随机数流位置）比较；返回 (报告文本, 是否一致)
+    def audit_draws(self):
+        if not os.path.exists(self.audit_file):
+            return "没有审计日志（可在系统设置中开启）。", True
+        self.flush()
+        with self.mutex:
+            current = (self.prize_snapshot(), self.total_won_value, self.rng.seed, self.rng.counter, self.draw_counter)
+
+        problems = []
+        replayer = None  # 当前检查点的重放引擎；检查点之后出现不一致时为 None，直到下一个检查点
+        checkpoints = draws = 0
+        start = time.perf_counter()
+        with open(self.audit_file, 'rb') as file:
+            for line_number, line in enumerate(file, 1):
+                try:
+                    item = json.loads(line.decode('utf-8'))
+                except (UnicodeDecodeError, json.JSONDecodeError):
+                    problems.append(f"第 {line_number} 行无法解析（可能是写了一半的记录）。")
+                    replayer = None
+                    continue
+                if item['type'] == 'checkpoint':
+                    replayer = LotteryEngine(self.data_dir, verbose=False)
+                    replayer.apply_game_state(item['state'])
+                    replayer.update_probabilities()
+                    checkpoints += 1
+                    continue
+                if replayer is None:
+                    if not checkpoints:
+                        problems.append(f"第 {line_number} 行：抽奖记录之前没有检查点，无法重放。")
+                    continue
+                if (item['rng'], item['draw_counter']) != (replayer.rng.counter, replayer.draw_counter):
+                    problems.append(f"第 {line_number} 行：记录的随机数流位置 {item['rng']} / 抽奖计数 {item['draw_counter']}，"
+                                    f"重放为 {replayer.rng.counter} / {replayer.draw_counter}。")
+                    replayer = None
+                    continue
+                for k, (record, values) in enumerate(zip(item['records'], replayer.rng.draw_values(len(item['records'])))):
+                    replayed, _ = replayer.draw_once(*values, record['date'])
+                    draws += 1
+                    if replayed != record:
+                        problems.append(f"第 {line_number} 行第 {k + 1} 次抽奖：记录为 {record}，重放为 {replayed}。")
+                        replayer = None
+                        break
+
+        if replayer is not None:
+            replayed = (replayer.prize_snapshot(), replayer.total_won_value, replayer.rng.seed, replayer.rng.counter,
+                        replayer.draw_counter)
+            names = ["奖池", "已抽取奖品总价值", "随机数种子", "随机数流位置", "抽奖计数"]
+            for name, expected, actual in zip(names, replayed, current):
+                if name == "已抽取奖品总价值" and math.isclose(expected, actual, abs_tol=1e-6):
+                    continue
+                if expected != actual:
+                    problems.append(f"重放结束后的{name}与当前状态不一致。")
+        lines = [f"审计日志: {checkpoints} 个检查点，重放 {draws} 次抽奖，用时 {time.perf_counter() - start:.2f} 秒。"]
+        if problems:
+            lines.append(f"发现 {len(problems)} 处不一致：")
+            lines.extend(f"- {problem}" for problem in problems[:20])
+        else:
+            lines.append("所有抽奖结果与重放一致，当前状态与重放结果一致。")
+        return "\n".join(lines), not problems
+
+    # 奖池中和抽奖结果有关的字段（审计比较用）
+    def prize_snapshot(self):
+        return [(prize['id'], prize['name'], prize['remaining_fragments'], prize['limit_value']) for prize in self.prize_pool]
+
+    # 开启或关闭审计日志；开启时立即写一个检查点
+    def set_audit_log(self, enabled):
+        self.audit_log = enabled
+        self.save_settings()
+        if enabled:
+            self.append_audit_checkpoint()
+
+    # 当前游戏状态的快照（即保存到文件的内容）
+    def get_game_state(self):
+        return dict(
+            self.get_state_values(),
+            prize_pool=self.prize_pool.to_list(),
+            draw_history=self.draw_history.to_list(),
+            history_archive=self.draw_history.archived,  # 已归档历史的汇总（归档本身在 archive_dir 中）
+            consolation_rewards=self.consolation_rewards  # 保存安慰奖列表
+        )
 
-    # 检查是否中奖
-    for prize, cumulative_probability in cumulative_probabilities:
-        if rand_value <= cumulative_probability and prize['remaining_fragments'] > 0:
-            prize['remaining_fragments'] -= 1  # 减少碎片数
-            total_won_value += prize['fragment_value']  # 增加抽中奖品的价值
+    # 游戏状态中的标量部分（每次抽奖后 SQLite 后端只需要更新这些设置）
+    def get_state_values(self):
+        return {
+            'total_won_value': self.total_won_value,
+            'total_pool_value': self.total_pool_value,
+            'draws_per_day': self.draws_per_day,
+            'consolation_threshold': self.consolation_threshold,
+            'prize_id_counter': self.prize_id_counter,
+            'letter_counter': self.letter_counter,
+            'journal_seq': self.journal_seq,  # 快照已包含的最后一条日志序号
+            'draw_counter': self.draw_counter,  # 累计抽奖次数（冷却衰减的时钟）
+            'rng_seed': self.rng.seed,  # 随机数流的种子
+            'rng_counter': self.rng.counter  # 随机数流已使用的个数
+        }
+
+    # 保存游戏状态；存档已被其他进程修改（修改作废、已重新加载）时返回 False
+    # after_draws 为 True 表示这些抽奖已经写入日志，快照只用来缩短日志：开启后台保存时只登记请求，由后台线程合并写入
+    # after_draws 为 False（默认）表示状态可能有抽奖以外的变化：立即写入，开启审计日志时保存成功后写检查点（同在存档锁内）
+    def save_game_state(self, after_draws=False):
+        if after_draws and self.writes_in_background():
+            self.writer.request()
+            return True
+        with self.state_lock:
+            saved = self.write_game_state()
+            if saved and self.audit_log and not after_draws:
+                self.append_audit_checkpoint()
+            return saved
+
+    # 写入完整快照（原子替换存档文件）；存档已被其他进程修改时不覆盖，返回 False
+    # 快照在内存状态锁内序列化，写文件时不再持有该锁，抽奖可以继续进行
+    def write_game_state(self):
+        with self.state_lock, self.metrics.timer('lottery_save_seconds', backend=self.storage_backend):
+            with self.mutex:
+                if not self.begin_write():
+                    return False
+                if self.storage_backend == 'sqlite':
+                    # 抽奖历史已逐条写入，不需要重写（也不从数据库读出）
+                    self.get_sqlite_store().save_snapshot(dict(self.get_state_values(), prize_pool=self.prize_pool.to_list(),
+                                                               consolation_rewards=self.consolation_rewards))
+                    return True
+                text = json.dumps(self.get_game_state())  # 默认转义非 ASCII 字符，字符数即字节数
+            write_file_atomic(self.save_file, text)
+            self.metrics.observe('lottery_save_bytes', len(text), buckets=BYTES_BUCKETS)
+            self.metrics.inc('lottery_bytes_written_total', len(text), kind='snapshot')
+            self.clear_journal()
+            return True
 
-            # 冷却机制：抽中后奖品概率降低
-            prize['cooldown'] = 0.2  # 冷却减少该奖品的中奖概率
+    # 快照写入后清空日志
+    def clear_journal(self):
+        self.pending_journal_records = 0
+        if os.path.exists(self.journal_file):
+            open(self.journal_file, 'w').close()
+
+    # 加载游戏状态（持有存档锁，避免读到其他进程写了一半的日志）
+    # prepare_draws=False 时不计算概率、不归档历史，只供只读的查询使用（命令行的 history / stats / export）
+    def load_game_state(self, prepare_draws=True):
+        with self.state_lock, self.mutex, self.metrics.timer('lottery_load_seconds'):
+            self.state_version = self.state_lock.read_version()
+            self.load_settings()
+            if self.storage_backend == 'sqlite':
+                self.load_sqlite_state(prepare_draws)
+            else:
+                self.load_game_state_from_json(prepare_draws)
+            if self.rng_seed_generated:
+                self.save_generated_seed()
+
+    # 旧存档没有种子时，在任何抽奖使用新种子之前立即写入存档（不经过后台保存线程），
+    # 否则每次加载都会换一个种子，审计重放时与记录的结果对不上
+    def save_generated_seed(self):
+        self.rng_seed_generated = False
+        if self.write_game_state() and self.audit_log:
+            self.append_audit_checkpoint()
+
+    # 从 JSON 快照和抽奖日志加载游戏状态
+    def load_game_state_from_json(self, prepare_draws=True):
+        if os.path.exists(self.save_file):
+            with open(self.save_file, 'r') as file:
+                text = file.read()
+            try:
+                game_state = json.loads(text)
+            except json.JSONDecodeError:
+                # 不直接覆盖损坏的存档：连同日志一起改名备份，再初始化
+                backup_suffix = f".corrupt-{time.strftime('%Y%m%d-%H%M%S')}"
+                os.replace(self.save_file, self.save_file + backup_suffix)
+                if os.path.exists(self.journal_file):
+                    os.replace(self.journal_file, self.journal_file + backup_suffix)
+                self.log(f"无法加载文件 {self.save_file}，文件可能为空或格式损坏，已备份为 "
+                         f"{self.save_file + backup_suffix}。正在初始化游戏状态...")
+                self.initialize_game_state()  # 如果解析失败，初始化状态
+                return
+            self.apply_game_state(game_state)
+
+            # 回放快照之后追加的抽奖日志；只读加载不截断日志末尾不完整的记录
+            self.replay_journal(self.read_journal(self.journal_seq, repair=prepare_draws))
+            if not prepare_draws:
+                return
+            self.update_probabilities()
+            if self.draw_history.needs_compaction(self.get_archive_cutoff()):
+                self.log(self.compact_history())
+        else:
+            self.log(f"未找到游戏状态文件 {self.save_file}，正在初始化...")
+            self.initialize_game_state()
+
+    # 读取本机设置（存储后端）
+    def load_settings(self):
+        if os.path.exists(self.settings_file):
+            with open(self.settings_file, 'r') as file:
+                settings = json.load(file)
+            self.storage_backend = settings.get('storage_backend', self.storage_backend)
+            self.audit_log = settings.get('audit_log', self.audit_log)
+            self.history_hot_days = settings.get('history_hot_days', self.history_hot_days)
+            # 这里可能持有存档锁，只负责开启；关闭要等后台线程写完，由 set_background_writer 在锁外进行
+            if settings.get('background_writer', BACKGROUND_WRITER):
+                self.set_background_writer(True)
+        elif BACKGROUND_WRITER:
+            self.set_background_writer(True)
+
+    # 保存本机设置
+    def save_settings(self):
+        write_json_atomic(self.settings_file, {'storage_backend': self.storage_backend,
+                                               'background_writer': self.writer is not None,
+                                               'audit_log': self.audit_log,
+                                               'history_hot_days': self.history_hot_days})
+
+    # 打开（或复用）SQLite 数据库连接
+    def get_sqlite_store(self):
+        if self.sqlite_store is None:
+            from lottery_sqlite import SqliteStore
+            self.sqlite_store = SqliteStore(self.db_file)
+        return self.sqlite_store
+
+    # 从 SQLite 加载游戏状态；数据库为空时从 JSON 存档一次性迁移
+    def load_sqlite_state(self, prepare_draws=True):
+        store = self.get_sqlite_store()
+        if store.is_empty():
+            self.log(f"数据库 {self.db_file} 中没有存档，正在从 {self.save_file} 迁移...")
+            self.log(self.migrate_json_to_sqlite())
+            return
+        self.apply_game_state(store.load())
+        self.draw_history = SqliteDrawHistory(store)
+        if prepare_draws:
+            self.update_probabilities()
+
+    # 把 JSON 存档（含抽奖日志）迁移到 SQLite；原 JSON 文件保留作为备份
+    def migrate_json_to_sqlite(self):
+        with self.state_lock:
+            self.storage_backend = 'json'
+            self.load_game_state_from_json()
+            self.restore_archived_history()
+            self.storage_backend = 'sqlite'
+            self.bump_state_version()
+            self.get_sqlite_store().save_snapshot(self.get_game_state(), history=True)
+            self.draw_history = SqliteDrawHistory(self.get_sqlite_store())
+            self.save_settings()
+        return f"已迁移 {len(self.prize_pool)} 个奖品、{len(self.draw_history)} 条抽奖历史到 {self.db_file}。"
+
+    # 切换存储后端：把当前内存中的完整状态写入新的后端
+    def switch_storage_backend(self, backend):
+        if backend == self.storage_backend:
+            return f"当前已经在使用 {backend} 存储。"
+        with self.state_lock:
+            if not self.begin_write():
+                return "存档已被另一个进程修改，已重新加载，请重新切换。"
+            self.storage_backend = backend
+            if backend == 'sqlite':
+                self.restore_archived_history()
+                self.get_sqlite_store().save_snapshot(self.get_game_state(), history=True)
+                self.draw_history = SqliteDrawHistory(self.get_sqlite_store())
+            else:
+                self.draw_history = self.create_draw_history(self.draw_history.all_entries())  # 从数据库读出完整历史
+                self.save_game_state()
+            self.save_settings()
+        return f"已切换到 {backend} 存储。"
+
+    def create_draw_history(self, entries=(), archived=None):
+        return DrawHistory(entries, HistoryArchive(self.archive_dir), archived)
+
+    # 归档的分界月份（YYYY-MM）：早于该月的整月历史移入归档
+    def get_archive_cutoff(self):
+        return (date.today() - timedelta(days=self.history_hot_days)).strftime("%Y-%m")
+
+    # 把保留天数之前的整月抽奖历史移入归档，存档里只留下最近的历史和归档部分的汇总
+    # 启动时只解析这部分，查看旧的历史时才读取归档；只用于 JSON 存储（SQLite 按日期索引读取历史）
+    def compact_history(self):
+        if self.storage_backend != 'json':
+            return "SQLite 存储不需要归档抽奖历史。"
+        with self.state_transaction():
+            moved = self.draw_history.compact(self.get_archive_cutoff())
+            if not moved:
+                return "没有需要归档的抽奖历史。"
+            if not self.save_game_state():
+                return "存档已被另一个进程修改，已重新加载，本次未归档。"
+        return (f"已归档 {moved} 条 {self.history_hot_days} 天前的抽奖历史到 {self.archive_dir}，"
+                f"存档中保留 {len(self.draw_history)} 条。")
+
+    # 把归档的历史读回内存（切换到 SQLite 前调用，数据库保存完整的历史）
+    # 归档文件不删除：归档汇总清空后，下次归档会从头覆盖这些文件
+    def restore_archived_history(self):
+        if self.draw_history.archived['entries']:
+            self.draw_history = self.create_draw_history(self.draw_history.all_entries())
+
+    # 用快照设置当前游戏状态（不读写文件，概率需另行计算）
+    def apply_game_state(self, game_state):
+        self.total_won_value = game_state.get('total_won_value', 0)
+        self.total_pool_value = game_state.get('total_pool_value', 3000)
+        self.draws_per_day = game_state.get('draws_per_day', 8)
+        self.consolation_threshold = game_state.get('consolation_threshold', CONSOLATION_THRESHOLD)
+        self.prize_id_counter = game_state.get('prize_id_counter', 1)
+        self.letter_counter = game_state.get('letter_counter', 0)
+        self.draw_history = self.create_draw_history(game_state.get('draw_history', []),
+                                                     game_state.get('history_archive'))
+        self.consolation_rewards = game_state.get('consolation_rewards', [])
+        self.journal_seq = game_state.get('journal_seq', 0)
+        self.draw_counter = game_state.get('draw_counter', 0)
+        self.rng.reset(game_state.get('rng_seed'), game_state.get('rng_counter', 0))  # 旧存档没有种子，从现在开始使用新种子
+        self.rng_seed_generated = game_state.get('rng_seed') is None  # 新种子还没有写入存档
+        self.pending_journal_records = 0
+
+        # 校验是否有必要的字段, 初始化 fragment 值
+        prizes = game_state.get('prize_pool', [])
+        for prize in prizes:
+            if 'fragment_value' not in prize:
+                prize['fragment_value'] = prize['total_value'] / prize['total_fragments']
+            if 'remaining_fragments' not in prize:
+                prize['remaining_fragments'] = prize['total_fragments']
+            if 'cooldown_draw' not in prize:
+                prize['cooldown_draw'] = self.draw_counter  # 旧存档的冷却从现在开始衰减
+        self.prize_pool = create_prize_pool(prizes)
+
+    # 初始化游戏状态并保存到文件
+    def initialize_game_state(self):
+        self.prize_pool = create_prize_pool()
+        self.total_won_value = 0
+        self.total_pool_value = 3000
+        self.draws_per_day = 8
+        self.consolation_threshold = CONSOLATION_THRESHOLD
+        self.prize_id_counter = 1
+        self.letter_counter = 0
+        self.draw_history = self.create_draw_history()
+        self.consolation_rewards = []
+        self.journal_seq = 0
+        self.draw_counter = 0
+        self.rng.reset()
+        self.save_game_state()  # 保存初始化后的状态
+
+    # 查看奖池函数
+    def view_prizes(self):
+        if not self.prize_pool:
+            return "奖池中没有奖品。"
+
+        prize_info = []
+        for prize in self.prize_pool:
+            probability = self.get_prize_probability(prize)
+            prize_info.append(
+                f"编号: {prize['id']} - {prize['name']} - 价值: {prize['total_value']} RMB, 概率: {probability:.2%}, "
+                f"剩余碎片: {prize['remaining_fragments']} / {prize['total_fragments']}"
+            )
+
+        # 返回文本形式的奖池信息
+        return "\n".join(prize_info)
+
+    # 期望值计算（解析计算，不模拟）：单次抽奖的期望价值、按当前状态的每月期望支出与每月奖池的比较，
+    # 以及每个奖品集齐碎片的期望抽奖次数；奖品表按集齐当前一份的快慢排序，最多列出 limit 个
+    def view_expected_values(self, limit=20):
+        if not self.prize_pool:
+            return "奖池中没有奖品。"
+        if get_numpy() is None:
+            return "期望值计算需要 numpy。"
+        with self.mutex:
+            analysis = analyze_pool(self.prize_pool, self.total_pool_value, self.draws_per_day,
+                                    self.total_won_value, self.draw_counter, self.consolation_threshold)
+
+        np = get_numpy()
+        spend_ratio = analysis['monthly_spend'] / self.total_pool_value
+        lines = [
+            f"单次抽奖: 进入奖品抽奖的概率 {1 - self.consolation_threshold:.1%}，期望价值 {analysis['draw_value']:.2f} RMB"
+            f"（设计值 {analysis['expected_value']:.2f} RMB），标准差 {math.sqrt(max(0, analysis['draw_variance'])):.2f} RMB",
+            f"每月 {analysis['monthly_draws']} 次抽奖: 期望支出 {analysis['monthly_spend']:.2f} RMB"
+            f" ± {analysis['monthly_spend_std']:.2f}，每月奖池 {self.total_pool_value} RMB（{spend_ratio:.1%}）",
+            "集齐碎片的期望抽奖次数（其他奖品的概率按当前值计算）:",
+        ]
+        order = np.argsort(analysis['draws_to_complete'], kind='stable')[:limit]
+        for index in order.tolist():
+            complete = float(analysis['draws_to_complete'][index])
+            exhaust = float(analysis['draws_to_exhaust'][index])
+            lines.append(
+                f"- {analysis['names'][index]}: 每次抽奖中奖 {float(analysis['draw_probability'][index]):.3%}，"
+                f"集齐当前一份 {complete:.1f} 次（约 {complete / self.draws_per_day:.1f} 天），"
+                f"抽完全部 {exhaust:.1f} 次（约 {exhaust / self.draws_per_day:.1f} 天）")
+        if len(self.prize_pool) > limit:
+            lines.append(f"……共 {len(self.prize_pool)} 个奖品，只列出最快集齐的 {limit} 个")
+        return "\n".join(lines)
+
+    # 查看抽奖历史（分页，第 0 页为最新记录）
+    def view_draw_history(self, page_number=0):
+        if not self.draw_history.total_count():
+            return "没有抽奖历史。"
+        lines = [f"第 {page_number + 1} / {self.draw_history.page_count()} 页（共 {self.draw_history.total_count()} 条）"]
+        lines.extend(format_history_entry(entry) for entry in self.draw_history.page(page_number))
+        return "\n".join(lines)
+
+    # 查看一段时间内的抽奖汇总（本周 / 本月），只读取这段时间的每日汇总
+    def view_history_summary(self, period):
+        today = date.today()
+        if period == 'week':
+            start = today - timedelta(days=today.weekday())
+            title = "本周"
+        else:
+            start = today.replace(day=1)
+            title = "本月"
+        summary = self.draw_history.summary(start.strftime("%Y-%m-%d"), today.strftime("%Y-%m-%d"))
+        lines = [f"{title}（{start} 至 {today}）: 中奖 {summary['wins']} 次，价值 {summary['value']:.2f} RMB，"
+                 f"安慰奖 {summary['consolations']} 次"]
+        for name, (wins, value) in sorted(summary['prizes'].items(), key=lambda item: -item[1][1]):
+            lines.append(f"- {name}: {wins} 个碎片，价值 {value:.2f} RMB")
+        return "\n".join(lines)
+
+    # 查看已抽取奖品的总价值
+    def view_won_prize_total(self):
+        return f"已抽取奖品总价值: {self.total_won_value} RMB"
+
+    # 查看用户拥有的碎片
+    def view_fragments(self):
+        fragment_info = [
+            f"{prize['name']} - 已拥有 {prize['total_fragments'] - prize['remaining_fragments']} / {prize['total_fragments']} 碎片"
+            for prize in self.prize_pool if prize['remaining_fragments'] < prize['total_fragments']]
+        return "\n".join(fragment_info) if fragment_info else "您没有任何碎片。"
+
+    # 查看安慰奖
+    def view_consolation_rewards(self):
+        return "\n".join([f"{idx + 1}. {reward}" for idx, reward in
+                          enumerate(self.consolation_rewards)]) if self.consolation_rewards else "当前没有设定任何安慰奖。"
+
+    # 查看运行指标（本次启动以来）：各类抽奖次数、概率更新、存档读写的次数和耗时
+    def view_metrics(self):
+        metrics = self.metrics
+        draws = {outcome: metrics.counter_value('lottery_draws_total', outcome=outcome)
+                 for outcome in ('consolation', 'win', 'fallback')}
+        total_draws = sum(draws.values())
+        lines = [f"抽奖 {total_draws} 次：直接安慰奖 {draws['consolation']}，中奖 {draws['win']}，"
+                 f"未抽中奖品转安慰奖 {draws['fallback']}"]
+        fallback = {reason: metrics.counter_value('lottery_fallback_total', reason=reason)
+                    for reason in ('no_prize', 'no_fragments')}
+        if draws['fallback']:
+            lines.append(f"  未抽中原因: 没有可抽的奖品概率 {fallback['no_prize']}，"
+                         f"抽中的奖品没有剩余碎片 {fallback['no_fragments']}")
+        lines.append(f"单个奖品概率刷新 {metrics.counter_value('lottery_probability_refreshes_total')} 次，"
+                     f"日志追加 {metrics.counter_value('lottery_journal_appends_total')} 次")
+        cache = probability_cache_stats()
+        lookups = cache['hits'] + cache['misses']
+        hit_rate = f"，命中率 {cache['hits'] / lookups:.1%}" if lookups else ""
+        lines.append(f"概率缓存（本进程）: 命中 {cache['hits']} 次，未命中 {cache['misses']} 次{hit_rate}，"
+                     f"条目 {cache['entries']} / {cache['max_entries']}，因修改设置清空 {cache['clears']} 次")
+        titles = {'lottery_draw_seconds': "抽奖", 'lottery_probability_update_seconds': "全量概率更新",
+                  'lottery_save_seconds': "保存存档", 'lottery_load_seconds': "加载存档"}
+        for (name, labels), histogram in sorted(self.metrics.histograms.items()):
+            if name not in titles:
+                continue
+            label_text = "".join(f" {value}" for _, value in labels)
+            lines.append(f"{titles[name]}{label_text}: {histogram.count} 次，平均 {histogram.sum / histogram.count * 1000:.3f} ms，"
+                         f"P50 ≤ {histogram.quantile(0.5) * 1000:g} ms，P99 ≤ {histogram.quantile(0.99) * 1000:g} ms")
+        lines.append(f"写入字节: 快照 {metrics.counter_value('lottery_bytes_written_total', kind='snapshot')}，"
+                     f"日志 {metrics.counter_value('lottery_bytes_written_total', kind='journal')}")
+        return "\n".join(lines)
+
+    # 生成概率分布图（PNG / SVG）到缓存目录，返回 (图片路径, 是否使用了缓存)
+    # 缓存按奖品名称和概率向量的哈希命名，奖池和概率没变时直接返回已有的图片
+    def probability_chart(self, top_k=CHART_TOP_K, log_scale=False, file_format='png'):
+        with self.mutex:
+            names = [prize['name'] for prize in self.prize_pool]
+            probabilities = [self.get_prize_probability(prize) for prize in self.prize_pool]
+        key = chart_cache_key(names, probabilities, top_k, log_scale, file_format)
+        path = os.path.join(self.chart_dir, f"probability-{key}.{file_format}")
+        cached = os.path.exists(path)
+        if cached:
+            os.utime(path)  # 记录最近使用，清理缓存时保留
+        else:
+            os.makedirs(self.chart_dir, exist_ok=True)
+            render_probability_chart(*chart_series(names, probabilities, top_k), path, log_scale)
+            prune_chart_cache(self.chart_dir)
+        self.metrics.inc('lottery_charts_total', cached='true' if cached else 'false')
+        return path, cached
+
+    # 把运行指标导出为 Prometheus 文本文件
+    def export_metrics(self, path=None):
+        path = path or os.path.join(self.data_dir, METRICS_FILE)
+        gauges = {
+            'lottery_prizes': len(self.prize_pool),
+            'lottery_history_entries': self.draw_history.total_count(),
+            'lottery_history_archived_entries': self.draw_history.archived['entries'],
+            'lottery_won_value': self.total_won_value,
+            'lottery_pool_value': self.total_pool_value,
+        }
+        cache = probability_cache_stats()
+        gauges.update({
+            'lottery_probability_cache_hits_total': cache['hits'],
+            'lottery_probability_cache_misses_total': cache['misses'],
+            'lottery_probability_cache_entries': cache['entries'],
+        })
+        write_file_atomic(path, self.metrics.to_prometheus(gauges))
+        return f"运行指标已导出到 {path}。"
+
+    # 从 CSV / JSONL 文件导入奖品（流式读取，只计算一次概率、保存一次），返回导入报告
+    def import_prizes(self, path):
+        if file_format(path) is None:
+            return "只支持导入 .csv 和 .jsonl 文件。"
+        try:
+            report = self.add_prizes(read_prize_file(path))
+        except (OSError, UnicodeDecodeError, csv.Error) as error:
+            return f"无法读取文件 {path}：{error}，没有导入任何奖品。"
+        return format_import_report(report)
+
+    # 把奖池导出为 CSV / JSONL（逐行写入），导出的文件可以直接再导入（按 name、value、count 列）
+    def export_prizes(self, path):
+        file_type = file_format(path)
+        if file_type is None:
+            return "只支持导出为 .csv 和 .jsonl 文件。"
+        rows = ({
+            'id': prize['id'],
+            'name': prize['name'],
+            'value': prize['total_value'],
+            'count': prize['limit_value'],
+            'total_fragments': prize['total_fragments'],
+            'remaining_fragments': prize['remaining_fragments'],
+            'probability': self.get_prize_probability(prize),
+        } for prize in self.prize_pool)
+        with self.mutex, open_atomic(path) as file:
+            count = write_export_rows(file, file_type, PRIZE_EXPORT_COLUMNS, rows)
+        return f"已导出 {count} 个奖品到 {path}。"
+
+    # 把抽奖历史（包含归档）按时间顺序导出为 CSV / JSONL，一次只读取一个月的归档
+    def export_history(self, path):
+        file_type = file_format(path)
+        if file_type is None:
+            return "只支持导出为 .csv 和 .jsonl 文件。"
+        # 锁内只取快照（内存中记录的副本和各月归档的有效长度，SQLite 则是查询结果），写文件时不持有锁，抽奖可以继续
+        # 导出的是取快照那一刻的历史；之后的抽奖和归档不影响已取的快照
+        with self.mutex:
+            entries = self.draw_history.iter_all()
+        with open_atomic(path) as file:
+            count = write_export_rows(file, file_type, HISTORY_EXPORT_COLUMNS, entries)
+        return f"已导出 {count} 条抽奖历史到 {path}。"
+
+    # 添加一个安慰奖并保存，已存在时返回 False
+    def add_consolation_reward(self, reward):
+        with self.mutex:
+            if reward in self.consolation_rewards:
+                return False
+            self.consolation_rewards.append(reward)
+        self.save_game_state()
+        return True
+
+
+engine = LotteryEngine()  # 交互菜单使用的默认引擎（当前目录下的存档）
 
-            draw_history.append({
-                "result": "中奖",
-                "prize": prize['name'],
-                "fragment_won": prize['total_fragments'] - prize['remaining_fragments'],
-                "total_fragments": prize['total_fragments'],
-                "value": prize['fragment_value'],
-                "date": date.today().strftime("%Y-%m-%d")
-            })
 
-            # 如果奖品的所有碎片都抽完了，减少该奖品的 limit_value
-            if prize['remaining_fragments'] == 0:
-                prize['limit_value'] -= 1
-                if prize['limit_value'] > 0:
-                    prize['remaining_fragments'] = prize['total_fragments']  # 重置为完整碎片数
-                else:
-                    prize_pool.remove(prize)  # 如果所有数量都用完，移除该奖品
-
-            update_probabilities()  # 更新概率
-            save_game_state()  # 保存状态
-            return f"您抽中了 {prize['name']} 的一个碎片！已抽中 {prize['total_fragments'] - prize['remaining_fragments']} / {prize['total_fragments']} 碎片。"
-
-    # 如果到达这里，表示没有命中任何奖品，返回安慰奖
-    return give_consolation_reward()
-
-# 从安慰奖列表中随机选择一个
-def give_consolation_reward():
-    if not consolation_rewards:
-        return "未中奖，当前没有设定安慰奖。"
-    reward = random.choice(consolation_rewards)
-    draw_history.append({
-        "result": "未中奖",
-        "consolation_reward": reward,
-        "date": date.today().strftime("%Y-%m-%d")
-    })
-    save_game_state()
-    return f"未中奖，安慰奖：{reward}"
-
-
-# 保存游戏状态
-def save_game_state():
-    game_state = {
-        'prize_pool': prize_pool,
-        'total_won_value': total_won_value,
-        'total_pool_value': total_pool_value,
-        'draws_per_day': draws_per_day,
-        'prize_id_counter': prize_id_counter,
-        'letter_counter': letter_counter,
-        'draw_history': draw_history,
-        'consolation_rewards': consolation_rewards  # 保存安慰奖列表
-    }
-    with open(SAVE_FILE, 'w') as file:
-        json.dump(game_state, file)
-
-# 加载游戏状态
-def load_game_state():
-    global prize_pool, total_won_value, total_pool_value, draws_per_day, prize_id_counter, letter_counter, draw_history, consolation_rewards
-    if os.path.exists(SAVE_FILE):
-        with open(SAVE_FILE, 'r') as file:
-            try:
-                game_state = json.load(file)
-                prize_pool = game_state.get('prize_pool', [])
-                total_won_value = game_state.get('total_won_value', 0)
-                total_pool_value = game_state.get('total_pool_value', 3000)
-                draws_per_day = game_state.get('draws_per_day', 8)
-                prize_id_counter = game_state.get('prize_id_counter', 1)
-                letter_counter = game_state.get('letter_counter', 0)
-                draw_history = game_state.get('draw_history', [])
-                consolation_rewards = game_state.get('consolation_rewards', [])
-
-                # 校验是否有必要的字段, 初始化 fragment 值
-                for prize in prize_pool:
-                    if 'fragment_value' not in prize:
-                        prize['fragment_value'] = prize['total_value'] / prize['total_fragments']
-                    if 'remaining_fragments' not in prize:
-                        prize['remaining_fragments'] = prize['total_fragments']
-                update_probabilities()
+# 批量交互输入奖品
+# 每行输入的奖品一起添加：只计算一次概率、保存一次
+def add_prizes_interactive():
+    print("请输入奖品信息，每个奖品格式为 '名称,价值,数量'，用空格分隔不同奖品，输入 'done' 完成:")
+    while True:
+        prizes_input = input("批量输入奖品: ")
+        if prizes_input.lower() == 'done':
+            break
+        prizes_list = prizes_input.split()
+        records = []
+        for position, prize in enumerate(prizes_list):
+            fields = prize.split(',')
+            record = dict(zip(['name', 'value', 'count'], fields)) if len(fields) == 3 else None  # count 是奖品的数量
+            records.append((position, record))
+        report = engine.add_prizes(records)
+        if not report['saved']:
+            print("存档已被另一个进程修改，已重新加载，本次添加的奖品未保存。")
+        for position, prize_name in report['duplicates']:
+            print(f"输入错误：奖品名称 '{prize_name}' 已经存在，请重新输入。")
+        for position, reason in report['errors']:
+            print(f"输入格式有误: {prizes_list[position]}（{reason}）")
 
-            except json.JSONDecodeError:
-                print(f"无法加载文件 {SAVE_FILE}，文件可能为空或格式损坏。正在初始化游戏状态...")
-                initialize_game_state()  # 如果解析失败，初始化状态
-    else:
-        print(f"未找到游戏状态文件 {SAVE_FILE}，正在初始化...")
-        initialize_game_state()
-
-
-# 初始化游戏状态并保存到文件
-def initialize_game_state():
-    global prize_pool, total_won_value, total_pool_value, draws_per_day, prize_id_counter, letter_counter, draw_history, consolation_rewards
-    prize_pool = []
-    total_won_value = 0
-    total_pool_value = 3000
-    draws_per_day = 8
-    prize_id_counter = 1
-    letter_counter = 0
-    draw_history = []
-    consolation_rewards = []
-    save_game_state()  # 保存初始化后的状态
 
 # 修改奖品的名称、价值和数量
 def modify_prize(prize_id):
-    prize_to_modify = next((p for p in prize_pool if p['id'] == prize_id), None)
+    prize_to_modify = engine.prize_pool.get(prize_id)
 
     if prize_to_modify:
         new_name = input(f"输入新的奖品名称 (当前: {prize_to_modify['name']}): ")
+        if new_name != prize_to_modify['name'] and engine.prize_pool.has_name(new_name):
+            return f"输入错误：奖品名称 '{new_name}' 已经存在。"
         new_value = int(input(f"输入新的奖品价值 (当前: {prize_to_modify['total_value']} RMB): "))
         new_fragments = int(input(f"输入新的碎片数量 (当前: {prize_to_modify['total_fragments']}): "))
         limit_value = int(input(f"输入新的奖品数量 (当前: {prize_to_modify['limit_value']}): "))
-        prize_to_modify.update({
-            'name': new_name,
-            'total_value': new_value,
-            'total_fragments': new_fragments,
-            'fragment_value': new_value / new_fragments,
-            'remaining_fragments': new_fragments,
-            'limit_value': limit_value
-        })
-        update_probabilities()
-        save_game_state()
+        with engine.state_transaction():
+            # 输入期间其他进程可能修改过存档，事务开始时已重新加载，按编号重新查找
+            prize_to_modify = engine.prize_pool.get(prize_id)
+            if not prize_to_modify:
+                return f"未找到编号为 {prize_id} 的奖品。"
+            if new_name != prize_to_modify['name'] and engine.prize_pool.has_name(new_name):
+                return f"输入错误：奖品名称 '{new_name}' 已经存在。"
+            engine.prize_pool.rename(prize_to_modify, new_name)
+            prize_to_modify.update({
+                'total_value': new_value,
+                'total_fragments': new_fragments,
+                'fragment_value': new_value / new_fragments,
+                'remaining_fragments': new_fragments,
+                'limit_value': limit_value
+            })
+            engine.refresh_prize_probability(engine.prize_pool.slot_of(prize_to_modify))  # 只更新被修改奖品的概率
+            if not engine.save_game_state():
+                return "存档已被另一个进程修改，已重新加载，本次修改未保存。"
         return f"奖品 {new_name} 修改成功！"
     return f"未找到编号为 {prize_id} 的奖品。"
 
-# 查看奖池函数
-def view_prizes():
-    if not prize_pool:
-        return "奖池中没有奖品。"
-
-    prize_info = []
-    for prize in prize_pool:
-        probability = prize['probability']
-        prize_info.append(
-            f"编号: {prize['id']} - {prize['name']} - 价值: {prize['total_value']} RMB, 概率: {probability:.2%}, "
-            f"剩余碎片: {prize['remaining_fragments']} / {prize['total_fragments']}"
-        )
 
-    # 返回文本形式的奖池信息
-    return "\n".join(prize_info)
+# 按需加载 matplotlib，只有显示图表时才需要
+def load_pyplot():
+    import matplotlib.pyplot as plt
+    return plt
+
+
+# 查找支持中文的字体（结果缓存）；找不到时返回 None，使用 matplotlib 默认字体
+@functools.lru_cache(maxsize=None)
+def get_chinese_font():
+    from matplotlib import font_manager as fm
+    for font_path in CJK_FONT_PATHS:
+        if os.path.exists(font_path):
+            return fm.FontProperties(fname=font_path)
+    for family in CJK_FONT_FAMILIES:
+        try:
+            font_path = fm.findfont(fm.FontProperties(family=family), fallback_to_default=False)
+        except ValueError:
+            continue
+        return fm.FontProperties(fname=font_path)
+    print("未找到支持中文的字体，图表中的中文可能无法正常显示。")
+    return None
+
+
+# 测量导入本模块的耗时（新进程中测量，取中位数），并检查是否加载了 matplotlib
+def measure_startup_time(runs=5):
+    import subprocess
+    code = ("import time; start = time.perf_counter(); import your_lottery_system; "
+            "elapsed = (time.perf_counter() - start) * 1000; import sys, json; "
+            "print(json.dumps({'ms': elapsed, 'matplotlib': 'matplotlib' in sys.modules, "
+            "'numpy': 'numpy' in sys.modules}))")
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', code], cwd=module_dir, capture_output=True,
+                                text=True, check=True).stdout
+        samples.append(json.loads(output))
+    times = sorted(sample['ms'] for sample in samples)
+    median = times[len(times) // 2]
+    matplotlib_loaded = any(sample['matplotlib'] for sample in samples)
+    return {
+        'median_ms': median,
+        'budget_ms': STARTUP_BUDGET_MS,
+        'matplotlib_loaded': matplotlib_loaded,
+        'numpy_loaded': any(sample['numpy'] for sample in samples),
+        'within_budget': median <= STARTUP_BUDGET_MS and not matplotlib_loaded,
+    }
 
-# 设置支持中文的字体路径
-font_path = '/System/Library/Fonts/PingFang.ttc'
-prop = fm.FontProperties(fname=font_path)
 
-# 显示奖品概率的图形化展示
+# 是否有图形界面（Linux 上没有 DISPLAY / WAYLAND_DISPLAY 时视为无界面，例如服务器或 SSH 会话）
+def has_display():
+    if sys.platform.startswith('linux'):
+        return bool(os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+    return True
+
+
+# 概率分布图的数据：概率最高的前 top_k 个奖品（从高到低），其余合并为一项"其他（N 个奖品）"
+def chart_series(names, probabilities, top_k=CHART_TOP_K):
+    top = heapq.nlargest(top_k, range(len(names)), key=probabilities.__getitem__)
+    labels = [names[index] for index in top]
+    values = [probabilities[index] for index in top]
+    rest = len(names) - len(top)
+    if rest > 0:
+        labels.append(f"其他（{rest} 个奖品）")
+        values.append(max(0, sum(probabilities) - sum(values)))
+    return labels, values
+
+
+# 图片缓存的键：奖品名称、概率向量和绘图选项的哈希，这些都没变时重新打开直接使用已生成的图片
+def chart_cache_key(names, probabilities, top_k, log_scale, file_format):
+    digest = hashlib.sha256()
+    digest.update(array.array('d', probabilities).tobytes())
+    digest.update("\0".join(names).encode('utf-8'))
+    digest.update(f"{top_k}|{log_scale}|{file_format}".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+# 用非交互的方式绘图并写入文件（PNG 或 SVG，由扩展名决定），不经过 pyplot，不需要图形界面
+def render_probability_chart(labels, values, path, log_scale=False):
+    from matplotlib.figure import Figure
+    from matplotlib.ticker import FuncFormatter
+    prop = get_chinese_font()
+
+    # 图的高度随条数增加，条数由 top_k 限制
+    figure = Figure(figsize=(8, max(3, 0.3 * len(labels) + 1.5)))
+    axes = figure.add_subplot()
+    positions = range(len(labels))
+    axes.barh(positions, values, color='skyblue')
+    axes.set_yticks(positions)
+    axes.set_yticklabels(labels, fontproperties=prop, fontsize=8)
+    axes.invert_yaxis()  # 概率最高的在最上面
+
+    axes.set_title('奖品中奖概率分布', fontsize=14, fontproperties=prop)
+    axes.set_ylabel('奖品名称', fontsize=10, fontproperties=prop)
+    axes.set_xlabel('中奖概率（对数刻度）' if log_scale else '中奖概率', fontsize=12, fontproperties=prop)
+    if log_scale:
+        positive = [value for value in values if value > 0]
+        axes.set_xscale('log')
+        if positive:
+            axes.set_xlim(left=min(positive) / 2)
+    axes.xaxis.set_major_formatter(FuncFormatter(lambda x, _: f'{x:.2%}'))
+
+    figure.tight_layout()
+    file_format = os.path.splitext(path)[1].lstrip('.').lower()
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    figure.savefig(temp_path, format=file_format)
+    os.replace(temp_path, path)
+
+
+# 只保留最近使用的 keep 张缓存图片
+def prune_chart_cache(directory, keep=CHART_CACHE_FILES):
+    paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.startswith('probability-')]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[keep:]:
+        os.remove(path)
+
+
+# 显示奖品概率的图形化展示：只画概率最高的前若干个奖品（其余合并为"其他"），可选对数刻度
+# 图片写入缓存目录；有图形界面时可以在窗口中显示，没有时只打印图片路径
 def show_probability_chart():
-    # 提取奖品名称和概率
-    prize_names = [prize['name'] for prize in prize_pool]
-    probabilities = [prize['probability'] for prize in prize_pool]
-
-    # 设置图形大小
-    plt.figure(figsize=(8, 6))
-
-    # 绘制柱状图
-    plt.barh(prize_names, probabilities, color='skyblue')
-
-    # 设置标题和轴标签
-    plt.title('奖品中奖概率分布', fontsize=14, fontproperties=prop)
-    plt.ylabel('奖品名称', fontsize=6, fontproperties=prop)
-    plt.xlabel('中奖概率', fontsize=12, fontproperties=prop)
-
-    # 设置 y 轴标签（奖品名称）的字体
-    plt.yticks(range(len(prize_names)), prize_names, fontproperties=prop)
-
-    # 显示百分比格式
-    plt.gca().xaxis.set_major_formatter(plt.FuncFormatter(lambda x, _: f'{x:.2%}'))
-
-    # 显示图形
-    plt.tight_layout()
-    plt.show()
-
-
-# 查看抽奖历史
-def view_draw_history():
-    if not draw_history:
-        return "没有抽奖历史。"
-    return "\n".join(
-        [f"{entry['date']} - {entry['result']}: {entry.get('prize', '无')} - {entry.get('consolation_reward', '')}" for
-         entry in draw_history])
-
-
-# 查看已抽取奖品的总价值
-def view_won_prize_total():
-    return f"已抽取奖品总价值: {total_won_value} RMB"
-
-
-# 查看用户拥有的碎片
-def view_fragments():
-    fragment_info = [
-        f"{prize['name']} - 已拥有 {prize['total_fragments'] - prize['remaining_fragments']} / {prize['total_fragments']} 碎片"
-        for prize in prize_pool if prize['remaining_fragments'] < prize['total_fragments']]
-    return "\n".join(fragment_info) if fragment_info else "您没有任何碎片。"
-
-
-# 查看安慰奖
-def view_consolation_rewards():
-    return "\n".join([f"{idx + 1}. {reward}" for idx, reward in
-                      enumerate(consolation_rewards)]) if consolation_rewards else "当前没有设定任何安慰奖。"
+    if not engine.prize_pool:
+        return
+    default_output = '1' if has_display() else '2'
+    output = input(f"输出方式：1. 窗口显示  2. 保存为 PNG  3. 保存为 SVG（直接回车为 {default_output}）: ").strip()
+    output = output or default_output
+    top_text = input(f"单独显示概率最高的前几个奖品（直接回车为 {CHART_TOP_K}）: ").strip()
+    log_scale = input("使用对数刻度？(y/n，直接回车为 n): ").strip().lower() == 'y'
+    try:
+        top_k = int(top_text) if top_text else CHART_TOP_K
+        if top_k <= 0:
+            raise ValueError
+    except ValueError:
+        print(f"输入有误，显示前 {CHART_TOP_K} 个奖品。")
+        top_k = CHART_TOP_K
+
+    path, cached = engine.probability_chart(top_k, log_scale, 'svg' if output == '3' else 'png')
+    print(f"概率分布图{'（概率没有变化，使用缓存）' if cached else ''}: {path}")
+    if output == '1':
+        if not has_display():
+            print("没有图形界面，无法在窗口中显示，请直接打开图片文件。")
+            return
+        plt = load_pyplot()
+        image = plt.imread(path)
+        plt.figure(figsize=(image.shape[1] / 100, image.shape[0] / 100))
+        plt.imshow(image)
+        plt.axis('off')
+        plt.tight_layout()
+        plt.show()
+
+
+# 单条抽奖历史的文本形式
+def format_history_entry(entry):
+    return f"{entry['date']} - {entry['result']}: {entry.get('prize', '无')} - {entry.get('consolation_reward', '')}"
+
+
+# 分页浏览抽奖历史
+def browse_draw_history():
+    page_number = 0
+    while True:
+        print(engine.view_draw_history(page_number))
+        if engine.draw_history.total_count() <= HISTORY_PAGE_SIZE:
+            break
+        choice = input("输入 n 查看更早的记录，p 查看更新的记录，其他键返回: ").strip().lower()
+        if choice == 'n' and page_number + 1 < engine.draw_history.page_count():
+            page_number += 1
+        elif choice == 'p' and page_number > 0:
+            page_number -= 1
+        elif choice not in ['n', 'p']:
+            break
 
 
 # 添加安慰奖
@@ -393,46 +2940,51 @@ def add_consolation_rewards():
         if reward_input.lower() == 'done':
             break
 
-        if reward_input in consolation_rewards:
+        if reward_input in engine.consolation_rewards:
             print(f"安慰奖 '{reward_input}' 已经存在，请输入其他内容。")
         else:
-            consolation_rewards.append(reward_input)
+            with engine.mutex:
+                engine.consolation_rewards.append(reward_input)
             print(f"安慰奖 '{reward_input}' 已添加。")
 
     print("安慰奖设置完毕。")
-    save_game_state()  # 保存状态
+    engine.save_game_state()  # 保存状态
+
 
 # 修改安慰奖
 def modify_consolation_reward():
     # 先查看当前的安慰奖列表
-    print(view_consolation_rewards())
-    if not consolation_rewards:
+    print(engine.view_consolation_rewards())
+    if not engine.consolation_rewards:
         return "没有安慰奖可修改。"
 
     try:
         # 让用户选择要修改的安慰奖编号
         choice = int(input("请输入要修改的安慰奖编号: ")) - 1
-        if 0 <= choice < len(consolation_rewards):
+        if 0 <= choice < len(engine.consolation_rewards):
             # 输入新的安慰奖内容
-            new_reward = input(f"请输入新的安慰奖内容 (当前: {consolation_rewards[choice]}): ")
-            consolation_rewards[choice] = new_reward  # 修改安慰奖
-            save_game_state()  # 保存游戏状态
+            new_reward = input(f"请输入新的安慰奖内容 (当前: {engine.consolation_rewards[choice]}): ")
+            with engine.mutex:
+                engine.consolation_rewards[choice] = new_reward  # 修改安慰奖
+            engine.save_game_state()  # 保存游戏状态
             return f"安慰奖已更新为 '{new_reward}'。"
         else:
             return "无效的编号，请输入有效的安慰奖编号。"
     except ValueError:
         return "输入有误，请输入数字。"
 
+
 # 删除安慰奖
 def remove_consolation_reward():
-    print(view_consolation_rewards())
-    if not consolation_rewards:
+    print(engine.view_consolation_rewards())
+    if not engine.consolation_rewards:
         return "没有安慰奖可删除。"
     try:
         choice = int(input("请输入要删除的安慰奖编号: ")) - 1
-        if 0 <= choice < len(consolation_rewards):
-            removed_reward = consolation_rewards.pop(choice)
-            save_game_state()
+        if 0 <= choice < len(engine.consolation_rewards):
+            with engine.mutex:
+                removed_reward = engine.consolation_rewards.pop(choice)
+            engine.save_game_state()
             return f"安慰奖 '{removed_reward}' 已被删除。"
         else:
             return "无效的编号，请输入有效的安慰奖编号。"
@@ -448,15 +3000,17 @@ def prize_management_menu():
         print("2. 修改奖品")
         print("3. 删除奖品")
         print("4. 查看当前奖池及概率分布图")
-        print("5. 返回主菜单")
-        choice = input("请输入选择 (1-5): ")
+        print("5. 从文件导入奖品 (CSV / JSONL)")
+        print("6. 导出奖池 (CSV / JSONL)")
+        print("7. 返回主菜单")
+        choice = input("请输入选择 (1-7): ")
 
         if choice == "1":
-            print(view_prizes())
+            print(engine.view_prizes())
             add_prizes_interactive()
 
         elif choice == "2":
-            print(view_prizes())
+            print(engine.view_prizes())
             prize_id = input("请输入要修改的奖品编号（输入 'q' 或 'exit' 退出修改操作）: ").strip()
             if prize_id.lower() in ['q', 'exit']:
                 print("已退出修改操作。")
@@ -464,56 +3018,82 @@ def prize_management_menu():
                 print(modify_prize(prize_id))
 
         elif choice == "3":
-            print(view_prizes())
+            print(engine.view_prizes())
             print(remove_prizes())
 
         elif choice == "4":
             print("\n当前奖池信息：")
-            print(view_prizes())  # 先打印奖池的文本信息
+            print(engine.view_prizes())  # 先打印奖池的文本信息
             show_probability_chart()  # 再显示概率图表
         elif choice == "5":
+            path = input("输入文件路径（.csv 或 .jsonl，列为 名称,价值,数量）: ").strip()
+            print(engine.import_prizes(path))
+        elif choice == "6":
+            path = input("输入导出文件路径（.csv 或 .jsonl）: ").strip()
+            print(engine.export_prizes(path))
+        elif choice == "7":
             break
         else:
             print("无效选择，请重新输入。")
 
 
+# 收到 SIGTERM 时按 Ctrl+C 处理，保证退出前写完后台保存
+def handle_termination(signum, frame):
+    raise KeyboardInterrupt
+
+
 # 主菜单
 def main_menu():
-    global total_pool_value
-    load_game_state()
-    while True:
-        print("\n===================== 抽奖系统 =====================")
-        print(f"当前总奖池价值: {total_pool_value} RMB")
-        print(f"已抽取奖品总价值: {total_won_value} RMB")
-        print(f"平均每天抽奖次数: {draws_per_day}")
-        print("--------------------------------------------------")
-        print("奖池中的奖品（编号: 名称 - 剩余碎片/总碎片）：")
-        for prize in prize_pool:
-            print(f"- {prize['id']}: {prize['name']} - {prize['remaining_fragments']}/{prize['total_fragments']} 碎片")
-        print("\n===================== 操作选项 =====================")
-        print("1. 奖品管理")
-        print("2. 安慰奖管理")
-        print("3. 查看数据")
-        print("4. 抽奖")
-        print("5. 系统设置")
-        print("6. 退出")
-        choice = input("请输入选择 (1-6): ")
-        if choice == "1":
-            prize_management_menu()
-        elif choice == "2":
-            consolation_reward_management_menu()
-        elif choice == "3":
-            view_data_menu()
-        elif choice == "4":
-            print(player_draw())
-        elif choice == "5":
-            system_settings_menu()  # 修复调用系统设置
-        elif choice == "6":
-            print("退出程序，保存状态。")
-            save_game_state()
-            break
-        else:
-            print("无效选择，请重新输入。")
+    engine.load_game_state()
+    signal.signal(signal.SIGTERM, handle_termination)
+    try:
+        while True:
+            engine.sync_with_disk()  # 另一个终端修改过存档时先重新加载
+            print("\n===================== 抽奖系统 =====================")
+            print(f"当前总奖池价值: {engine.total_pool_value} RMB")
+            print(f"已抽取奖品总价值: {engine.total_won_value} RMB")
+            print(f"平均每天抽奖次数: {engine.draws_per_day}")
+            print("--------------------------------------------------")
+            print("奖池中的奖品（编号: 名称 - 剩余碎片/总碎片）：")
+            for prize in engine.prize_pool:
+                print(f"- {prize['id']}: {prize['name']} - {prize['remaining_fragments']}/{prize['total_fragments']} 碎片")
+            print("\n===================== 操作选项 =====================")
+            print("1. 奖品管理")
+            print("2. 安慰奖管理")
+            print("3. 查看数据")
+            print("4. 抽奖")
+            print("5. 批量抽奖")
+            print("6. 系统设置")
+            print("7. 退出")
+            choice = input("请输入选择 (1-7): ")
+            if choice == "1":
+                prize_management_menu()
+            elif choice == "2":
+                consolation_reward_management_menu()
+            elif choice == "3":
+                view_data_menu()
+            elif choice == "4":
+                print(engine.player_draw())
+            elif choice == "5":
+                try:
+                    draw_count = int(input("请输入抽奖次数: "))
+                    print(engine.player_draw_batch(draw_count))
+                except ValueError:
+                    print("输入有误，请输入数字。")
+            elif choice == "6":
+                system_settings_menu()  # 修复调用系统设置
+            elif choice == "7":
+                print("退出程序，保存状态。")
+                engine.save_game_state()
+                break
+            else:
+                print("无效选择，请重新输入。")
+    except KeyboardInterrupt:
+        print("\n收到退出信号，保存状态后退出。")
+    finally:
+        error = engine.flush()  # 等后台线程把尚未写入的修改写完
+        if error is not None:
+            print(f"保存失败：{error}")
 
 # 查看数据菜单
 def view_data_menu():
@@ -522,20 +3102,43 @@ def view_data_menu():
         print("1. 查看抽奖历史")
         print("2. 查看已抽取奖品总额")
         print("3. 查看我的碎片")
-        print("4. 返回主菜单")
-        choice = input("请输入选择 (1-4): ")
+        print("4. 查看本周汇总")
+        print("5. 查看本月汇总")
+        print("6. 查看存档锁统计")
+        print("7. 查看运行指标")
+        print("8. 导出抽奖历史 (CSV / JSONL)")
+        print("9. 期望值计算（每月支出、集齐碎片所需次数）")
+        print("10. 返回主菜单")
+        choice = input("请输入选择 (1-10): ")
 
         if choice == "1":
-            print(view_draw_history())  # 调用查看抽奖历史的函数
+            browse_draw_history()  # 分页查看抽奖历史
         elif choice == "2":
-            print(view_won_prize_total())  # 调用查看已抽取奖品总价值的函数
+            print(engine.view_won_prize_total())  # 调用查看已抽取奖品总价值的函数
         elif choice == "3":
-            print(view_fragments())  # 调用查看用户拥有的碎片的函数
+            print(engine.view_fragments())  # 调用查看用户拥有的碎片的函数
         elif choice == "4":
+            print(engine.view_history_summary('week'))
+        elif choice == "5":
+            print(engine.view_history_summary('month'))
+        elif choice == "6":
+            print(engine.view_lock_stats())
+        elif choice == "7":
+            print(engine.view_metrics())
+            path = input(f"导出为 Prometheus 文本文件（输入文件名，直接回车使用 {METRICS_FILE}，输入 n 跳过）: ").strip()
+            if path.lower() != 'n':
+                print(engine.export_metrics(path or None))
+        elif choice == "8":
+            path = input("输入导出文件路径（.csv 或 .jsonl）: ").strip()
+            print(engine.export_history(path))
+        elif choice == "9":
+            print(engine.view_expected_values())
+        elif choice == "10":
             break  # 返回主菜单
         else:
             print("无效选择，请重新输入。")
 
+
 # 安慰奖管理菜单
 def consolation_reward_management_menu():
     while True:
@@ -554,47 +3157,268 @@ def consolation_reward_management_menu():
         elif choice == "3":
             print(remove_consolation_reward())  # 调用删除安慰奖函数
         elif choice == "4":
-            print(view_consolation_rewards())  # 调用查看安慰奖函数
+            print(engine.view_consolation_rewards())  # 调用查看安慰奖函数
         elif choice == "5":
             break  # 返回主菜单
         else:
             print("无效选择，请重新输入。")
 
+
 # 系统设置菜单
 def system_settings_menu():
     while True:
         print("\n==================== 系统设置 ======================")
         print("1. 修改每月奖池总价值(= 每月打算花多少钱给自己各种奖励?)")
         print("2. 修改平均每天抽奖次数")
-        print("3. 返回主菜单")
-        choice = input("请输入选择 (1-3): ")
+        print("3. 切换存储方式 (JSON / SQLite)")
+        print(f"4. {'关闭' if engine.writer is not None else '开启'}后台保存（合并写入，最多延迟 {WRITER_MAX_DELAY} 秒）")
+        print(f"5. 修改抽奖历史保留天数（当前 {engine.history_hot_days} 天，更早的整月历史压缩归档）")
+        print(f"6. {'关闭' if engine.audit_log else '开启'}审计日志（记录每次抽奖，可重放核对）")
+        print("7. 审计抽奖记录（按随机数种子重放并核对）")
+        print(f"8. 按每月奖池校准安慰奖阈值（当前 {engine.consolation_threshold:.4f}）")
+        print("9. 返回主菜单")
+        choice = input("请输入选择 (1-9): ")
 
         if choice == "1":
             try:
                 new_value = int(input("输入新的总奖池价值 (RMB): "))
-                global total_pool_value
-                total_pool_value = new_value
-                update_probabilities()
-                save_game_state()
+                if new_value <= 0:
+                    print("总奖池价值必须大于 0。")
+                    continue
+                if not engine.update_settings(total_pool_value=new_value):
+                    print("存档已被另一个进程修改，已重新加载，本次修改未保存。")
             except ValueError:
                 print("输入有误，请输入数字。")
 
         elif choice == "2":
             try:
                 new_value = int(input("输入新的平均每天抽奖次数: "))
-                global draws_per_day
-                draws_per_day = new_value
-                save_game_state()
+                if new_value <= 0:
+                    print("每天抽奖次数必须大于 0。")
+                    continue
+                if not engine.update_settings(draws_per_day=new_value):  # 期望价值变化，概率随之重新计算
+                    print("存档已被另一个进程修改，已重新加载，本次修改未保存。")
             except ValueError:
                 print("输入有误，请输入数字。")
 
         elif choice == "3":
+            print(f"当前存储方式: {engine.storage_backend}")
+            backend = input("输入新的存储方式 (json / sqlite): ").strip().lower()
+            if backend in ['json', 'sqlite']:
+                print(engine.switch_storage_backend(backend))
+            else:
+                print("无效的存储方式。")
+
+        elif choice == "4":
+            error = engine.set_background_writer(engine.writer is None)
+            if error is not None:
+                print(f"关闭前保存失败：{error}")
+            engine.save_settings()
+            print(f"后台保存已{'开启' if engine.writer is not None else '关闭'}。")
+
+        elif choice == "5":
+            try:
+                new_value = int(input("输入新的保留天数（至少 31 天）: "))
+                if new_value < 31:
+                    print("保留天数至少为 31 天，本周和本月的汇总需要最近的历史。")
+                    continue
+                engine.history_hot_days = new_value
+                engine.save_settings()
+                print(engine.compact_history())
+            except ValueError:
+                print("输入有误，请输入数字。")
+
+        elif choice == "6":
+            engine.set_audit_log(not engine.audit_log)
+            print(f"审计日志已{'开启' if engine.audit_log else '关闭'}。")
+
+        elif choice == "7":
+            report, _ = engine.audit_draws()
+            print(report)
+
+        elif choice == "8":
+            print(engine.calibrate_budget())
+
+        elif choice == "9":
             break
 
         else:
             print("无效选择，请重新输入。")
 
 
-# 程序入口
+# 命令行子命令（供脚本和定时任务使用）：每个命令只加载需要的部分，输出一行 JSON 后退出
+# 不带参数运行时仍然进入交互菜单
+def cli_draw(lottery, args):
+    if not lottery.prize_pool:
+        return {'error': "奖池中没有奖品了。"}
+    today = date.today().strftime("%Y-%m-%d")
+    results = lottery.run_draws(lottery.rng.draw_values(args.n), today)
+    return {
+        'draws': len(results),
+        'results': [dict(record, message=message) for record, message in results],  # 日志记录（op / id / reward / date）和提示
+        'total_won_value': lottery.total_won_value,
+        'prizes_left': len(lottery.prize_pool),
+    }
+
+
+def cli_add(lottery, args):
+    report = lottery.add_prizes([(1, {'name': args.name, 'value': args.value, 'count': args.count})])
+    if not report['saved']:
+        return {'error': "存档已被另一个进程修改，已重新加载，奖品未添加。"}
+    if report['errors']:  # 没有添加任何奖品时带上 error，命令以非零状态退出
+        return {'added': 0, 'error': report['errors'][0][1]}
+    if report['duplicates']:
+        return {'added': 0, 'error': f"奖品名称 '{args.name}' 已经存在"}
+    return {'added': report['added']}
+
+
+def cli_import(lottery, args):
+    if file_format(args.path) is None:
+        return {'error': "只支持导入 .csv 和 .jsonl 文件。"}
+    try:
+        report = lottery.add_prizes(read_prize_file(args.path))
+    except (OSError, UnicodeDecodeError, csv.Error) as error:
+        return {'error': f"无法读取文件 {args.path}：{error}，没有导入任何奖品。"}
+    if not report['saved']:
+        return {'error': "存档已被另一个进程修改，已重新加载，没有导入任何奖品。"}
+    return {
+        'added': report['added'],
+        'duplicates': [{'line': line_number, 'name': prize_name} for line_number, prize_name in report['duplicates']],
+        'errors': [{'line': line_number, 'reason': reason} for line_number, reason in report['errors']],
+    }
+
+
+def cli_history(lottery, args):
+    entries = lottery.draw_history.iter_between(args.since, args.until)
+    if args.limit is not None:
+        entries = collections.deque(entries, maxlen=args.limit)  # 只保留范围内最新的 limit 条
+    entries = list(entries)
+    return {'count': len(entries), 'entries': entries}
+
+
+def cli_stats(lottery, args):
+    today = date.today()
+    week_start = (today - timedelta(days=today.weekday())).strftime("%Y-%m-%d")
+    month_start = today.replace(day=1).strftime("%Y-%m-%d")
+    stats = {
+        'total_pool_value': lottery.total_pool_value,
+        'total_won_value': lottery.total_won_value,
+        'draws_per_day': lottery.draws_per_day,
+        'consolation_threshold': lottery.consolation_threshold,
+        'prizes': len(lottery.prize_pool),
+        'fragments_held': sum(prize['total_fragments'] - prize['remaining_fragments'] for prize in lottery.prize_pool),
+        'history_entries': lottery.draw_history.total_count(),
+        'week': lottery.draw_history.summary(week_start, today.strftime("%Y-%m-%d")),
+        'month': lottery.draw_history.summary(month_start, today.strftime("%Y-%m-%d")),
+        'storage_backend': lottery.storage_backend,
+    }
+    if args.expected:
+        if get_numpy() is None:
+            return {'error': "期望值计算需要 numpy。"}
+        if lottery.prize_pool:
+            analysis = analyze_pool(lottery.prize_pool, lottery.total_pool_value, lottery.draws_per_day,
+                                    lottery.total_won_value, lottery.draw_counter, lottery.consolation_threshold,
+                                    completion=False)
+            stats['expected'] = {key: analysis[key] for key in
+                                 ('draw_value', 'monthly_draws', 'monthly_spend', 'monthly_spend_std')}
+    return stats
+
+
+def cli_export(lottery, args):
+    export = lottery.export_prizes if args.what == 'prizes' else lottery.export_history
+    if file_format(args.path) is None:
+        return {'error': "只支持导出为 .csv 和 .jsonl 文件。"}
+    if args.what == 'prizes':
+        lottery.update_probabilities()  # 只读加载没有计算概率（回放日志和冷却衰减之后存档中的概率已过时），导出前按当前状态计算
+    try:
+        message = export(args.path)
+    except OSError as error:
+        return {'error': f"无法写入文件 {args.path}：{error}"}
+    return {'path': args.path, 'message': message}
+
+
+# 子命令 -> (处理函数, 是否需要计算概率)；只读的命令不计算概率，也不归档历史
+CLI_COMMANDS = {
+    'draw': (cli_draw, True),
+    'add': (cli_add, True),
+    'import': (cli_import, True),
+    'history': (cli_history, False),
+    'stats': (cli_stats, False),
+    'export': (cli_export, False),
+}
+
+
+def parse_cli_date(text):
+    try:
+        return datetime.strptime(text, "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"日期格式应为 YYYY-MM-DD: {text}")
+
+
+def parse_positive_int(text):
+    value = int(text)
+    if value <= 0:
+        raise argparse.ArgumentTypeError(f"必须是正整数: {text}")
+    return value
+
+
+def build_cli_parser():
+    parser = argparse.ArgumentParser(description="抽奖系统（不带参数运行时进入交互菜单）")
+    parser.add_argument('--data-dir', default='.', help="存档所在目录（默认当前目录）")
+    parser.add_argument('--timing', action='store_true',
+                        help="在输出中附上耗时（从导入本模块开始）和该命令的耗时目标")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    draw = subparsers.add_parser('draw', help="抽奖")
+    draw.add_argument('-n', type=parse_positive_int, default=1, help="抽奖次数（默认 1）")
+
+    add = subparsers.add_parser('add', help="添加一个奖品")
+    add.add_argument('name', help="奖品名称")
+    add.add_argument('value', help="奖品价值（RMB）")
+    add.add_argument('count', nargs='?', default='1', help="数量（默认 1）")
+
+    import_parser = subparsers.add_parser('import', help="从 CSV / JSONL 文件导入奖品")
+    import_parser.add_argument('path')
+
+    history = subparsers.add_parser('history', help="查询抽奖历史")
+    history.add_argument('--since', type=parse_cli_date, help="开始日期（含），YYYY-MM-DD")
+    history.add_argument('--until', type=parse_cli_date, help="结束日期（含），YYYY-MM-DD")
+    history.add_argument('--limit', type=parse_positive_int, help="只输出范围内最新的若干条")
+
+    stats = subparsers.add_parser('stats', help="奖池和抽奖统计")
+    stats.add_argument('--expected', action='store_true', help="附上按当前概率计算的期望值（需要 numpy）")
+
+    export = subparsers.add_parser('export', help="导出奖池或抽奖历史")
+    export.add_argument('what', choices=['prizes', 'history'])
+    export.add_argument('path', help="导出文件路径（.csv 或 .jsonl）")
+    return parser
+
+
+# 执行一个子命令，输出 JSON；命令失败时输出 {"error": ...} 并以状态码 1 退出
+def run_cli(argv):
+    args = build_cli_parser().parse_args(argv)
+    handler, prepare_draws = CLI_COMMANDS[args.command]
+    try:
+        os.makedirs(args.data_dir, exist_ok=True)  # 目录不存在时先创建，新存档在该目录初始化
+    except OSError as error:
+        result = {'error': f"无法创建数据目录 {args.data_dir}：{error}"}
+    else:
+        lottery = LotteryEngine(args.data_dir, verbose=False)
+        try:
+            lottery.load_game_state(prepare_draws)
+            result = handler(lottery, args)
+        finally:
+            lottery.close()  # 开启后台保存时等它写完
+    if args.timing:
+        elapsed_ms = (time.perf_counter() - STARTED_AT) * 1000
+        result['timing'] = {'ms': elapsed_ms, 'budget_ms': CLI_BUDGET_MS[args.command],
+                            'within_budget': elapsed_ms <= CLI_BUDGET_MS[args.command]}
+    print(json.dumps(result, ensure_ascii=False))
+    return 1 if 'error' in result else 0
+
+
+# 程序入口：带参数时执行命令行子命令，否则进入交互菜单
 if __name__ == "__main__":
-    main_menu()
\ No newline at end of file
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
+    main_menu()